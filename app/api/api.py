@@ -1,9 +1,11 @@
 from fastapi import APIRouter
-from app.api.endpoints import website, preview, deploy, templates
+from app.api.endpoints import website, preview, deploy, templates, metrics, assets
 
 api_router = APIRouter()
 
 api_router.include_router(website.router, prefix="/website", tags=["website"])
 api_router.include_router(preview.router, prefix="/preview", tags=["preview"])
 api_router.include_router(deploy.router, prefix="/deploy", tags=["deploy"])
-api_router.include_router(templates.router, prefix="/templates", tags=["templates"])
\ No newline at end of file
+api_router.include_router(templates.router, prefix="/templates", tags=["templates"])
+api_router.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
+api_router.include_router(assets.router, prefix="/assets", tags=["assets"])
\ No newline at end of file
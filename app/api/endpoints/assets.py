@@ -0,0 +1,19 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from app.services.asset_store import asset_store
+
+router = APIRouter()
+
+@router.get("/{asset_id}")
+async def get_asset(asset_id: str):
+    """Serve a stored asset. Assets are content-addressed, so they can be cached forever."""
+    path = asset_store.path(asset_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    
+    return FileResponse(
+        path,
+        media_type=asset_store.content_type(asset_id),
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
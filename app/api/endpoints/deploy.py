@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form
 from typing import Optional
 import logging
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.services.deployment import deploy_to_vercel
+from app.core.session import get_generated_html
+from app.db.database import get_async_db
+from app.services.deployment import deploy_to_vercel_coalesced
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -10,11 +13,12 @@ logger = logging.getLogger(__name__)
 @router.post("/vercel")
 async def deploy(
     request: Request,
-    vercel_token: str = Form(...)
+    vercel_token: str = Form(...),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deploy the generated website to Vercel."""
     try:
-        html_content = request.session.get("generated_html", "")
+        html_content = await get_generated_html(request, db)
         if not html_content:
             raise HTTPException(
                 status_code=400, 
@@ -22,7 +26,7 @@ async def deploy(
             )
         
         # Deploy to Vercel
-        deployment_url = deploy_to_vercel(html_content, vercel_token)
+        deployment_url = await deploy_to_vercel_coalesced(html_content, vercel_token)
         
         return {
             "success": True,
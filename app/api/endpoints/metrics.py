@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta, timezone
+
+from app.services.generation_cache import generation_cache
+from app.services.job_queue import generation_queue
+from app.services.website_generator import generation_flight, completion_flight
+from app.services.deployment import deployment_flight
+from app.services.llm_client import get_llm_client
+from app.services.model_router import model_router
+from app.services.html_pipeline import html_pipeline
+from app.services.asset_store import asset_store
+from app.services.template_cache import template_cache
+from app.services.audit_sink import audit_sink
+from app.core.config import settings
+from app.core.uploads import upload_stats
+from app.crud import ai_templates
+from app.db.database import get_async_db
+from app.services.spans import latency_percentiles
+from app.db.pool import sync_pool_metrics, async_pool_metrics
+
+router = APIRouter()
+
+@router.get("/cache")
+async def cache_stats() -> Dict[str, Any]:
+    """Get hit/miss counters for the generation cache."""
+    return generation_cache.stats()
+
+@router.get("/queue")
+async def queue_stats() -> Dict[str, Any]:
+    """Get the size and activity of the background generation queue."""
+    return generation_queue.stats()
+
+@router.get("/coalescing")
+async def coalescing_stats() -> Dict[str, Any]:
+    """Get in-flight and coalesced call counts for generations and deployments."""
+    return {
+        flight.name: flight.stats()
+        for flight in (generation_flight, completion_flight, deployment_flight)
+    }
+
+@router.get("/rate-limits")
+async def rate_limit_stats() -> Dict[str, Any]:
+    """Get OpenRouter retry counts and the quota last reported for each token (by hash)."""
+    return get_llm_client().scheduler.stats()
+
+@router.get("/models")
+async def model_stats() -> Dict[str, Any]:
+    """Get per-model latency, hedge and win counts."""
+    return model_router.stats()
+
+@router.get("/pipeline")
+async def pipeline_stats() -> Dict[str, Any]:
+    """Get the time spent in each HTML post-processing stage."""
+    return html_pipeline.stats()
+
+@router.get("/assets")
+async def asset_stats() -> Dict[str, Any]:
+    """Get the number and total size of stored assets."""
+    return asset_store.stats()
+
+@router.get("/uploads")
+async def upload_metrics() -> Dict[str, Any]:
+    """Get received upload counts and the most memory held by a single upload."""
+    return upload_stats.stats()
+
+@router.get("/templates")
+async def template_cache_stats() -> Dict[str, Any]:
+    """Get hit/miss counters and the current version of the template cache."""
+    return template_cache.stats()
+
+@router.get("/db")
+async def db_pool_stats() -> Dict[str, Any]:
+    """Get connection pool usage and checkout wait times of the sync and async engines."""
+    return {
+        metrics.name: metrics.stats()
+        for metrics in (sync_pool_metrics, async_pool_metrics)
+    }
+
+@router.get("/audit")
+async def audit_stats() -> Dict[str, Any]:
+    """Get buffered, written and spilled counts of the user request audit sink."""
+    return audit_sink.stats()
+
+@router.get("/latency")
+async def latency_stats(
+    hours: float = Query(24, gt=0, le=24 * 90, description="Time window, ending now"),
+    template_type: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+) -> Dict[str, Any]:
+    """Get p50/p95/p99 processing time per template type and generation stage for completed requests."""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    rows = await db.run_sync(
+        ai_templates.get_request_timings, since, settings.LATENCY_QUERY_MAX_ROWS, template_type
+    )
+    return {
+        "since": since,
+        "requests": len(rows),
+        "template_types": latency_percentiles(rows)
+    }
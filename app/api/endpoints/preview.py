@@ -1,16 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.session import get_generated_html
+from app.db.database import get_async_db
+from app.services.asset_store import asset_store
 
 router = APIRouter()
 templates = Jinja2Templates(directory=settings.TEMPLATES_DIR)
 
 @router.get("/", response_class=HTMLResponse)
-async def preview(request: Request):
+async def preview(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Display the preview of the generated website."""
-    html_content = request.session.get("generated_html", "")
+    html_content = await get_generated_html(request, db)
     if not html_content:
         return templates.TemplateResponse(
             "index.html", 
@@ -23,9 +27,13 @@ async def preview(request: Request):
     )
 
 @router.get("/download-pdf")
-async def download_pdf(request: Request):
-    """Generate a PDF from the HTML content."""
-    html_content = request.session.get("generated_html", "")
+async def download_pdf(request: Request, inline: bool = False, db: AsyncSession = Depends(get_async_db)):
+    """
+    Generate a PDF from the HTML content.
+    
+    With ``inline`` set, images are embedded as data URIs so the HTML is self-contained.
+    """
+    html_content = await get_generated_html(request, db)
     if not html_content:
         raise HTTPException(
             status_code=400, 
@@ -34,6 +42,9 @@ async def download_pdf(request: Request):
     
     # We'll use the html2pdf.js library on the client side for PDF generation
     # This route is just a placeholder for future server-side PDF generation if needed
+    if inline:
+        html_content = asset_store.inline(html_content)
+    
     return {
         "success": True,
         "html": html_content
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import hashlib
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 
+from app.core.config import settings
 from app.db.database import get_db
 from app.crud import ai_templates
 from app.schemas.ai_templates import (
@@ -16,43 +19,96 @@ from app.schemas.ai_templates import (
     PromptResponse
 )
 from app.services.prompt_service import PromptService
+from app.services.template_cache import template_cache
 
 router = APIRouter()
 
+_template_list = TypeAdapter(List[Template])
+
+def _etag(key: str, version: int) -> str:
+    """
+    Strong ETag for the response at ``key``.
+
+    Every template, prompt config and placeholder change bumps the template
+    version, so the version identifies the body and the tag can be compared
+    before anything is loaded.
+    """
+    return f'"t{version}-{hashlib.sha1(key.encode()).hexdigest()[:12]}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def _cached_response(
+    request: Request,
+    db: Session,
+    render: Callable[[], bytes]
+) -> Response:
+    """
+    Serve a template read from the serialized bodies cached per template version.
+
+    A matching If-None-Match gets a 304 once the version is known, without
+    loading anything; otherwise the body is rendered once per version and sent
+    as is. ``render`` raises HTTPException when there is nothing to serve.
+    """
+    key = request.url.path + ("?" + request.url.query if request.url.query else "")
+    version = template_cache.version(db)
+    headers = {
+        "ETag": _etag(key, version),
+        "Cache-Control": f"public, max-age={settings.TEMPLATE_HTTP_MAX_AGE}, must-revalidate"
+    }
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    body = template_cache.get_response(key, version, render)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.get("/", response_model=List[Template])
 def get_templates(
+    request: Request,
     skip: int = 0, 
     limit: int = 100, 
     db: Session = Depends(get_db)
 ):
     """Get all templates."""
-    templates = ai_templates.get_templates(db, skip=skip, limit=limit)
-    return templates
+    def render() -> bytes:
+        templates = ai_templates.get_templates(db, skip=skip, limit=limit)
+        return _template_list.dump_json(_template_list.validate_python(templates, from_attributes=True))
+
+    return _cached_response(request, db, render)
 
 @router.get("/{template_id}", response_model=Template)
 def get_template(
+    request: Request,
     template_id: int, 
     db: Session = Depends(get_db)
 ):
     """Get a specific template by ID."""
-    db_template = ai_templates.get_template(db, template_id=template_id)
-    if db_template is None:
-        raise HTTPException(status_code=404, detail="Template not found")
-    return db_template
+    def render() -> bytes:
+        db_template = ai_templates.get_template(db, template_id=template_id)
+        if db_template is None:
+            raise HTTPException(status_code=404, detail="Template not found")
+        return Template.model_validate(db_template).model_dump_json().encode()
+
+    return _cached_response(request, db, render)
 
 @router.get("/type/{template_type}", response_model=PromptResponse)
 def get_template_by_type(
+    request: Request,
     template_type: str, 
     db: Session = Depends(get_db)
 ):
     """Get a template by type with its prompts and placeholders."""
-    prompt_service = PromptService(db)
-    result = prompt_service.get_template_prompts(template_type)
-    
-    if not result["success"]:
-        raise HTTPException(status_code=404, detail=result["message"])
-    
-    return result
+    def render() -> bytes:
+        result = PromptService(db).get_template_prompts(template_type)
+        if not result["success"]:
+            raise HTTPException(status_code=404, detail=result["message"])
+        return PromptResponse.model_validate(result).model_dump_json().encode()
+
+    return _cached_response(request, db, render)
 
 @router.post("/", response_model=Template)
 def create_template(
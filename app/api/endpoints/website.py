@@ -1,21 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form, File, UploadFile
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from typing import Optional
-import base64
+from typing import Optional, Dict, Any
+import asyncio
+import csv
+import json
+import math
 import os
+import re
+import uuid
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.schemas.website import WebsiteRequest, WebsiteResponse
-from app.services.website_generator import generate_website
+from app.core.uploads import HashedUploadFile, UploadRoute
+from app.schemas.website import WebsiteRequest, WebsiteResponse, GenerationJobStatus
+from app.schemas.ai_templates import UserRequestCreate
+from app.models.ai_templates import RequestStatus
+from app.services.website_generator import generate_website, stream_website, PromptTooLargeError
+from app.services.job_queue import generation_queue, GenerationJob, QueueFullError
+from app.services.retry_scheduler import RateLimitError
+from app.services.photo_processing import ProcessedPhoto, PhotoProcessingError, PhotoTooLargeError, process_photo
+from app.services.generation_context import GenerationContext
+from app.services.audit_sink import audit_sink
+from app.services.batch_generator import BatchInputError, BatchJournal, batch_format, parse_batch, run_batch
 from app.utils.language_detector import detect_language
-from app.db.database import get_db
-from app.services.prompt_service import PromptService
+from app.db.database import get_async_db
 from app.crud import ai_templates
 
-router = APIRouter()
+router = APIRouter(route_class=UploadRoute)
 templates = Jinja2Templates(directory=settings.TEMPLATES_DIR)
 
 @router.get("/", response_class=HTMLResponse)
@@ -24,9 +37,9 @@ async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @router.get("/templates", response_class=HTMLResponse)
-async def get_templates(request: Request, db: Session = Depends(get_db)):
+async def get_templates(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Get available website templates."""
-    templates_list = ai_templates.get_templates(db)
+    templates_list = await db.run_sync(ai_templates.get_templates)
     return templates.TemplateResponse(
         "index.html", 
         {"request": request, "templates": templates_list}
@@ -39,51 +52,302 @@ async def generate(
     style: str = Form(...),
     api_token: str = Form(...),
     color_palette: Optional[str] = Form(None),
+    fresh: bool = Form(False),
+    background: bool = Form(False),
     photo: Optional[UploadFile] = File(None),
     request: Request = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Generate a website based on user input using OpenRouter API."""
+    """
+    Generate a website based on user input using OpenRouter API.
+
+    With ``background`` set, the generation is queued and the response only carries
+    the ``request_id`` to poll at ``/jobs/{request_id}``. Jobs are tracked by their
+    user request, and only template requests are recorded, so a background
+    generation needs a template for ``website_type``: without one the response is
+    a 404 rather than the fallback prompt the synchronous path uses.
+    """
     try:
         # Process photo if provided
-        photo_data = None
-        if photo:
-            contents = await photo.read()
-            photo_data = base64.b64encode(contents).decode("utf-8")
+        processed_photo = await _process_photo_upload(photo)
         
         # Detect language
         language = detect_language(content)
         
-        # Get template from database
-        prompt_service = PromptService(db)
-        template_data = prompt_service.get_template_prompts(website_type)
+        # Resolve the template once; the generation below reuses it and this session
+        context = GenerationContext(db, website_type)
+        template_data = await context.run_sync(context.resolve_template)
+        
+        if background:
+            if not template_data["success"]:
+                raise HTTPException(status_code=404, detail=template_data["message"])
+            
+            # Record the request so its ID can be returned right away
+            request_result = await context.run_sync(context.prompt_service.process_user_request, UserRequestCreate(
+                template_id=template_data["template"].id,
+                user_input=content
+            ), template_data)
+            request_id = request_result["request_id"]
+            
+            try:
+                generation_queue.submit(GenerationJob(
+                    request_id=request_id,
+                    website_type=website_type,
+                    content=content,
+                    style=style,
+                    language=language,
+                    api_token=api_token,
+                    color_palette=color_palette,
+                    photo=processed_photo,
+                    bypass_cache=fresh
+                ))
+            except QueueFullError as e:
+                await db.run_sync(
+                    audit_sink.record_status, request_id, RequestStatus.FAILED, error_message=str(e)
+                )
+                raise HTTPException(status_code=503, detail=str(e))
+            
+            return {
+                "success": True,
+                "message": "Website generation queued",
+                "request_id": request_id
+            }
         
         # Generate website HTML using AI
-        html_content = generate_website(
+        html_content = await generate_website(
             website_type=website_type,
             content=content,
             style=style,
             language=language,
             api_token=api_token,
             color_palette=color_palette,
-            photo_data=photo_data
+            photo=processed_photo,
+            bypass_cache=fresh,
+            context=context
         )
         
         # Log the final HTML
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        final_html_path = f"logs/html_dumps/final_html_{timestamp}.html"
-        os.makedirs(os.path.dirname(final_html_path), exist_ok=True)
-        with open(final_html_path, 'w') as f:
-            f.write(html_content)
+        _log_final_html(html_content)
         
         # Store the generated HTML in the session
         if request and hasattr(request, "session"):
             request.session["generated_html"] = html_content
+            request.session.pop("generated_request_id", None)
         
         return {
             "success": True,
             "message": "Website generated successfully!",
             "html": html_content
         }
+    except HTTPException:
+        raise
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except RateLimitError as e:
+        headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after is not None else None
+        raise HTTPException(status_code=429, detail=str(e), headers=headers)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{request_id}", response_model=GenerationJobStatus)
+async def get_job(
+    request_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the status of a queued generation, including the HTML once it is completed.
+
+    Changes the audit sink of another process has not written yet are not
+    visible, so with several app processes a new job can read as not found, or
+    a finished one as processing, for up to AUDIT_FLUSH_INTERVAL_SECONDS.
+    """
+    db_request = await db.run_sync(ai_templates.get_user_request, request_id)
+    # Include changes the audit sink of this process has not written yet
+    db_request = audit_sink.view(request_id, db_request)
+    if db_request is None:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    
+    html_content = None
+    if db_request.status == RequestStatus.COMPLETED:
+        html_content = db_request.ai_response
+        
+        # Make the finished website available to preview and deploy
+        if html_content and hasattr(request, "session"):
+            request.session["generated_html"] = html_content
+            request.session.pop("generated_request_id", None)
+    
+    return {
+        "request_id": db_request.id,
+        "status": db_request.status.value if db_request.status else RequestStatus.PENDING.value,
+        "html": html_content,
+        "error_message": db_request.error_message,
+        "processing_time_ms": db_request.processing_time_ms,
+        "stage_timings": db_request.stage_timings,
+        "prompt_tokens_original": db_request.prompt_tokens_original,
+        "prompt_tokens": db_request.prompt_tokens,
+        "prompt_compaction": db_request.prompt_compaction,
+        "created_at": db_request.created_at,
+        "completed_at": db_request.completed_at
+    }
+
+@router.post("/generate/stream")
+async def generate_stream(
+    website_type: str = Form(...),
+    content: str = Form(...),
+    style: str = Form(...),
+    api_token: str = Form(...),
+    color_palette: Optional[str] = Form(None),
+    fresh: bool = Form(False),
+    photo: Optional[UploadFile] = File(None),
+    request: Request = None
+):
+    """
+    Generate a website and stream the HTML back as server-sent events.
+
+    Emits ``delta`` events with HTML chunks as the model produces them, then a single
+    ``done`` event with the final post-processed HTML, or an ``error`` event. The
+    error event of a rate-limited generation has ``rate_limited`` set and carries
+    ``retry_after`` in seconds if known.
+
+    Unlike ``/generate``, there is no fallback prompt: without a template for
+    ``website_type`` the response is a 404. Preview and deploy read a streamed
+    website from its user request, and only template requests are recorded.
+    """
+    # Process photo if provided
+    processed_photo = await _process_photo_upload(photo)
+    
+    # Detect language
+    language = detect_language(content)
+    
+    # The stream outlives this request's dependencies, so it gets its own context.
+    # The session cookie is sent with the response headers, before the HTML exists,
+    # so the request is recorded now and the session refers to its row.
+    context = GenerationContext.open(website_type)
+    try:
+        template_data = await context.run_sync(context.resolve_template)
+        if not template_data["success"]:
+            raise HTTPException(status_code=404, detail=template_data["message"])
+        
+        request_result = await context.run_sync(context.prompt_service.process_user_request, UserRequestCreate(
+            template_id=template_data["template"].id,
+            user_input=content
+        ), template_data)
+        request_id = request_result["request_id"]
+    except HTTPException:
+        await context.close()
+        raise
+    except Exception as e:
+        await context.close()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if request and hasattr(request, "session"):
+        request.session.pop("generated_html", None)
+        request.session["generated_request_id"] = request_id
+    
+    async def event_stream():
+        try:
+            async for event in stream_website(
+                website_type=website_type,
+                content=content,
+                style=style,
+                language=language,
+                api_token=api_token,
+                color_palette=color_palette,
+                photo=processed_photo,
+                bypass_cache=fresh,
+                user_request_id=request_id,
+                context=context
+            ):
+                if event["event"] == "done":
+                    _log_final_html(event["html"])
+                    yield _sse("done", {"success": True, "message": "Website generated successfully!", "html": event["html"]})
+                else:
+                    yield _sse("delta", {"content": event["content"]})
+        except RateLimitError as e:
+            yield _sse("error", {"success": False, "message": str(e), "rate_limited": True, "retry_after": e.retry_after})
+        except Exception as e:
+            yield _sse("error", {"success": False, "message": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/generate/batch")
+async def generate_batch(
+    file: UploadFile = File(...),
+    api_token: str = Form(...),
+    website_type: Optional[str] = Form(None),
+    style: Optional[str] = Form(None),
+    concurrency: int = Form(settings.BATCH_CONCURRENCY),
+    fresh: bool = Form(False),
+    batch_id: Optional[str] = Form(None)
+):
+    """
+    Generate websites for every item of a JSONL or CSV file, streaming results as NDJSON.
+
+    Each line of the response is the result of one item, in completion order. The
+    ``X-Batch-ID`` response header identifies the batch; posting the same file again
+    with that ``batch_id`` resumes it, replaying completed items instead of regenerating them.
+    ``website_type`` and ``style`` are used for items that do not set their own.
+    """
+    if batch_id is None:
+        batch_id = uuid.uuid4().hex
+    elif not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", batch_id):
+        raise HTTPException(status_code=400, detail="Invalid batch_id")
+    
+    try:
+        items = parse_batch((await file.read()).decode("utf-8-sig"), batch_format(file.filename))
+    except (BatchInputError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch file: {str(e)}")
+    
+    journal = BatchJournal(os.path.join(settings.BATCH_JOURNAL_DIR, f"{batch_id}.ndjson"))
+    concurrency = max(1, min(concurrency, settings.BATCH_MAX_CONCURRENCY))
+    
+    async def result_stream():
+        try:
+            async for result in run_batch(
+                items,
+                api_token=api_token,
+                website_type=website_type,
+                style=style,
+                concurrency=concurrency,
+                bypass_cache=fresh,
+                journal=journal
+            ):
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            yield json.dumps({"status": "error", "error": str(e)}) + "\n"
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-ID": batch_id, "X-Accel-Buffering": "no"}
+    )
+
+async def _process_photo_upload(photo: Optional[UploadFile]) -> Optional[ProcessedPhoto]:
+    """Read an uploaded photo and store its web-ready variants in the asset store."""
+    if not photo or not photo.size:
+        return None
+    sha256 = photo.sha256 if isinstance(photo, HashedUploadFile) else None
+    try:
+        # Decoding and resizing is CPU-bound, so keep it off the event loop. The
+        # upload is read from its spooled file rather than loaded into memory.
+        return await asyncio.to_thread(process_photo, photo.file, photo.size, sha256)
+    except PhotoTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PhotoProcessingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _log_final_html(html_content: str) -> None:
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    final_html_path = os.path.join(settings.LOGS_DIR, "html_dumps", f"final_html_{timestamp}.html")
+    os.makedirs(os.path.dirname(final_html_path), exist_ok=True)
+    with open(final_html_path, 'w') as f:
+        f.write(html_content)
@@ -1,6 +1,6 @@
 import os
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, List
 
 class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
@@ -21,6 +21,20 @@ class Settings(BaseSettings):
     # Logs directory
     LOGS_DIR: str = "logs"
     
+    # Upload limits, enforced while the request body is received. File data past
+    # UPLOAD_SPOOL_BYTES is spooled to disk instead of being held in memory.
+    UPLOAD_MAX_REQUEST_BYTES: int = 12 * 1024 * 1024
+    UPLOAD_MAX_FILE_BYTES: int = 10 * 1024 * 1024
+    UPLOAD_SPOOL_BYTES: int = 1024 * 1024
+    
+    # Uploaded photos are stored as resized variants in a content-addressed asset store
+    ASSETS_DIR: str = "assets"
+    PHOTO_MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024
+    PHOTO_MAX_PIXELS: int = 40_000_000
+    PHOTO_DISPLAY_WIDTH: int = 300
+    PHOTO_QUALITY: int = 82
+    PHOTO_DEDUPE_ENTRIES: int = 256
+    
     # Database settings
     POSTGRES_USER: str = os.environ.get("POSTGRES_USER", "postgres")
     POSTGRES_PASSWORD: str = os.environ.get("POSTGRES_PASSWORD", "postgres")
@@ -31,6 +45,102 @@ class Settings(BaseSettings):
         "DATABASE_URL",
         f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
+    # URL for the async engine; derived from DATABASE_URL (asyncpg or aiosqlite driver) when not set
+    ASYNC_DATABASE_URL: Optional[str] = None
+    
+    # Connection pool settings, per engine (sync and async) and per process
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Connection checkouts waiting longer than this are logged
+    DB_POOL_SLOW_CHECKOUT_MS: int = 100
+    
+    # Models to generate with, in order of preference (JSON list in the environment).
+    # When the primary has not produced a first token within the hedge delay, the
+    # request is also sent to the next model and the faster answer is used.
+    LLM_MODELS: List[str] = ["nousresearch/deephermes-3-mistral-24b-preview:free"]
+    LLM_HEDGE_DELAY_MS: int = 8000
+    LLM_HEDGE_QUANTILE: float = 0.95
+    LLM_HEDGE_MIN_DELAY_MS: int = 1000
+    LLM_HEDGE_MAX_DELAY_MS: int = 30000
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    
+    # OpenRouter client settings
+    OPENROUTER_API_URL: str = "https://openrouter.ai/api/v1/chat/completions"
+    LLM_CONNECT_TIMEOUT: float = 10.0
+    LLM_READ_TIMEOUT: float = 180.0
+    LLM_WRITE_TIMEOUT: float = 30.0
+    LLM_POOL_TIMEOUT: float = 30.0
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 60.0
+    LLM_HTTP2: bool = True
+    
+    # Token budget of a request, counted with a local approximate tokenizer. User
+    # content is compacted until the prompt fits within LLM_MAX_PROMPT_TOKENS and
+    # leaves room for LLM_MAX_OUTPUT_TOKENS in the model context.
+    LLM_CONTEXT_TOKENS: int = 32768
+    LLM_MAX_OUTPUT_TOKENS: int = 4000
+    LLM_MAX_PROMPT_TOKENS: int = 16000
+    
+    # Retries for rate-limited (429) and unavailable (5xx) OpenRouter responses
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 20.0
+    LLM_REQUEST_DEADLINE: float = 240.0
+    
+    # Background generation workers
+    GENERATION_WORKERS: int = 4
+    GENERATION_QUEUE_SIZE: int = 1000
+    
+    # Batch generation (results of each batch are journaled for resuming)
+    BATCH_MAX_ITEMS: int = 1000
+    BATCH_CONCURRENCY: int = 8
+    BATCH_MAX_CONCURRENCY: int = 32
+    BATCH_JOURNAL_DIR: str = os.path.join("logs", "batches")
+    
+    # Template bundles are cached per process. Changes made through the CRUD layer bump
+    # a version counter in the database, which other workers check at this interval.
+    TEMPLATE_CACHE_ENABLED: bool = True
+    TEMPLATE_CACHE_CHECK_SECONDS: float = 5.0
+    TEMPLATE_CACHE_MAX_ENTRIES: int = 64
+    # How long browsers may reuse template endpoint responses before revalidating
+    TEMPLATE_HTTP_MAX_AGE: int = 60
+    
+    # AIUserRequest rows are written behind: inserts and status changes are buffered and
+    # written in batches, and spilled to disk while the database is unavailable
+    AUDIT_WRITE_BEHIND: bool = True
+    AUDIT_BATCH_SIZE: int = 200
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 0.5
+    AUDIT_MAX_PENDING: int = 5000
+    AUDIT_MAX_WAIT_SECONDS: float = 1.0
+    AUDIT_SPILL_PATH: str = os.path.join("logs", "audit_spill.ndjson")
+    # Snowflake worker ID (0-63) for request IDs, unique per process writing user requests.
+    # By default each process leases a free one from the database, renewed well within
+    # AUDIT_WORKER_LEASE_SECONDS; set a fixed ID only where processes are numbered anyway.
+    AUDIT_WORKER_ID: Optional[int] = None
+    AUDIT_WORKER_LEASE_SECONDS: float = 60.0
+    
+    # Store user request prompts as references to content-addressed prompt texts
+    PROMPT_REFS_ENABLED: bool = True
+    
+    # ai_user_requests is partitioned by month on PostgreSQL. Partitions are created this many
+    # months ahead; with a retention period, older ones are archived to gzipped NDJSON and dropped.
+    USER_REQUEST_PARTITIONS_AHEAD: int = 3
+    USER_REQUEST_RETENTION_MONTHS: Optional[int] = None
+    USER_REQUEST_ARCHIVE_DIR: str = os.path.join("logs", "archive")
+    
+    # Most recent requests the latency percentiles endpoint reads per query
+    LATENCY_QUERY_MAX_ROWS: int = 50000
+    
+    # Generation cache settings (the disk tier is enabled by setting a directory)
+    GENERATION_CACHE_ENABLED: bool = True
+    GENERATION_CACHE_MAX_ENTRIES: int = 256
+    GENERATION_CACHE_DIR: Optional[str] = None
+    GENERATION_CACHE_TTL_SECONDS: int = 86400
+    GENERATION_CACHE_MAX_DISK_BYTES: int = 256 * 1024 * 1024
     
     class Config:
         env_file = ".env"
@@ -1,2 +1,27 @@
 from starlette.middleware.sessions import SessionMiddleware
-from app.core.config import settings
\ No newline at end of file
+from starlette.requests import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud import ai_templates
+from app.models.ai_templates import RequestStatus
+from app.services.audit_sink import audit_sink
+
+async def get_generated_html(request: Request, db: AsyncSession) -> str:
+    """
+    Return the last generated HTML for this session, whether streamed or not.
+
+    A streamed response has already sent its headers (and therefore the session
+    cookie) by the time the HTML is complete, so the session only refers to the
+    stream's user request, and the HTML is read from that row. Any worker can
+    serve it once the row is written; the worker that ran the stream sees it
+    right away.
+    """
+    html_content = request.session.get("generated_html", "")
+    if not html_content:
+        request_id = request.session.get("generated_request_id")
+        if request_id is not None:
+            db_request = await db.run_sync(ai_templates.get_user_request, request_id)
+            db_request = audit_sink.view(request_id, db_request)
+            if db_request is not None and db_request.status == RequestStatus.COMPLETED:
+                html_content = db_request.ai_response or ""
+    return html_content
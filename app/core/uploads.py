@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import threading
+from typing import Optional, Dict, Any, Callable
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartParser, MultiPartException
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class UploadStats:
+    """Counters for received uploads, including how much of them was held in memory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "uploads": 0,
+            "bytes": 0,
+            "spooled_to_disk": 0,
+            "duplicates": 0,
+            "rejected": 0,
+            "peak_memory_bytes": 0
+        }
+
+    def record_upload(self, size: int, memory_bytes: int, spooled: bool) -> None:
+        with self._lock:
+            self._stats["uploads"] += 1
+            self._stats["bytes"] += size
+            self._stats["spooled_to_disk"] += int(spooled)
+            self._stats["peak_memory_bytes"] = max(self._stats["peak_memory_bytes"], memory_bytes)
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+upload_stats = UploadStats()
+
+# This module builds on private members of Starlette's MultiPartParser and Request
+# and of tempfile.SpooledTemporaryFile; the Starlette versions they are known in
+# are pinned in the dependencies, and tests/test_uploads.py checks they exist.
+
+class HashedUploadFile(UploadFile):
+    """An uploaded file with the SHA-256 of its contents, computed while it was received."""
+
+    sha256: Optional[str] = None
+
+    @property
+    def spooled_to_disk(self) -> bool:
+        return self.file._rolled
+
+    @property
+    def peak_memory_bytes(self) -> int:
+        """Most bytes of the upload held in memory at once (up to the spool threshold)."""
+        return min(self.size or 0, self.file._max_size)
+
+class UploadTooLargeError(MultiPartException):
+    """Raised while parsing when an uploaded file is over its size limit."""
+
+class LimitedMultiPartParser(MultiPartParser):
+    """
+    Multipart parser that enforces a per-file size limit while reading and hashes
+    files as they stream in. File data beyond UPLOAD_SPOOL_BYTES goes to disk.
+    """
+
+    spool_max_size = settings.UPLOAD_SPOOL_BYTES
+
+    def __init__(self, *args, max_file_size: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_file_size = max_file_size
+        self._file_bytes = 0
+        self._hasher = None
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        upload = self._current_part.file
+        if upload is not None:
+            self._current_part.file = HashedUploadFile(
+                file=upload.file, size=0, filename=upload.filename, headers=upload.headers
+            )
+            self._file_bytes = 0
+            self._hasher = hashlib.sha256()
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._current_part.file is not None:
+            self._file_bytes += end - start
+            if self._file_bytes > self.max_file_size:
+                raise UploadTooLargeError(
+                    f"File {self._current_part.file.filename!r} exceeds the limit of {self.max_file_size} bytes"
+                )
+            self._hasher.update(data[start:end])
+        super().on_part_data(data, start, end)
+
+    def on_part_end(self) -> None:
+        if self._current_part.file is not None:
+            self._current_part.file.sha256 = self._hasher.hexdigest()
+        super().on_part_end()
+
+class UploadRequest(Request):
+    """Request whose multipart form is parsed with LimitedMultiPartParser."""
+
+    async def _get_form(self, **kwargs):
+        if self._form is None and (self.headers.get("Content-Type") or "").startswith("multipart/form-data"):
+            parser = LimitedMultiPartParser(
+                self.headers, self.stream(), max_file_size=settings.UPLOAD_MAX_FILE_BYTES, **kwargs
+            )
+            try:
+                self._form = await parser.parse()
+            except UploadTooLargeError as e:
+                upload_stats.record("rejected")
+                raise HTTPException(status_code=413, detail=e.message)
+            except MultiPartException as e:
+                raise HTTPException(status_code=400, detail=e.message)
+
+            for _, value in self._form.multi_items():
+                if isinstance(value, HashedUploadFile):
+                    upload_stats.record_upload(value.size or 0, value.peak_memory_bytes, value.spooled_to_disk)
+                    logger.info(
+                        f"Received upload {value.filename!r}: {value.size} bytes, sha256 {value.sha256[:12]}, "
+                        f"{value.peak_memory_bytes} bytes in memory{', spooled to disk' if value.spooled_to_disk else ''}"
+                    )
+        return await super()._get_form(**kwargs)
+
+class UploadRoute(APIRoute):
+    """Route class for endpoints that accept uploads (see UploadRequest)."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def upload_route_handler(request: Request):
+            return await handler(UploadRequest(request.scope, request.receive))
+
+        return upload_route_handler
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject request bodies larger than ``max_body_bytes`` with 413.
+
+    A declared Content-Length over the limit is rejected before any of the body
+    is read; otherwise the body is counted as it arrives and the request fails as
+    soon as the limit is passed, without waiting for the rest.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            upload_stats.record("rejected")
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    upload_stats.record("rejected")
+                    # Raised as an HTTPException so FastAPI's body parsing lets it through
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _detail(self) -> str:
+        return f"Request body exceeds the limit of {self.max_body_bytes} bytes"
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = JSONResponse({"detail": self._detail()}, status_code=413, headers={"Connection": "close"})
+        await response(scope, receive, send)
@@ -1,22 +1,44 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import func, and_, or_, insert, inspect
 from typing import List, Dict, Any, Optional
+from datetime import datetime
 import json
+import logging
 
 from app.models.ai_templates import (
     AIRequestTemplate, 
     AIPromptConfig, 
     AIAutoPlaceholder, 
     AIUserRequest,
+    AIPromptBlob,
+    AITemplateVersion,
     PromptRole,
+    RequestStatus,
     PlaceholderScope
 )
+from app.db.expressions import json_array_contains
 from app.schemas.ai_templates import (
     TemplateCreate, 
     PromptConfigCreate, 
     PlaceholderCreate, 
     UserRequestCreate
 )
+from app.services.template_cache import template_cache
+from app.utils.keyword_index import KeywordIndex
+from app.utils.prompt_template import compile_prompt, prompt_slots
+from app.utils.prompt_refs import prompt_refs, rehydrate
+
+logger = logging.getLogger(__name__)
+
+def _bump_template_version(db: Session):
+    """Record a template change, in the caller's transaction, for the template cache."""
+    updated = db.query(AITemplateVersion).filter(AITemplateVersion.id == 1).update(
+        {AITemplateVersion.version: AITemplateVersion.version + 1},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(AITemplateVersion(id=1, version=1))
 
 # Template CRUD operations
 def get_template(db: Session, template_id: int):
@@ -34,7 +56,9 @@ def get_templates(db: Session, skip: int = 0, limit: int = 100):
 def create_template(db: Session, template: TemplateCreate):
     db_template = AIRequestTemplate(**template.model_dump())
     db.add(db_template)
+    _bump_template_version(db)
     db.commit()
+    template_cache.invalidate()
     db.refresh(db_template)
     return db_template
 
@@ -43,7 +67,9 @@ def update_template(db: Session, template_id: int, template_data: Dict[str, Any]
     if db_template:
         for key, value in template_data.items():
             setattr(db_template, key, value)
+        _bump_template_version(db)
         db.commit()
+        template_cache.invalidate()
         db.refresh(db_template)
     return db_template
 
@@ -51,7 +77,9 @@ def delete_template(db: Session, template_id: int):
     db_template = get_template(db, template_id)
     if db_template:
         db.delete(db_template)
+        _bump_template_version(db)
         db.commit()
+        template_cache.invalidate()
         return True
     return False
 
@@ -64,7 +92,9 @@ def get_prompt_configs(db: Session, template_id: int):
 def create_prompt_config(db: Session, prompt_config: PromptConfigCreate):
     db_prompt_config = AIPromptConfig(**prompt_config.model_dump())
     db.add(db_prompt_config)
+    _bump_template_version(db)
     db.commit()
+    template_cache.invalidate()
     db.refresh(db_prompt_config)
     return db_prompt_config
 
@@ -73,7 +103,9 @@ def update_prompt_config(db: Session, prompt_id: int, prompt_data: Dict[str, Any
     if db_prompt:
         for key, value in prompt_data.items():
             setattr(db_prompt, key, value)
+        _bump_template_version(db)
         db.commit()
+        template_cache.invalidate()
         db.refresh(db_prompt)
     return db_prompt
 
@@ -81,7 +113,9 @@ def delete_prompt_config(db: Session, prompt_id: int):
     db_prompt = db.query(AIPromptConfig).filter(AIPromptConfig.id == prompt_id).first()
     if db_prompt:
         db.delete(db_prompt)
+        _bump_template_version(db)
         db.commit()
+        template_cache.invalidate()
         return True
     return False
 
@@ -89,47 +123,136 @@ def delete_prompt_config(db: Session, prompt_id: int):
 def get_placeholders(db: Session, skip: int = 0, limit: int = 100):
     return db.query(AIAutoPlaceholder).offset(skip).limit(limit).all()
 
+def _placeholder_applies(template_type):
+    """Filter for the placeholders of a template type."""
+    return or_(
+        AIAutoPlaceholder.scope == PlaceholderScope.GLOBAL,
+        and_(
+            AIAutoPlaceholder.scope == PlaceholderScope.TYPE_SPECIFIC,
+            json_array_contains(AIAutoPlaceholder.applicable_types, template_type)
+        )
+    )
+
 def get_placeholders_for_template_type(db: Session, template_type: str):
-    # Get global placeholders
-    global_placeholders = db.query(AIAutoPlaceholder).filter(
-        AIAutoPlaceholder.scope == PlaceholderScope.GLOBAL
-    ).all()
-    
-    # Get type-specific placeholders
-    type_specific_placeholders = db.query(AIAutoPlaceholder).filter(
-        AIAutoPlaceholder.scope == PlaceholderScope.TYPE_SPECIFIC,
-        func.json_contains(AIAutoPlaceholder.applicable_types, f'"{template_type}"')
-    ).all()
-    
-    # Combine both lists
-    return global_placeholders + type_specific_placeholders
+    # Global placeholders first, then type-specific ones
+    return db.query(AIAutoPlaceholder).filter(
+        _placeholder_applies(template_type)
+    ).order_by(AIAutoPlaceholder.scope, AIAutoPlaceholder.id).all()
 
 def create_placeholder(db: Session, placeholder: PlaceholderCreate):
     db_placeholder = AIAutoPlaceholder(**placeholder.model_dump())
     db.add(db_placeholder)
+    _bump_template_version(db)
     db.commit()
+    template_cache.invalidate()
     db.refresh(db_placeholder)
     return db_placeholder
 
+# Prompt blob CRUD operations. Blobs never change, so the ones read are kept in memory.
+_PROMPT_BLOB_CACHE_SIZE = 1024
+_prompt_blobs: Dict[str, str] = {}
+
+def get_prompt_blobs(db: Session, hashes) -> Dict[str, str]:
+    blobs = {h: _prompt_blobs[h] for h in hashes if h in _prompt_blobs}
+    missing = [h for h in hashes if h not in blobs]
+    if missing:
+        for blob in db.query(AIPromptBlob).filter(AIPromptBlob.hash.in_(missing)):
+            blobs[blob.hash] = blob.content
+            if len(_prompt_blobs) < _PROMPT_BLOB_CACHE_SIZE:
+                _prompt_blobs[blob.hash] = blob.content
+    return blobs
+
+def missing_prompt_blobs(db: Session, blobs: Dict[str, str]) -> Dict[str, str]:
+    """The blobs (text by hash) that are not stored yet."""
+    if not blobs:
+        return {}
+    stored = {h for (h,) in db.query(AIPromptBlob.hash).filter(AIPromptBlob.hash.in_(list(blobs)))}
+    return {h: text for h, text in blobs.items() if h not in stored}
+
+def store_prompt_blobs(db: Session, blobs: Dict[str, str]) -> None:
+    """Insert prompt blobs in the current transaction, skipping any stored concurrently."""
+    if not blobs:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(AIPromptBlob).on_conflict_do_nothing(index_elements=["hash"])
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(AIPromptBlob).on_conflict_do_nothing(index_elements=["hash"])
+    else:
+        statement = insert(AIPromptBlob)
+    db.execute(statement, [{"hash": h, "content": text} for h, text in blobs.items()])
+
+def rehydrate_user_requests(db: Session, user_requests: List[Any]) -> List[Any]:
+    """Fill in resolved_prompts of user requests stored as prompt references (without marking them changed)."""
+    compacted = [r for r in user_requests if r is not None and r.resolved_prompts is None and r.prompt_refs]
+    if compacted:
+        hashes = {h for r in compacted for role_refs in r.prompt_refs.values() for h in role_refs}
+        blobs = get_prompt_blobs(db, hashes)
+        for r in compacted:
+            set_committed_value(r, "resolved_prompts", rehydrate(r.prompt_refs, r.extracted_data, blobs))
+    return user_requests
+
+_prompt_refs_supported: Dict[Any, bool] = {}
+
+def prompt_refs_supported(db: Session) -> bool:
+    """
+    Whether user requests can be stored with prompt references, which needs a
+    nullable resolved_prompts column (checked once per engine).
+    """
+    engine = db.get_bind().engine
+    if engine not in _prompt_refs_supported:
+        columns = inspect(db.connection()).get_columns(AIUserRequest.__tablename__)
+        _prompt_refs_supported[engine] = any(
+            column["name"] == "resolved_prompts" and column["nullable"] for column in columns
+        )
+        if not _prompt_refs_supported[engine]:
+            logger.warning("ai_user_requests.resolved_prompts is NOT NULL; storing resolved prompts inline")
+    return _prompt_refs_supported[engine]
+
 # User Request CRUD operations
 def create_user_request(db: Session, user_request: UserRequestCreate, 
-                        extracted_data: Dict[str, Any], resolved_prompts: Dict[str, List[str]]):
+                        extracted_data: Dict[str, Any], resolved_prompts: Dict[str, List[str]],
+                        prompt_templates: Optional[Dict[str, List[str]]] = None):
+    """
+    Store a user request. With ``prompt_templates`` (the unresolved prompt texts by
+    role) the prompts are stored as references to prompt blobs instead of inline.
+    """
+    refs = None
+    if prompt_templates is not None:
+        refs, blobs = prompt_refs(prompt_templates)
+        store_prompt_blobs(db, missing_prompt_blobs(db, blobs))
+        resolved_prompts = None
     db_user_request = AIUserRequest(
         template_id=user_request.template_id,
         user_id=user_request.user_id,
         user_input=user_request.user_input,
         extracted_data=extracted_data,
-        resolved_prompts=resolved_prompts
+        resolved_prompts=resolved_prompts,
+        prompt_refs=refs
     )
     db.add(db_user_request)
     db.commit()
     db.refresh(db_user_request)
     return db_user_request
 
+def get_user_request(db: Session, request_id: int):
+    db_request = db.query(AIUserRequest).filter(AIUserRequest.id == request_id).first()
+    return rehydrate_user_requests(db, [db_request])[0]
+
+def get_user_requests(db: Session, skip: int = 0, limit: int = 100):
+    user_requests = db.query(AIUserRequest).order_by(AIUserRequest.id.desc()).offset(skip).limit(limit).all()
+    return rehydrate_user_requests(db, user_requests)
+
 def update_user_request_status(db: Session, request_id: int, status: str, 
                               ai_response: Optional[str] = None, 
                               error_message: Optional[str] = None,
-                              processing_time_ms: Optional[int] = None):
+                              processing_time_ms: Optional[int] = None,
+                              stage_timings: Optional[Dict[str, float]] = None,
+                              prompt_tokens_original: Optional[int] = None,
+                              prompt_tokens: Optional[int] = None,
+                              prompt_compaction: Optional[List[str]] = None):
     db_request = db.query(AIUserRequest).filter(AIUserRequest.id == request_id).first()
     if db_request:
         db_request.status = status
@@ -139,22 +262,74 @@ def update_user_request_status(db: Session, request_id: int, status: str,
             db_request.error_message = error_message
         if processing_time_ms:
             db_request.processing_time_ms = processing_time_ms
+        if stage_timings is not None:
+            db_request.stage_timings = stage_timings
+        if prompt_tokens_original is not None:
+            db_request.prompt_tokens_original = prompt_tokens_original
+        if prompt_tokens is not None:
+            db_request.prompt_tokens = prompt_tokens
+        if prompt_compaction is not None:
+            db_request.prompt_compaction = prompt_compaction
         if status == "completed" or status == "failed":
             db_request.completed_at = func.now()
         db.commit()
         db.refresh(db_request)
     return db_request
 
+def get_request_timings(db: Session, since: datetime, limit: int, template_type: Optional[str] = None):
+    """
+    Processing time and stage timings of the requests completed since ``since``, newest first.
+    
+    Returns:
+        list: ``(template type, processing_time_ms, stage_timings)`` rows
+    """
+    query = db.query(
+        AIRequestTemplate.type, AIUserRequest.processing_time_ms, AIUserRequest.stage_timings
+    ).join(AIRequestTemplate, AIUserRequest.template_id == AIRequestTemplate.id).filter(
+        AIUserRequest.created_at >= since,
+        AIUserRequest.status == RequestStatus.COMPLETED
+    )
+    if template_type is not None:
+        query = query.filter(AIRequestTemplate.type == template_type)
+    return query.order_by(AIUserRequest.created_at.desc()).limit(limit).all()
+
+def load_template_bundle(db: Session, template_type: str):
+    """
+    Fetch the active template of a type with its prompt configs and placeholders in two queries.
+    
+    The template is outer-joined to its prompt configs, one row per config. The
+    placeholders do not belong to a template, so they come from a second query;
+    joining them too would return every config once per placeholder.
+    
+    Returns:
+        tuple: The template (None if there is none), its prompt configs ordered by
+        role and sequence, and its placeholders (global first)
+    """
+    rows = db.query(AIRequestTemplate, AIPromptConfig).outerjoin(
+        AIPromptConfig, AIPromptConfig.template_id == AIRequestTemplate.id
+    ).filter(
+        AIRequestTemplate.type == template_type,
+        AIRequestTemplate.is_active == True
+    ).order_by(
+        AIRequestTemplate.id,
+        AIPromptConfig.role,
+        AIPromptConfig.sequence_order
+    ).all()
+    if not rows:
+        return None, [], []
+    
+    # Several active templates of one type: use the first, like get_template_by_type
+    template = rows[0][0]
+    prompt_configs = [config for row_template, config in rows if row_template is template and config is not None]
+    return template, prompt_configs, get_placeholders_for_template_type(db, template_type)
+
 # Get complete template with prompts and placeholders
 def get_complete_template(db: Session, template_type: str):
-    # Get the template
-    template = get_template_by_type(db, template_type)
+    # Get the template, its prompt configs (already in sequence order) and placeholders
+    template, prompt_configs, placeholders = load_template_bundle(db, template_type)
     if not template:
         return None
     
-    # Get prompt configs
-    prompt_configs = get_prompt_configs(db, template.id)
-    
     # Organize prompts by role
     system_prompts = []
     user_prompts = []
@@ -171,12 +346,6 @@ def get_complete_template(db: Session, template_type: str):
                 "content": config.prompt_content
             })
     
-    # Sort by sequence order
-    system_prompts.sort(key=lambda x: x["sequence_order"])
-    user_prompts.sort(key=lambda x: x["sequence_order"])
-    
-    # Get placeholders
-    placeholders = get_placeholders_for_template_type(db, template_type)
     placeholder_data = []
     
     for p in placeholders:
@@ -188,9 +357,39 @@ def get_complete_template(db: Session, template_type: str):
             "description": p.description
         })
     
+    # Parse the prompts once; the compiled form is cached with the rest of the bundle
+    compiled_prompts = {
+        "system": [compile_prompt(p["content"]) for p in system_prompts],
+        "user": [compile_prompt(p["content"]) for p in user_prompts]
+    }
+    slots = prompt_slots(compiled_prompts["system"] + compiled_prompts["user"])
+    known_keys = {p["key"] for p in placeholder_data}
+    unknown_placeholders = [slot for slot in slots if slot not in known_keys]
+    if unknown_placeholders:
+        logger.warning(f"Prompts of template {template_type!r} use undefined placeholders: {unknown_placeholders}")
+    
     return {
         "template": template,
         "system_prompts": [p["content"] for p in system_prompts],
         "user_prompts": [p["content"] for p in user_prompts],
-        "available_placeholders": placeholder_data
-    }
\ No newline at end of file
+        "available_placeholders": placeholder_data,
+        "compiled_prompts": compiled_prompts,
+        "slots": slots,
+        "unknown_placeholders": unknown_placeholders,
+        # Keyword matcher for extracting placeholder values from user input
+        "keyword_index": KeywordIndex(p for p in placeholder_data if p["key"] != "{{user_input}}")
+    }
+
+def get_cached_template(db: Session, template_type: str):
+    """get_complete_template, served from the process-wide template cache when warm."""
+    return template_cache.get(db, template_type, get_complete_template)
+
+def get_cached_template_by_id(db: Session, template_id: int):
+    """The complete template of the same type as ``template_id``, from the template cache."""
+    template_type = template_cache.template_type_for(template_id)
+    if template_type is None:
+        template = get_template(db, template_id)
+        if not template:
+            return None
+        template_type = template.type
+    return get_cached_template(db, template_type)
@@ -1,14 +1,29 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, List
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.core.config import settings
+from app.db.pool import async_database_url, async_pool_metrics, attach_metrics, pool_options, sync_pool_metrics
 
 # Create SQLAlchemy engine
-engine = create_engine(settings.DATABASE_URL)
+engine = create_engine(settings.DATABASE_URL, **pool_options(make_url(settings.DATABASE_URL)))
+attach_metrics(engine.pool, sync_pool_metrics)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for async endpoints. Its sessions run the sync CRUD and service code
+# through AsyncSession.run_sync, so queries do not block the event loop.
+_async_url = make_url(settings.ASYNC_DATABASE_URL) if settings.ASYNC_DATABASE_URL else async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(_async_url, **pool_options(_async_url, asynchronous=True))
+attach_metrics(async_engine.pool, async_pool_metrics)
+
+# Objects stay usable after commit, since expired attributes cannot be loaded outside run_sync
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Create Base class
 Base = declarative_base()
 
@@ -18,4 +33,38 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+class QueryCounter:
+    """Statements executed on a connection, as collected by count_queries."""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+@contextmanager
+def count_queries(db: Session) -> Iterator[QueryCounter]:
+    """
+    Count the statements ``db`` sends to the database inside the block.
+
+    Only the session's own connection is observed, so concurrent sessions do not
+    affect the count. The block must not commit, as that releases the connection.
+    """
+    counter = QueryCounter()
+    connection = db.connection()
+    event.listen(connection, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(connection, "before_cursor_execute", counter)
+
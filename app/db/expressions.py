@@ -0,0 +1,48 @@
+from typing import Any
+
+from sqlalchemy import Boolean, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import coercions, roles
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+class json_array_contains(ColumnElement):
+    """
+    True when the JSON array in ``array`` contains the string ``value``.
+
+    ``value`` may be a Python string or a column, e.g. to join on it. The SQL
+    depends on the database, so the lookup can use the index there:
+
+    - PostgreSQL: ``array @> jsonb_build_array(value)``, served by a GIN index on a JSONB column
+    - MySQL: ``JSON_CONTAINS(array, JSON_QUOTE(value))``
+    - Others (SQLite): an ``EXISTS`` over ``json_each(array)``
+    """
+
+    type = Boolean()
+    inherit_cache = True
+    _traverse_internals = [
+        ("array", InternalTraversal.dp_clauseelement),
+        ("value", InternalTraversal.dp_clauseelement)
+    ]
+
+    def __init__(self, array: ColumnElement, value: Any):
+        self.array = coercions.expect(roles.ExpressionElementRole, array)
+        self.value = coercions.expect(roles.ExpressionElementRole, value, type_=String())
+
+@compiles(json_array_contains)
+def _json_array_contains_default(element: json_array_contains, compiler, **kw) -> str:
+    array = compiler.process(element.array, **kw)
+    value = compiler.process(element.value, **kw)
+    return f"EXISTS (SELECT 1 FROM json_each({array}) WHERE json_each.value = {value})"
+
+@compiles(json_array_contains, "postgresql")
+def _json_array_contains_postgresql(element: json_array_contains, compiler, **kw) -> str:
+    array = compiler.process(element.array, **kw)
+    value = compiler.process(element.value, **kw)
+    return f"{array} @> jsonb_build_array(CAST({value} AS TEXT))"
+
+@compiles(json_array_contains, "mysql")
+def _json_array_contains_mysql(element: json_array_contains, compiler, **kw) -> str:
+    array = compiler.process(element.array, **kw)
+    value = compiler.process(element.value, **kw)
+    return f"JSON_CONTAINS({array}, JSON_QUOTE({value}))"
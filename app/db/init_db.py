@@ -2,11 +2,13 @@ import logging
 from sqlalchemy.orm import Session
 
 from app.db.database import SessionLocal, engine
+from app.db.migrations import run_migrations
 from app.models.ai_templates import (
     AIRequestTemplate, 
     AIPromptConfig, 
     AIAutoPlaceholder, 
     AIUserRequest,
+    AITemplateVersion,
     PromptRole,
     PlaceholderScope,
     Base
@@ -200,8 +202,14 @@ PLACEHOLDERS = [
 
 def init_db(db: Session) -> None:
     """Initialize the database with sample data."""
-    # Create tables
+    # Create tables and bring existing ones up to date
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    
+    # Version counter for the template cache
+    if db.query(AITemplateVersion).filter(AITemplateVersion.id == 1).first() is None:
+        db.add(AITemplateVersion(id=1, version=0))
+        db.commit()
     
     # Check if we already have data
     existing_templates = db.query(AIRequestTemplate).count()
@@ -233,6 +241,12 @@ def init_db(db: Session) -> None:
         placeholder = AIAutoPlaceholder(**placeholder_data)
         db.add(placeholder)
     
+    # Let running workers drop template lookups cached before the data existed
+    db.query(AITemplateVersion).filter(AITemplateVersion.id == 1).update(
+        {AITemplateVersion.version: AITemplateVersion.version + 1},
+        synchronize_session=False
+    )
+    
     # Commit all changes
     db.commit()
     logger.info("Database initialized with sample data.")
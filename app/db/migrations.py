@@ -0,0 +1,113 @@
+"""
+Schema changes for existing databases.
+
+``Base.metadata.create_all`` creates missing tables with the current schema but
+never changes tables that already exist. The migrations here bring existing
+tables up to date. Each runs once, in order, in its own transaction, and is
+recorded in ai_schema_migrations. Migrations also run on databases created with
+the current schema, so they must check before changing anything.
+"""
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import func
+
+from app.db.database import engine
+from app.db.partitions import partition_user_requests
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "ai_schema_migrations",
+    _metadata,
+    Column("id", String(100), primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now())
+)
+
+def _add_missing_columns(conn: Connection, table: str, columns: Dict[str, str]) -> None:
+    """Add the columns (name: SQL type) that ``table`` does not have yet."""
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}"))
+
+def _applicable_types_jsonb(conn: Connection) -> None:
+    """Store placeholder applicable_types as a GIN-indexed JSONB array (PostgreSQL only)."""
+    if conn.dialect.name != "postgresql":
+        return
+
+    data_type = conn.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'ai_auto_placeholders' "
+        "AND column_name = 'applicable_types'"
+    )).scalar()
+    if data_type == "json":
+        conn.execute(text(
+            "ALTER TABLE ai_auto_placeholders "
+            "ALTER COLUMN applicable_types TYPE JSONB USING applicable_types::jsonb"
+        ))
+
+    # JSON null becomes SQL NULL, and a single type stored as a string becomes an array
+    conn.execute(text(
+        "UPDATE ai_auto_placeholders SET applicable_types = NULL "
+        "WHERE applicable_types = 'null'::jsonb"
+    ))
+    conn.execute(text(
+        "UPDATE ai_auto_placeholders SET applicable_types = jsonb_build_array(applicable_types) "
+        "WHERE jsonb_typeof(applicable_types) = 'string'"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_ai_auto_placeholders_applicable_types "
+        "ON ai_auto_placeholders USING GIN (applicable_types)"
+    ))
+
+def _user_request_prompt_tokens(conn: Connection) -> None:
+    """Record prompt token counts on user requests."""
+    _add_missing_columns(conn, "ai_user_requests", {
+        "prompt_tokens_original": "INTEGER",
+        "prompt_tokens": "INTEGER"
+    })
+
+def _user_request_stage_timings(conn: Connection) -> None:
+    """Record the per-stage latency breakdown of user requests."""
+    _add_missing_columns(conn, "ai_user_requests", {"stage_timings": "JSON"})
+
+def _user_request_prompt_compaction(conn: Connection) -> None:
+    """Record the compaction steps applied to the user input of user requests."""
+    _add_missing_columns(conn, "ai_user_requests", {"prompt_compaction": "JSON"})
+
+def _user_request_prompt_refs(conn: Connection) -> None:
+    """Allow user requests to reference prompt blobs instead of storing resolved prompts inline."""
+    _add_missing_columns(conn, "ai_user_requests", {"prompt_refs": "JSON"})
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE ai_user_requests ALTER COLUMN resolved_prompts DROP NOT NULL"))
+    elif conn.dialect.name == "mysql":
+        conn.execute(text("ALTER TABLE ai_user_requests MODIFY resolved_prompts JSON NULL"))
+    # SQLite cannot change the column; such databases keep storing prompts inline (see prompt_refs_supported)
+
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("0001_applicable_types_jsonb", _applicable_types_jsonb),
+    ("0002_user_request_prompt_tokens", _user_request_prompt_tokens),
+    ("0003_user_request_stage_timings", _user_request_stage_timings),
+    ("0004_user_request_prompt_refs", _user_request_prompt_refs),
+    ("0005_partition_user_requests", partition_user_requests),
+    ("0006_user_request_prompt_compaction", _user_request_prompt_compaction),
+]
+
+def run_migrations(bind: Engine = engine) -> None:
+    """Apply the migrations that have not run against ``bind`` yet."""
+    schema_migrations.create(bind, checkfirst=True)
+    with bind.connect() as conn:
+        applied = set(conn.execute(schema_migrations.select().with_only_columns(schema_migrations.c.id)).scalars())
+
+    for migration_id, migrate in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        with bind.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(id=migration_id))
+        logger.info(f"Applied migration {migration_id}")
@@ -0,0 +1,296 @@
+"""
+Monthly range partitions of ai_user_requests on created_at (PostgreSQL only).
+
+Migration 0005 turns the existing table into the first partition,
+ai_user_requests_legacy, covering everything before next month, and makes
+ai_user_requests a table partitioned by month. ``ensure_partitions`` creates
+the partitions of the coming months; ``apply_retention`` exports partitions
+older than the retention period to gzipped NDJSON files and drops them, and
+does the same for expired rows in the default partition. Everything here does
+nothing on other databases.
+"""
+import os
+import re
+import gzip
+import json
+import logging
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import settings
+from app.crud.ai_templates import get_prompt_blobs
+from app.db.database import SessionLocal
+from app.utils.prompt_refs import rehydrate
+
+logger = logging.getLogger(__name__)
+
+TABLE = "ai_user_requests"
+LEGACY_PARTITION = f"{TABLE}_legacy"
+
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+_BOUNDS = re.compile(r"FROM \((MINVALUE|'[^']+')\) TO \('([^']+)'\)")
+
+def _month_start(day: date, months: int = 0) -> date:
+    """The first day of the month ``months`` after the month of ``day``."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def _this_month() -> date:
+    return _month_start(datetime.now(timezone.utc).date())
+
+def _bound(month: date) -> str:
+    return f"{month.isoformat()} 00:00:00+00"
+
+def _as_datetime(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    relkind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": TABLE}).scalar()
+    return relkind == "p"
+
+def partition_user_requests(conn: Connection) -> None:
+    """
+    Turn ai_user_requests into a table partitioned by month, keeping its rows in place.
+
+    The existing table becomes the partition of everything before next month,
+    so no rows are copied. Partitioned tables need the partition key in their
+    primary key, so it becomes (id, created_at) and created_at NOT NULL.
+    """
+    if conn.dialect.name != "postgresql" or is_partitioned(conn):
+        return
+
+    next_month = _month_start(_this_month(), 1)
+    statements = [
+        f"UPDATE {TABLE} SET created_at = COALESCE(completed_at, now()) WHERE created_at IS NULL",
+        f"ALTER TABLE {TABLE} ALTER COLUMN created_at SET NOT NULL",
+        # Index names are per schema, so the old table's move out of the way
+        f"ALTER TABLE {TABLE} RENAME TO {LEGACY_PARTITION}",
+        f"ALTER INDEX IF EXISTS ix_{TABLE}_status RENAME TO ix_{LEGACY_PARTITION}_status",
+        # A partition's primary key has to match the partitioned table's, which
+        # starts with id and so also serves lookups by id
+        f"ALTER TABLE {LEGACY_PARTITION} DROP CONSTRAINT {TABLE}_pkey, "
+        f"ADD CONSTRAINT {LEGACY_PARTITION}_pkey PRIMARY KEY (id, created_at)",
+        f"DROP INDEX IF EXISTS ix_{TABLE}_id",
+        f"CREATE TABLE {TABLE} (LIKE {LEGACY_PARTITION} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)",
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, created_at)",
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_template_id_fkey "
+        f"FOREIGN KEY (template_id) REFERENCES ai_request_templates (id)",
+        f"CREATE INDEX ix_{TABLE}_status ON {TABLE} (status)",
+        # Keep the ID sequence when the legacy partition is dropped by retention
+        f"ALTER SEQUENCE IF EXISTS {TABLE}_id_seq OWNED BY {TABLE}.id",
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY_PARTITION} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{_bound(next_month)}')",
+        # Rows of months without a partition go here instead of failing
+        f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+    ensure_partitions(conn)
+
+def list_partitions(conn: Connection) -> List[Tuple[str, Optional[datetime], datetime]]:
+    """
+    The range partitions of ai_user_requests with their lower (None for the
+    legacy partition) and exclusive upper bounds, oldest first.
+    """
+    if not is_partitioned(conn):
+        return []
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": TABLE})
+    partitions = []
+    for name, bound in rows:
+        match = _BOUNDS.search(bound)
+        if match:
+            lower = None if match.group(1) == "MINVALUE" else datetime.fromisoformat(match.group(1).strip("'"))
+            partitions.append((name, lower, datetime.fromisoformat(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition[2])
+
+def ensure_partitions(conn: Connection, ahead: Optional[int] = None) -> List[str]:
+    """
+    Create the partitions of the current month and the ``ahead`` months after it
+    that do not exist yet, and return their names.
+
+    Rows of months without a partition land in the default partition, which
+    every query has to scan, so this runs at startup and should also run
+    regularly (see scripts/maintain_partitions.py). Such rows are moved to the
+    new partition of their month.
+    """
+    if not is_partitioned(conn):
+        return []
+    if ahead is None:
+        ahead = settings.USER_REQUEST_PARTITIONS_AHEAD
+
+    # App processes starting together (and the maintenance script) take turns
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:table))"), {"table": TABLE})
+    partitions = list_partitions(conn)
+    this_month = _this_month()
+    created = []
+    for offset in range(ahead + 1):
+        month = _month_start(this_month, offset)
+        start = _as_datetime(month)
+        if any((lower is None or lower <= start) and start < upper for _, lower, upper in partitions):
+            continue
+        name = partition_name(month)
+        bounds = {"lower": _bound(month), "upper": _bound(_month_start(month, 1))}
+        # Attaching checks the default partition for rows of the range, so move them first
+        conn.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        moved = conn.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE created_at >= CAST(:lower AS timestamptz) AND created_at < CAST(:upper AS timestamptz) "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        ), bounds).rowcount
+        conn.execute(text(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"
+        ))
+        if moved:
+            logger.warning(f"Moved {moved} user requests from the default partition to {name}")
+        created.append(name)
+    if created:
+        logger.info(f"Created partitions {created}")
+    return created
+
+def create_upcoming_partitions(engine: Engine) -> None:
+    """
+    Run ensure_partitions in a transaction of its own, as the app does at startup.
+
+    Failures are logged, not raised: rows of months without a partition still go
+    to the default partition.
+    """
+    try:
+        with engine.begin() as conn:
+            ensure_partitions(conn)
+    except Exception as e:
+        logger.error(f"Could not create the user request partitions: {str(e)}")
+
+def retention_cutoff(months: int) -> datetime:
+    """Start of the oldest month kept: the last ``months`` whole months and the current one."""
+    return _as_datetime(_month_start(_this_month(), -months))
+
+def expired_partitions(conn: Connection, months: int) -> List[str]:
+    """Partitions with only rows from before the last ``months`` whole months (and the current one)."""
+    cutoff = retention_cutoff(months)
+    return [name for name, _, upper in list_partitions(conn) if upper <= cutoff]
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _rows(conn: Connection, partition: str, before: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    where = "WHERE created_at < :before " if before is not None else ""
+    result = conn.execute(
+        text(f"SELECT * FROM {partition} {where}ORDER BY created_at, id"),
+        {"before": before} if before is not None else {},
+        execution_options={"stream_results": True, "yield_per": 1000}
+    )
+    with SessionLocal() as db:
+        for row in result.mappings():
+            values = {name: _json_value(value) for name, value in row.items()}
+            # Archives stay readable without the prompt blobs
+            if values.get("resolved_prompts") is None and values.get("prompt_refs"):
+                refs = values["prompt_refs"]
+                blobs = get_prompt_blobs(db, {h for role_refs in refs.values() for h in role_refs})
+                values["resolved_prompts"] = rehydrate(refs, values.get("extracted_data"), blobs)
+            yield values
+
+def export_partition(
+    conn: Connection,
+    partition: str,
+    directory: str,
+    before: Optional[datetime] = None,
+    name: Optional[str] = None
+) -> Tuple[str, int]:
+    """
+    Write the rows of ``partition`` (only those created before ``before``, if
+    given) to ``directory``/<name>.ndjson.gz, named after the partition by
+    default; returns the path and row count.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name or partition}.ndjson.gz")
+    temporary = path + ".tmp"
+    count = 0
+    with gzip.open(temporary, "wt", encoding="utf-8") as f:
+        for values in _rows(conn, partition, before):
+            f.write(json.dumps(values, ensure_ascii=False) + "\n")
+            count += 1
+    with open(temporary, "rb") as f:
+        os.fsync(f.fileno())
+    # Only a complete export replaces an earlier one
+    os.replace(temporary, path)
+    return path, count
+
+def apply_retention(
+    engine: Engine,
+    months: Optional[int] = None,
+    directory: Optional[str] = None,
+    dry_run: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Export the partitions older than ``months`` and drop them, one transaction each.
+
+    A partition is only detached and dropped after its export is complete, so
+    a failed run loses nothing and can be repeated. Expired rows in the default
+    partition (rows of months that had no partition, e.g. once the legacy
+    partition is gone) are exported and deleted the same way, to a file named
+    after the time of the run, so earlier exports are kept.
+    """
+    if months is None:
+        months = settings.USER_REQUEST_RETENTION_MONTHS
+    if directory is None:
+        directory = settings.USER_REQUEST_ARCHIVE_DIR
+    if months is None:
+        return []
+
+    with engine.connect() as conn:
+        partitions = expired_partitions(conn, months)
+    archived = []
+    for partition in partitions:
+        if dry_run:
+            archived.append({"partition": partition, "path": None, "rows": None})
+            continue
+        with engine.begin() as conn:
+            path, count = export_partition(conn, partition, directory)
+            conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {partition}"))
+            conn.execute(text(f"DROP TABLE {partition}"))
+        logger.info(f"Archived {count} user requests of partition {partition} to {path}")
+        archived.append({"partition": partition, "path": path, "rows": count})
+
+    default_rows = _expire_default_rows(engine, retention_cutoff(months), directory, dry_run)
+    if default_rows is not None:
+        archived.append(default_rows)
+    return archived
+
+def _expire_default_rows(
+    engine: Engine,
+    cutoff: datetime,
+    directory: str,
+    dry_run: bool
+) -> Optional[Dict[str, Any]]:
+    """Export and delete the rows of the default partition created before ``cutoff``, if there are any."""
+    with engine.connect() as conn:
+        if not is_partitioned(conn) or not conn.execute(
+            text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at < :cutoff)"), {"cutoff": cutoff}
+        ).scalar():
+            return None
+    if dry_run:
+        return {"partition": DEFAULT_PARTITION, "path": None, "rows": None}
+
+    name = f"{DEFAULT_PARTITION}_{datetime.now(timezone.utc):%Y%m%dT%H%M%S}"
+    with engine.begin() as conn:
+        # Rows written meanwhile would be deleted without being exported
+        conn.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE"))
+        path, count = export_partition(conn, DEFAULT_PARTITION, directory, before=cutoff, name=name)
+        conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at < :cutoff"), {"cutoff": cutoff})
+    logger.warning(f"Archived {count} expired user requests of the default partition to {path}")
+    return {"partition": DEFAULT_PARTITION, "path": path, "rows": count}
@@ -0,0 +1,146 @@
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class PoolMetrics:
+    """Connection checkouts of one engine's pool and how long they waited."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool: Optional[QueuePool] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "slow_checkouts": 0,
+            "timeouts": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0
+        }
+
+    def record(self, wait_ms: float, timed_out: bool = False) -> None:
+        slow = wait_ms > settings.DB_POOL_SLOW_CHECKOUT_MS
+        with self._lock:
+            if timed_out:
+                self._stats["timeouts"] += 1
+            else:
+                self._stats["checkouts"] += 1
+                self._stats["wait_ms_total"] += wait_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+            if slow:
+                self._stats["slow_checkouts"] += 1
+
+        if timed_out:
+            logger.error(f"Timed out after {wait_ms:.0f} ms waiting for a {self.name} database connection")
+        elif slow:
+            logger.warning(f"Waited {wait_ms:.0f} ms for a {self.name} database connection ({self._usage()})")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["wait_ms_avg"] = stats["wait_ms_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        if self.pool is not None:
+            stats.update(
+                size=self.pool.size(),
+                checked_out=self.pool.checkedout(),
+                overflow=max(0, self.pool.overflow()),
+                idle=self.pool.checkedin(),
+                max_connections=self.pool.size() + _max_overflow()
+            )
+        return stats
+
+    def _usage(self) -> str:
+        if self.pool is None:
+            return "pool not measured"
+        return f"{self.pool.checkedout()} checked out of {self.pool.size()} + {_max_overflow()} overflow"
+
+def _max_overflow() -> int:
+    # Measured pools are created by pool_options, which sets their overflow to
+    # DB_MAX_OVERFLOW; a negative value (no limit) counts as no overflow here
+    return max(0, settings.DB_MAX_OVERFLOW)
+
+class _MeasuredPool:
+    """Times every connection checkout and reports it to the pool's metrics."""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record((time.perf_counter() - started) * 1000, timed_out=True)
+            raise
+        self.metrics.record((time.perf_counter() - started) * 1000)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        self.metrics.pool = pool
+        return pool
+
+class MeasuredQueuePool(_MeasuredPool, QueuePool):
+    pass
+
+class MeasuredAsyncQueuePool(_MeasuredPool, AsyncAdaptedQueuePool):
+    pass
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+
+def pool_options(url: URL, asynchronous: bool = False) -> Dict[str, Any]:
+    """
+    Engine keyword arguments for a measured connection pool sized by the DB_POOL_* settings.
+
+    SQLite keeps SQLAlchemy's default pool, which is not a queue pool for
+    in-memory databases.
+    """
+    if url.get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": MeasuredAsyncQueuePool if asynchronous else MeasuredQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING
+    }
+
+def attach_metrics(pool: Any, metrics: PoolMetrics) -> None:
+    """Report checkouts of ``pool`` (one created with pool_options) to ``metrics``."""
+    if isinstance(pool, _MeasuredPool):
+        pool.metrics = metrics
+        metrics.pool = pool
+
+# Async drivers (installed with the app) for the backends this app is deployed with
+_ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite"
+}
+
+def async_database_url(url: str) -> URL:
+    """
+    The URL of the same database with the async driver for its backend.
+
+    Raises ValueError for other backends; ASYNC_DATABASE_URL has to name their
+    async driver, which then has to be installed separately.
+    """
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(
+            f"No async driver for the {parsed.get_backend_name()} backend; "
+            f"set ASYNC_DATABASE_URL to a URL with an installed async driver"
+        )
+    if parsed.get_driver_name() == driver:
+        return parsed
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}")
@@ -3,17 +3,40 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager
+import asyncio
 import os
 
 from app.api.api import api_router
 from app.core.config import settings
 from app.core.session import SessionMiddleware
+from app.core.uploads import RequestSizeLimitMiddleware
+from app.db.database import async_engine, engine
+from app.db.partitions import create_upcoming_partitions
+from app.services.llm_client import close_llm_client
+from app.services.job_queue import generation_queue
+from app.services.audit_sink import audit_sink
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Partitions of ai_user_requests for this month and the next ones (PostgreSQL only)
+    await asyncio.to_thread(create_upcoming_partitions, engine)
+    audit_sink.start()
+    generation_queue.start()
+    yield
+    await generation_queue.stop()
+    # Write the remaining audit records before the database connections go
+    audit_sink.stop()
+    # Release pooled OpenRouter connections on shutdown
+    await close_llm_client()
+    await async_engine.dispose()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description=settings.PROJECT_DESCRIPTION,
     version=settings.VERSION,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Set up CORS
@@ -35,6 +58,9 @@ app.add_middleware(
     https_only=False
 )
 
+# Reject oversized request bodies before they are fully received
+app.add_middleware(RequestSizeLimitMiddleware, max_body_bytes=settings.UPLOAD_MAX_REQUEST_BYTES)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -50,5 +76,5 @@ async def root(request: Request):
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 # Create logs directory if it doesn't exist
-os.makedirs("logs/html_dumps", exist_ok=True)
-os.makedirs("logs/ai_responses", exist_ok=True)
\ No newline at end of file
+os.makedirs(os.path.join(settings.LOGS_DIR, "html_dumps"), exist_ok=True)
+os.makedirs(os.path.join(settings.LOGS_DIR, "ai_responses"), exist_ok=True)
\ No newline at end of file
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, Enum, JSON, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, Enum, JSON, DateTime, BigInteger, Float, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -65,13 +66,26 @@ class AIAutoPlaceholder(Base):
     placeholder_key = Column(String(100), nullable=False, unique=True, index=True)
     placeholder_label = Column(String(100), nullable=False)
     scope = Column(Enum(PlaceholderScope), nullable=False, index=True)
-    applicable_types = Column(JSON, nullable=True)
+    # JSON array of template types; JSONB with a GIN index on PostgreSQL for containment lookups
+    applicable_types = Column(
+        JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"),
+        nullable=True
+    )
     default_value = Column(Text, nullable=True)
     detection_priority = Column(Integer, default=0)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index(
+            "ix_ai_auto_placeholders_applicable_types",
+            "applicable_types",
+            postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
 
 class AIUserRequest(Base):
+    # On PostgreSQL the table is partitioned by month on created_at (see app/db/partitions.py)
     __tablename__ = "ai_user_requests"
     
     id = Column(BigInteger, primary_key=True, index=True)
@@ -79,13 +93,49 @@ class AIUserRequest(Base):
     user_id = Column(BigInteger, nullable=True)
     user_input = Column(Text, nullable=False)
     extracted_data = Column(JSON, nullable=True)
-    resolved_prompts = Column(JSON, nullable=False)
+    # Inline resolved prompts; None when they are stored as prompt_refs instead
+    resolved_prompts = Column(JSON(none_as_null=True), nullable=True)
+    # Hashes of the ai_prompt_blobs texts by role, resolved with extracted_data
+    prompt_refs = Column(JSON(none_as_null=True), nullable=True)
     ai_response = Column(Text, nullable=True)
     status = Column(Enum(RequestStatus), default=RequestStatus.PENDING, index=True)
     error_message = Column(Text, nullable=True)
     processing_time_ms = Column(Integer, nullable=True)
+    # Milliseconds spent in each generation stage (see app.services.spans.STAGES)
+    stage_timings = Column(JSON, nullable=True)
+    # Approximate prompt size before and after compaction to the token budget
+    prompt_tokens_original = Column(Integer, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    # Compaction steps applied to user_input before it was sent (see app.services.prompt_budget);
+    # resolved_prompts and prompt_refs hold the prompts for the uncompacted input
+    prompt_compaction = Column(JSON, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
     
     # Relationships
-    template = relationship("AIRequestTemplate", back_populates="user_requests")
\ No newline at end of file
+    template = relationship("AIRequestTemplate", back_populates="user_requests")
+
+class AIPromptBlob(Base):
+    """A prompt text stored once and referenced by its SHA-256 hash from user requests."""
+    __tablename__ = "ai_prompt_blobs"
+    
+    hash = Column(String(64), primary_key=True)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AIWorkerLease(Base):
+    """A Snowflake worker ID held by a running process (see app/services/worker_lease.py)."""
+    __tablename__ = "ai_worker_leases"
+    
+    worker_id = Column(Integer, primary_key=True, autoincrement=False)
+    holder = Column(String(255), nullable=False)
+    # Unix time the lease runs out unless it is renewed
+    expires_at = Column(Float, nullable=False)
+
+class AITemplateVersion(Base):
+    """Single-row counter bumped by every template, prompt or placeholder change."""
+    __tablename__ = "ai_template_versions"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
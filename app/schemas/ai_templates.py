@@ -100,6 +100,10 @@ class UserRequest(UserRequestBase):
     status: RequestStatus
     error_message: Optional[str] = None
     processing_time_ms: Optional[int] = None
+    stage_timings: Optional[Dict[str, float]] = None
+    prompt_tokens_original: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    prompt_compaction: Optional[List[str]] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
     
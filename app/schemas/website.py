@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from datetime import datetime
 
 class WebsiteRequest(BaseModel):
     website_type: str = Field(..., description="Type of website (CV, landing page, portfolio)")
@@ -12,4 +13,18 @@ class WebsiteRequest(BaseModel):
 class WebsiteResponse(BaseModel):
     success: bool
     message: str
-    html: Optional[str] = None
\ No newline at end of file
+    html: Optional[str] = None
+    request_id: Optional[int] = Field(None, description="ID of the queued generation job")
+
+class GenerationJobStatus(BaseModel):
+    request_id: int
+    status: str
+    html: Optional[str] = None
+    error_message: Optional[str] = None
+    processing_time_ms: Optional[int] = None
+    stage_timings: Optional[Dict[str, float]] = Field(None, description="Milliseconds spent in each generation stage")
+    prompt_tokens_original: Optional[int] = Field(None, description="Approximate prompt tokens before compaction")
+    prompt_tokens: Optional[int] = Field(None, description="Approximate prompt tokens sent to the model")
+    prompt_compaction: Optional[List[str]] = Field(None, description="Compaction steps applied to the user content before it was sent")
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
\ No newline at end of file
@@ -0,0 +1,119 @@
+import os
+import re
+import base64
+import hashlib
+import logging
+import tempfile
+from typing import Optional, Dict, Any, List
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+    "png": "image/png"
+}
+
+ASSET_ID_PATTERN = re.compile(r"[0-9a-f]{64}\.(?:" + "|".join(CONTENT_TYPES) + r")")
+
+class AssetStore:
+    """
+    Content-addressed store for uploaded assets.
+
+    An asset is identified by the SHA-256 of its bytes plus its extension, so the
+    same file is only ever stored once and its URL never changes meaning, which
+    lets it be cached forever. Files live at ``<dir>/<id[:2]>/<id>``.
+    """
+
+    def __init__(self, directory: str, url_prefix: str):
+        self.directory = directory
+        self.url_prefix = url_prefix.rstrip("/")
+        self.url_pattern = re.compile(re.escape(self.url_prefix) + r"/(" + ASSET_ID_PATTERN.pattern + r")")
+
+    def put(self, data: bytes, extension: str) -> str:
+        """Store ``data`` unless it is already present and return its asset ID."""
+        if extension not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported asset type: {extension}")
+        asset_id = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = self._path(asset_id)
+        if os.path.exists(path):
+            return asset_id
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial asset
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"Stored asset {asset_id} ({len(data)} bytes)")
+        return asset_id
+
+    def path(self, asset_id: str) -> Optional[str]:
+        """Path of a stored asset, or None if the ID is invalid or unknown."""
+        if not ASSET_ID_PATTERN.fullmatch(asset_id):
+            return None
+        path = self._path(asset_id)
+        return path if os.path.exists(path) else None
+
+    def read(self, asset_id: str) -> Optional[bytes]:
+        path = self.path(asset_id)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def content_type(asset_id: str) -> str:
+        return CONTENT_TYPES[asset_id.rsplit(".", 1)[1]]
+
+    def url(self, asset_id: str) -> str:
+        return f"{self.url_prefix}/{asset_id}"
+
+    def referenced(self, html: str) -> List[str]:
+        """IDs of the assets whose URLs appear in ``html``, in order of first use."""
+        return list(dict.fromkeys(self.url_pattern.findall(html)))
+
+    def rewrite_urls(self, html: str, prefix: str) -> str:
+        """Point asset URLs in ``html`` at ``prefix`` instead, e.g. for a static export."""
+        return self.url_pattern.sub(lambda match: f"{prefix}{match.group(1)}", html)
+
+    def inline(self, html: str) -> str:
+        """
+        Replace asset URLs with data URIs, for HTML that must be self-contained.
+
+        ``srcset`` attributes that reference assets are dropped rather than inlined,
+        so each image is embedded once.
+        """
+        html = re.sub(r'\ssrcset="[^"]*' + self.url_pattern.pattern + r'[^"]*"', "", html)
+
+        def data_uri(match: "re.Match") -> str:
+            data = self.read(match.group(1))
+            if data is None:
+                logger.warning(f"Asset {match.group(1)} referenced in HTML is missing")
+                return match.group(0)
+            return f"data:{self.content_type(match.group(1))};base64,{base64.b64encode(data).decode('ascii')}"
+
+        return self.url_pattern.sub(data_uri, html)
+
+    def stats(self) -> Dict[str, Any]:
+        count = 0
+        total_bytes = 0
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if ASSET_ID_PATTERN.fullmatch(name):
+                        count += 1
+                        total_bytes += os.path.getsize(os.path.join(root, name))
+        return {"assets": count, "bytes": total_bytes}
+
+    def _path(self, asset_id: str) -> str:
+        return os.path.join(self.directory, asset_id[:2], asset_id)
+
+asset_store = AssetStore(settings.ASSETS_DIR, f"{settings.API_V1_STR}/assets")
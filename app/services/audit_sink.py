@@ -0,0 +1,549 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud import ai_templates
+from app.db.database import SessionLocal
+from app.models.ai_templates import AIUserRequest, RequestStatus
+from app.schemas.ai_templates import UserRequestCreate
+from app.utils.prompt_refs import prompt_refs
+from app.services.worker_lease import WorkerLease
+from app.utils.snowflake import SnowflakeGenerator
+
+logger = logging.getLogger(__name__)
+
+# Columns written by an insert, so every row of a batch has the same keys
+_INSERT_COLUMNS = [column.key for column in AIUserRequest.__table__.columns]
+_DATETIME_COLUMNS = ("created_at", "completed_at")
+
+@dataclass
+class AuditBatch:
+    """Inserts and updates (merged per request) waiting to be written together."""
+    inserts: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    updates: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    # Prompt blobs (text by hash) referenced by the inserts
+    blobs: Dict[str, str] = field(default_factory=dict)
+    # Sequence number of the last change included
+    seq: int = 0
+
+    def __len__(self) -> int:
+        return len(self.inserts) + len(self.updates)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "seq": self.seq,
+            "inserts": [_encode(values) for values in self.inserts.values()],
+            "updates": [{"id": request_id, **_encode(values)} for request_id, values in self.updates.items()],
+            "blobs": self.blobs
+        })
+
+    @classmethod
+    def from_json(cls, line: str) -> "AuditBatch":
+        data = json.loads(line)
+        return cls(
+            inserts={values["id"]: _decode(values) for values in data["inserts"]},
+            updates={values.pop("id"): _decode(values) for values in data["updates"]},
+            blobs=data.get("blobs", {}),
+            seq=data["seq"]
+        )
+
+def _encode(values: Dict[str, Any]) -> Dict[str, Any]:
+    encoded = dict(values)
+    if isinstance(encoded.get("status"), RequestStatus):
+        encoded["status"] = encoded["status"].value
+    for name in _DATETIME_COLUMNS:
+        if isinstance(encoded.get(name), datetime):
+            encoded[name] = encoded[name].isoformat()
+    return encoded
+
+def _decode(values: Dict[str, Any]) -> Dict[str, Any]:
+    if values.get("status") is not None:
+        values["status"] = RequestStatus(values["status"])
+    for name in _DATETIME_COLUMNS:
+        if values.get(name) is not None:
+            values[name] = datetime.fromisoformat(values[name])
+    return values
+
+def _database_unavailable(error: Exception) -> bool:
+    """Whether ``error`` means the database could not be reached, rather than that it rejected the data."""
+    if isinstance(error, PoolTimeoutError):
+        return True
+    return isinstance(error, DBAPIError) and (
+        error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError))
+    )
+
+class AuditSink:
+    """
+    Write-behind sink for AIUserRequest rows.
+
+    Recording a request or a status change only updates memory: request IDs are
+    snowflake IDs assigned here, so callers get the ID without an INSERT. A writer
+    thread flushes the buffered changes every ``flush_interval`` seconds, or as
+    soon as ``batch_size`` requests have changes, as one multi-row INSERT plus
+    bulk UPDATEs in a single transaction. Status changes to a request whose
+    insert has not been written yet are folded into the insert.
+
+    When more than ``max_pending`` requests are waiting, recording blocks for up
+    to ``max_wait`` seconds to let the writer catch up. If the database cannot be
+    reached, batches are appended to ``spill_path`` (fsynced) and replayed in
+    order once it is back, including after a restart; everything recorded while
+    the spill file exists goes through it, so changes are never applied out of
+    order. Rows the database rejects (e.g. a constraint violation) are retried
+    one at a time and the failing ones are logged and dropped.
+
+    Until their changes are written, ``view`` overlays them on the row read from
+    the database, so job status reads in this process see them right away.
+
+    Request IDs are Snowflake IDs, whose worker ID has to be unique among the
+    processes writing user requests. Without a fixed ``worker_id`` one is leased
+    from the database (see WorkerLease) when the sink starts, and the writer
+    thread keeps renewing it; ``start`` raises WorkerLeaseError if none can be
+    leased. A fixed ``worker_id`` shared by two processes makes their IDs
+    collide, and the rejected rows are dropped. With ``enabled`` False, every
+    change is written through ai_templates directly.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        max_pending: int = 5000,
+        max_wait: float = 1.0,
+        spill_path: str = os.path.join("logs", "audit_spill.ndjson"),
+        session_factory: Callable[[], Session] = SessionLocal,
+        worker_id: Optional[int] = None,
+        lease_ttl: float = 60.0
+    ):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.spill_path = spill_path
+        self.session_factory = session_factory
+        self._ids = SnowflakeGenerator(worker_id) if worker_id is not None else None
+        self._lease = WorkerLease(session_factory, lease_ttl) if worker_id is None else None
+        self._renew_at = 0.0
+
+        self._cond = threading.Condition()
+        self._pending = AuditBatch()
+        self._seq = 0
+        # Changes not written yet, by request: (sequence number of the last change, merged values)
+        self._overlay: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._exit_registered = False
+        self._retry_at = 0.0
+        self._retry_delay = flush_interval
+        self._stats = {
+            "recorded": 0,
+            "written": 0,
+            "batches": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "dropped": 0,
+            "backpressure_waits": 0,
+            "backpressure_timeouts": 0
+        }
+
+    def record_request(
+        self,
+        db: Session,
+        user_request: UserRequestCreate,
+        extracted_data: Dict[str, Any],
+        resolved_prompts: Dict[str, List[str]],
+        prompt_templates: Optional[Dict[str, List[str]]] = None
+    ) -> int:
+        """Record a new user request and return its ID (see ai_templates.create_user_request)."""
+        if not self.enabled:
+            return ai_templates.create_user_request(
+                db, user_request, extracted_data, resolved_prompts, prompt_templates
+            ).id
+
+        # Leases the worker ID if the sink was not started yet
+        self.start()
+        request_id = self._ids.next_id()
+        values = dict.fromkeys(_INSERT_COLUMNS)
+        values.update(
+            id=request_id,
+            template_id=user_request.template_id,
+            user_id=user_request.user_id,
+            user_input=user_request.user_input,
+            extracted_data=extracted_data,
+            resolved_prompts=resolved_prompts,
+            status=RequestStatus.PENDING,
+            created_at=datetime.now(timezone.utc)
+        )
+        if prompt_templates is None:
+            self._record(request_id, values, insert=True)
+            return request_id
+
+        refs, blobs = prompt_refs(prompt_templates)
+        # Status reads before the write still see the resolved prompts
+        shown = dict(values, prompt_refs=refs)
+        values.update(resolved_prompts=None, prompt_refs=refs)
+        self._record(request_id, values, insert=True, blobs=blobs, shown=shown)
+        return request_id
+
+    def record_status(
+        self,
+        db: Session,
+        request_id: int,
+        status: RequestStatus,
+        ai_response: Optional[str] = None,
+        error_message: Optional[str] = None,
+        processing_time_ms: Optional[int] = None,
+        stage_timings: Optional[Dict[str, float]] = None,
+        prompt_tokens_original: Optional[int] = None,
+        prompt_tokens: Optional[int] = None,
+        prompt_compaction: Optional[List[str]] = None
+    ) -> None:
+        """Record a status change of a user request, as ai_templates.update_user_request_status does."""
+        if not self.enabled:
+            ai_templates.update_user_request_status(
+                db, request_id, status,
+                ai_response=ai_response,
+                error_message=error_message,
+                processing_time_ms=processing_time_ms,
+                stage_timings=stage_timings,
+                prompt_tokens_original=prompt_tokens_original,
+                prompt_tokens=prompt_tokens,
+                prompt_compaction=prompt_compaction
+            )
+            return
+
+        changes = {"status": status}
+        optional = {
+            "ai_response": ai_response,
+            "error_message": error_message,
+            "processing_time_ms": processing_time_ms,
+            "stage_timings": stage_timings,
+            "prompt_tokens_original": prompt_tokens_original,
+            "prompt_tokens": prompt_tokens,
+            "prompt_compaction": prompt_compaction
+        }
+        changes.update((name, value) for name, value in optional.items() if value is not None)
+        if status in (RequestStatus.COMPLETED, RequestStatus.FAILED):
+            changes["completed_at"] = datetime.now(timezone.utc)
+        self._record(request_id, changes)
+
+    def view(self, request_id: int, db_request: Optional[AIUserRequest]) -> Optional[AIUserRequest]:
+        """
+        The user request as recorded: ``db_request`` (the row read from the
+        database, if any) with the changes not written yet applied, as a new
+        detached object. Returns ``db_request`` itself when nothing is pending.
+
+        Only changes recorded by this process are known. Another process sees a
+        request as missing or with an older status until the writer has written
+        it, normally within ``flush_interval``.
+        """
+        with self._cond:
+            entry = self._overlay.get(request_id)
+        if entry is None:
+            return db_request
+
+        values = {}
+        if db_request is not None:
+            values = {name: getattr(db_request, name) for name in _INSERT_COLUMNS}
+        elif "user_input" not in entry[1]:
+            # Only status changes are known; the insert was lost
+            return None
+        values.update(entry[1])
+        return AIUserRequest(**values)
+
+    @property
+    def worker_id(self) -> Optional[int]:
+        """The worker ID of the request IDs, once the sink has started."""
+        return self._ids.worker_id if self._ids is not None else None
+
+    def start(self) -> None:
+        """
+        Lease a worker ID unless one is fixed, and start the writer thread, which
+        also replays changes spilled by an earlier run.
+
+        Raises:
+            WorkerLeaseError: If no worker ID can be leased
+        """
+        if not self.enabled:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            if self._lease is not None:
+                self._ids = SnowflakeGenerator(self._lease.acquire())
+                self._renew_at = time.monotonic() + self._lease.ttl / 3
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+            if not self._exit_registered:
+                atexit.register(self.stop)
+                self._exit_registered = True
+
+    def stop(self) -> None:
+        """Write (or spill) everything recorded so far and stop the writer thread."""
+        with self._cond:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        thread.join()
+        with self._cond:
+            self._thread = None
+            if self._lease is not None:
+                try:
+                    self._lease.release()
+                except Exception as e:
+                    # It runs out on its own
+                    logger.error(f"Could not release Snowflake worker ID lease: {str(e)}")
+                self._ids = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            stats["unwritten"] = len(self._overlay)
+        stats["spill_bytes"] = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+        return stats
+
+    def _record(
+        self,
+        request_id: int,
+        values: Dict[str, Any],
+        insert: bool = False,
+        blobs: Optional[Dict[str, str]] = None,
+        shown: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.start()
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._stats["backpressure_waits"] += 1
+                self._cond.notify_all()
+                if not self._cond.wait_for(lambda: len(self._pending) < self.max_pending, self.max_wait):
+                    # Audit records are never dropped; go over the limit instead
+                    self._stats["backpressure_timeouts"] += 1
+                    logger.warning(f"Audit writer is behind: {len(self._pending)} requests waiting to be written")
+
+            self._seq += 1
+            if blobs:
+                self._pending.blobs.update(blobs)
+            if insert:
+                self._pending.inserts[request_id] = values
+            elif request_id in self._pending.inserts:
+                self._pending.inserts[request_id].update(values)
+            else:
+                self._pending.updates.setdefault(request_id, {}).update(values)
+            self._overlay[request_id] = (self._seq, {**self._overlay.get(request_id, (0, {}))[1], **(shown or values)})
+            self._stats["recorded"] += 1
+
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _take(self) -> AuditBatch:
+        """Swap out the pending changes (the caller holds the lock)."""
+        batch, self._pending = self._pending, AuditBatch()
+        batch.seq = self._seq
+        self._cond.notify_all()
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self.batch_size,
+                    self.flush_interval
+                )
+                stopping = self._stopping
+                batch = self._take()
+            try:
+                self._flush(batch, force=stopping)
+            except Exception as e:
+                logger.error(f"Audit writer failed: {str(e)}")
+            if stopping:
+                return
+            if self._lease is not None and time.monotonic() >= self._renew_at:
+                self._renew_lease()
+
+    def _renew_lease(self) -> None:
+        """Renew the worker ID lease, leasing a new worker ID if it was lost."""
+        try:
+            if not self._lease.renew():
+                # Another process took it over after it ran out; stop using it right away
+                lost = self._lease.worker_id
+                ids = SnowflakeGenerator(self._lease.acquire())
+                with self._cond:
+                    self._ids = ids
+                logger.warning(f"Lease of Snowflake worker ID {lost} was lost, now using {ids.worker_id}")
+            self._renew_at = time.monotonic() + self._lease.ttl / 3
+        except Exception as e:
+            # Retried on the next round
+            logger.error(f"Could not renew Snowflake worker ID lease: {str(e)}")
+
+    def _flush(self, batch: AuditBatch, force: bool = False) -> None:
+        if os.path.exists(self.spill_path):
+            # Older changes are on disk; keep the order by queueing behind them
+            if batch:
+                self._spill([batch])
+            if force or time.monotonic() >= self._retry_at:
+                self._replay()
+            return
+        if not batch:
+            return
+
+        try:
+            self._write([batch])
+        except Exception as e:
+            if _database_unavailable(e):
+                logger.error(f"Database unavailable, spilling {len(batch)} audit records to disk: {str(e)}")
+                self._spill([batch])
+                self._schedule_retry()
+            else:
+                logger.error(f"Audit batch rejected, writing its records one at a time: {str(e)}")
+                self._write_each([batch])
+
+    def _write(self, batches: List[AuditBatch]) -> None:
+        with self.session_factory() as session:
+            blobs = {h: text for batch in batches for h, text in batch.blobs.items()}
+            ai_templates.store_prompt_blobs(session, ai_templates.missing_prompt_blobs(session, blobs))
+            for batch in batches:
+                if batch.inserts:
+                    session.execute(insert(AIUserRequest), list(batch.inserts.values()))
+                if batch.updates:
+                    session.execute(
+                        update(AIUserRequest),
+                        [{"id": request_id, **values} for request_id, values in batch.updates.items()]
+                    )
+            session.commit()
+
+        with self._cond:
+            for batch in batches:
+                self._stats["written"] += len(batch)
+                self._stats["batches"] += 1
+            self._confirm(max(batch.seq for batch in batches))
+
+    def _write_each(self, batches: List[AuditBatch]) -> None:
+        """Write the changes one per transaction, dropping those the database rejects."""
+        blobs = {h: text for batch in batches for h, text in batch.blobs.items()}
+        try:
+            with self.session_factory() as session:
+                ai_templates.store_prompt_blobs(session, ai_templates.missing_prompt_blobs(session, blobs))
+                session.commit()
+        except Exception as e:
+            if _database_unavailable(e):
+                self._spill(batches)
+                self._schedule_retry()
+                return
+            logger.error(f"Prompt blobs rejected, writing the audit records without them: {str(e)}")
+
+        changes = []
+        for batch in batches:
+            changes.extend((insert(AIUserRequest), values) for values in batch.inserts.values())
+            changes.extend(
+                (update(AIUserRequest), {"id": request_id, **values}) for request_id, values in batch.updates.items()
+            )
+
+        for index, (statement, values) in enumerate(changes):
+            try:
+                with self.session_factory() as session:
+                    session.execute(statement, [values])
+                    session.commit()
+                with self._cond:
+                    self._stats["written"] += 1
+            except Exception as e:
+                if _database_unavailable(e):
+                    # Keep the rest (this change included) for when the database is back
+                    rest = AuditBatch(blobs=blobs, seq=max(batch.seq for batch in batches))
+                    for statement, values in changes[index:]:
+                        if statement.is_insert:
+                            rest.inserts[values["id"]] = values
+                        else:
+                            rest.updates[values["id"]] = {k: v for k, v in values.items() if k != "id"}
+                    self._spill([rest])
+                    self._schedule_retry()
+                    return
+                logger.error(f"Dropping audit record for request {values.get('id')}: {str(e)}")
+                with self._cond:
+                    self._stats["dropped"] += 1
+
+        with self._cond:
+            self._confirm(max(batch.seq for batch in batches))
+
+    def _spill(self, batches: List[AuditBatch]) -> None:
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for batch in batches:
+                f.write(batch.to_json() + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with self._cond:
+            self._stats["spilled"] += sum(len(batch) for batch in batches)
+
+    def _replay(self) -> None:
+        """Apply the spilled batches in order and remove the spill file."""
+        with open(self.spill_path, encoding="utf-8") as f:
+            batches = [AuditBatch.from_json(line) for line in f if line.strip()]
+
+        if batches:
+            try:
+                self._write(batches)
+            except Exception as e:
+                if _database_unavailable(e):
+                    self._schedule_retry()
+                    return
+                # Typically rows of an earlier replay that committed before the file was removed
+                logger.error(f"Spilled audit batches rejected, replaying them one at a time: {str(e)}")
+                self._write_each(batches)
+                if self._retry_at > time.monotonic():
+                    # The database went away again; what is left was spilled anew
+                    self._drop_replayed(len(batches))
+                    return
+
+        os.remove(self.spill_path)
+        self._retry_delay = self.flush_interval
+        self._retry_at = 0.0
+        with self._cond:
+            self._stats["replayed"] += sum(len(batch) for batch in batches)
+        logger.info(f"Replayed {len(batches)} spilled audit batches")
+
+    def _drop_replayed(self, count: int) -> None:
+        """Remove the first ``count`` batches from the spill file, keeping those spilled since."""
+        with open(self.spill_path, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()][count:]
+        temporary = self.spill_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.spill_path)
+
+    def _schedule_retry(self) -> None:
+        self._retry_at = time.monotonic() + self._retry_delay
+        self._retry_delay = min(self._retry_delay * 2, 60.0)
+
+    def _confirm(self, seq: int) -> None:
+        """Forget the overlay of requests whose changes up to ``seq`` are written (the caller holds the lock)."""
+        for request_id in [request_id for request_id, (last, _) in self._overlay.items() if last <= seq]:
+            del self._overlay[request_id]
+
+audit_sink = AuditSink(
+    enabled=settings.AUDIT_WRITE_BEHIND,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.AUDIT_MAX_PENDING,
+    max_wait=settings.AUDIT_MAX_WAIT_SECONDS,
+    spill_path=settings.AUDIT_SPILL_PATH,
+    worker_id=settings.AUDIT_WORKER_ID,
+    lease_ttl=settings.AUDIT_WORKER_LEASE_SECONDS
+)
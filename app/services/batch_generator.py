@@ -0,0 +1,285 @@
+import io
+import os
+import csv
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Union, Iterable, AsyncIterator
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.schemas.ai_templates import UserRequestCreate
+from app.services.generation_context import GenerationContext
+from app.services.prompt_service import PromptService
+from app.services.retry_scheduler import RateLimitError
+from app.services.website_generator import generate_website
+from app.utils.language_detector import detect_language
+
+logger = logging.getLogger(__name__)
+
+class BatchInputError(Exception):
+    """Raised when a batch input file cannot be parsed."""
+
+@dataclass
+class BatchItem:
+    id: str
+    website_type: Optional[str] = None
+    content: Optional[str] = None
+    style: Optional[str] = None
+    language: Optional[str] = None
+    color_palette: Optional[Union[str, Dict[str, str]]] = None
+
+def parse_batch(data: str, fmt: str = "jsonl") -> List[BatchItem]:
+    """
+    Parse batch input given as JSON lines or CSV with a header row.
+
+    Each record has ``content`` and optionally ``id``, ``website_type``, ``style``,
+    ``language`` and ``color_palette``. Records without an ``id`` are numbered by
+    their position, so a resumed run must use the same input file.
+
+    Raises:
+        BatchInputError: If the input is malformed or has too many items
+    """
+    if fmt == "csv":
+        records = list(csv.DictReader(io.StringIO(data)))
+    elif fmt == "jsonl":
+        records = []
+        for line_number, line in enumerate(data.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise BatchInputError(f"Invalid JSON on line {line_number}: {e}")
+            if not isinstance(record, dict):
+                raise BatchInputError(f"Line {line_number} is not a JSON object")
+            records.append(record)
+    else:
+        raise BatchInputError(f"Unsupported batch format: {fmt}")
+
+    if len(records) > settings.BATCH_MAX_ITEMS:
+        raise BatchInputError(f"Batch has {len(records)} items, the maximum is {settings.BATCH_MAX_ITEMS}")
+
+    items = []
+    seen = set()
+    for position, record in enumerate(records, start=1):
+        item_id = str(record.get("id") or position)
+        if item_id in seen:
+            raise BatchInputError(f"Duplicate item id: {item_id}")
+        seen.add(item_id)
+        items.append(BatchItem(
+            id=item_id,
+            website_type=record.get("website_type") or None,
+            content=record.get("content") or None,
+            style=record.get("style") or None,
+            language=record.get("language") or None,
+            color_palette=record.get("color_palette") or None
+        ))
+    return items
+
+def batch_format(filename: Optional[str]) -> str:
+    """Guess the batch format from a file name, defaulting to JSON lines."""
+    if filename and filename.lower().endswith(".csv"):
+        return "csv"
+    return "jsonl"
+
+class BatchJournal:
+    """
+    Append-only NDJSON file of batch results, used to resume an interrupted batch.
+
+    Every finished item is written and flushed as soon as it completes, so after a
+    crash the completed items are known and only the rest need to run again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def completed(self) -> Dict[str, Dict[str, Any]]:
+        """Results of items that completed in earlier runs, by item ID."""
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash
+                    continue
+                if result.get("status") == "completed":
+                    results[str(result["id"])] = result
+        return results
+
+    def append(self, result: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+async def run_batch(
+    items: Iterable[BatchItem],
+    api_token: str,
+    website_type: Optional[str] = None,
+    style: Optional[str] = None,
+    concurrency: int = 8,
+    bypass_cache: bool = False,
+    journal: Optional[BatchJournal] = None,
+    replay: bool = True
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Generate websites for a batch of items, yielding each result as it finishes.
+
+    Templates are resolved once per website type for the whole batch, and at most
+    ``concurrency`` generations run at the same time. Items already completed in
+    ``journal`` are not generated again; with ``replay`` their stored results are
+    yielded first, marked ``"resumed": true``. An item's ``status`` is
+    ``"completed"``, ``"failed"``, or ``"rate_limited"`` when OpenRouter's rate limit
+    could not be waited out; the latter carries ``retry_after`` in seconds if known.
+
+    Args:
+        items: The items to generate
+        api_token (str): OpenRouter API token used for every item
+        website_type (str, optional): Website type for items that do not set one
+        style (str, optional): Style for items that do not set one
+        concurrency (int): Maximum number of generations in flight
+        bypass_cache (bool): Skip the generation cache for every item
+        journal (BatchJournal, optional): Where finished items are recorded
+        replay (bool): Yield the stored results of already completed items
+    """
+    items = list(items)
+    done = journal.completed() if journal else {}
+    pending = [item for item in items if item.id not in done]
+    if done:
+        logger.info(f"Resuming batch: {len(items) - len(pending)} of {len(items)} items already completed")
+        if replay:
+            for item in items:
+                if item.id in done:
+                    yield {**done[item.id], "resumed": True}
+
+    if not pending:
+        return
+
+    async with AsyncSessionLocal() as db:
+        templates = await db.run_sync(_resolve_templates, {item.website_type or website_type for item in pending})
+
+    workers: List[asyncio.Task] = []
+    try:
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in pending:
+            queue.put_nowait(item)
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def worker() -> None:
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    result = await _generate_item(item, api_token, website_type, style, bypass_cache, templates)
+                    if journal:
+                        journal.append(result)
+                except Exception as e:
+                    # Hand unexpected errors (e.g. an unwritable journal) to the consumer
+                    result = e
+                await results.put(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(pending))))]
+        for _ in range(len(pending)):
+            result = await results.get()
+            if isinstance(result, Exception):
+                raise result
+            yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+def _resolve_templates(db: Session, website_types: Iterable[Optional[str]]) -> Dict[str, Dict[str, Any]]:
+    """Look up the prompts of every website type in the batch once."""
+    prompt_service = PromptService(db)
+    templates = {}
+    for website_type in website_types:
+        if not website_type:
+            continue
+        template_data = prompt_service.get_template_prompts(website_type)
+        if template_data["success"] and template_data["template"] in db:
+            # Detach so commits of request rows do not expire (and reload) the template.
+            # Templates from the template cache are detached already.
+            db.expunge(template_data["template"])
+        templates[website_type] = template_data
+    return templates
+
+async def _generate_item(
+    item: BatchItem,
+    api_token: str,
+    default_type: Optional[str],
+    default_style: Optional[str],
+    bypass_cache: bool,
+    templates: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    started = time.monotonic()
+    website_type = item.website_type or default_type
+    style = item.style or default_style
+    result = {"id": item.id, "website_type": website_type, "request_id": None}
+
+    if not website_type or not item.content or not style:
+        missing = [name for name, value in (("website_type", website_type), ("content", item.content), ("style", style)) if not value]
+        return {**result, "status": "failed", "error": f"Missing {', '.join(missing)}"}
+
+    # Items share the batch's template lookups; sessions cannot be shared by concurrent items
+    context = GenerationContext.open(website_type, templates[website_type])
+    template_data = context.template_data
+    try:
+        if template_data["success"]:
+            # Record the request up front so its ID is part of the result
+            request_result = await context.run_sync(
+                context.prompt_service.process_user_request,
+                UserRequestCreate(template_id=template_data["template"].id, user_input=item.content),
+                template_data
+            )
+            result["request_id"] = request_result.get("request_id")
+
+        html_content = await generate_website(
+            website_type=website_type,
+            content=item.content,
+            style=style,
+            language=item.language or detect_language(item.content),
+            api_token=api_token,
+            color_palette=item.color_palette,
+            bypass_cache=bypass_cache,
+            user_request_id=result["request_id"],
+            context=context
+        )
+    except asyncio.CancelledError:
+        raise
+    except RateLimitError as e:
+        logger.warning(f"Batch item {item.id} was rate limited: {str(e)}")
+        return {
+            **result,
+            "status": "rate_limited",
+            "error": str(e),
+            "retry_after": e.retry_after,
+            "processing_time_ms": int((time.monotonic() - started) * 1000)
+        }
+    except Exception as e:
+        logger.error(f"Batch item {item.id} failed: {str(e)}")
+        return {
+            **result,
+            "status": "failed",
+            "error": str(e),
+            "processing_time_ms": int((time.monotonic() - started) * 1000)
+        }
+    finally:
+        await context.close()
+
+    return {
+        **result,
+        "status": "completed",
+        "html": html_content,
+        "processing_time_ms": int((time.monotonic() - started) * 1000)
+    }
@@ -1,10 +1,30 @@
 import time
+import base64
+import asyncio
+import hashlib
 import logging
 import requests
 from typing import Dict, Any, List
 
+from app.services.asset_store import asset_store
+from app.services.single_flight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
+# Coalesce concurrent deployments of the same HTML to the same Vercel account
+deployment_flight = SingleFlight("deployment")
+
+async def deploy_to_vercel_coalesced(html_content: str, vercel_token: str) -> str:
+    """
+    Deploy the generated HTML to Vercel without blocking the event loop.
+
+    Concurrent calls with the same HTML and token share a single deployment.
+    """
+    key = hashlib.sha256(f"{vercel_token}\0{html_content}".encode("utf-8")).hexdigest()
+    return await deployment_flight.do(
+        key, lambda: asyncio.to_thread(deploy_to_vercel, html_content, vercel_token)
+    )
+
 def deploy_to_vercel(html_content: str, vercel_token: str) -> str:
     """
     Deploy the generated HTML to Vercel.
@@ -20,13 +40,22 @@ def deploy_to_vercel(html_content: str, vercel_token: str) -> str:
         # Vercel API endpoint for creating a new deployment
         api_url = "https://api.vercel.com/v13/deployments"
         
-        # Create a simple project structure with index.html
-        files = [
-            {
-                "file": "index.html",
-                "data": html_content
-            }
-        ]
+        # Create a simple project structure with index.html and the assets it uses
+        files = []
+        for asset_id in asset_store.referenced(html_content):
+            data = asset_store.read(asset_id)
+            if data is None:
+                logger.warning(f"Asset {asset_id} referenced in HTML is missing")
+                continue
+            files.append({
+                "file": f"assets/{asset_id}",
+                "data": base64.b64encode(data).decode("ascii"),
+                "encoding": "base64"
+            })
+        files.insert(0, {
+            "file": "index.html",
+            "data": asset_store.rewrite_urls(html_content, "assets/")
+        })
         
         # Prepare the deployment payload
         payload = {
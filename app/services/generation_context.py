@@ -0,0 +1,75 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Callable, TypeVar, Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db.database import AsyncSessionLocal
+from app.services.prompt_budget import BudgetResult
+from app.services.prompt_service import PromptService
+from app.services.spans import SpanRecorder
+
+T = TypeVar("T")
+
+@dataclass
+class GenerationContext:
+    """
+    State shared by every step of one generation request.
+
+    Carries the request's DB session and resolves the template bundle (prompts and
+    placeholders) for the website type at most once, so the endpoint, the
+    generator and request recording all work from the same lookup.
+
+    The services only use sync sessions, so steps that query go through
+    ``run_sync``: inside AsyncSession.run_sync for an AsyncSession, or in a
+    worker thread for a sync Session, so neither blocks the event loop.
+    """
+    db: Union[Session, AsyncSession]
+    website_type: str
+    template_data: Optional[Dict[str, Any]] = None
+    owns_session: bool = False
+    # How the prompt was fitted to the token budget, once the messages are prepared
+    budget: Optional[BudgetResult] = field(default=None, init=False)
+    # Stage timings of the request, from when the context was created
+    timings: SpanRecorder = field(default_factory=SpanRecorder, init=False)
+    _prompt_service: Optional[PromptService] = field(default=None, init=False, repr=False)
+
+    @classmethod
+    def open(cls, website_type: str, template_data: Optional[Dict[str, Any]] = None) -> "GenerationContext":
+        """A context with its own async session, for work running outside a request (close it when done)."""
+        return cls(AsyncSessionLocal(), website_type, template_data, owns_session=True)
+
+    @property
+    def session(self) -> Session:
+        """The sync session; for an AsyncSession it may only query inside ``run_sync``."""
+        if isinstance(self.db, AsyncSession):
+            return self.db.sync_session
+        return self.db
+
+    @property
+    def prompt_service(self) -> PromptService:
+        if self._prompt_service is None:
+            self._prompt_service = PromptService(self.session)
+        return self._prompt_service
+
+    async def run_sync(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Call ``fn``, which may use the session, without blocking the event loop."""
+        if isinstance(self.db, AsyncSession):
+            return await self.db.run_sync(lambda session: fn(*args, **kwargs))
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def resolve_template(self) -> Dict[str, Any]:
+        """The result of PromptService.get_template_prompts for the website type, looked up once."""
+        if self.template_data is None:
+            with self.timings.span("template_resolve"):
+                self.template_data = self.prompt_service.get_template_prompts(self.website_type)
+        return self.template_data
+
+    async def close(self) -> None:
+        if not self.owns_session:
+            return
+        if isinstance(self.db, AsyncSession):
+            await self.db.close()
+        else:
+            self.db.close()
@@ -0,0 +1,325 @@
+import re
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# Stands in for the uploaded photo in prompts; swapped for the real image afterwards
+PHOTO_REFERENCE = "webwizard-asset://profile-photo"
+
+PHOTO_STYLE = "max-width: 300px; border-radius: 8px; margin: 20px auto; display: block;"
+
+PHOTO_CSS = """
+    .profile-photo {
+        max-width: 300px;
+        border-radius: 8px;
+        margin: 20px auto;
+        display: block;
+        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
+        transition: transform 0.3s ease;
+    }
+    .profile-photo:hover {
+        transform: scale(1.02);
+    }
+"""
+
+class Document:
+    """
+    Generated HTML with pending edits.
+
+    Stages never rebuild the HTML string; they record replacements and insertions
+    by offset into the original text, and the document is rendered once at the end.
+    """
+
+    def __init__(self, html: str):
+        self.html = html
+        self.start = 0
+        self.end = len(html)
+        self._edits: List[Tuple[int, int, int, str]] = []
+
+    def replace(self, start: int, end: int, value: str) -> None:
+        self._edits.append((start, end, len(self._edits), value))
+
+    def insert(self, position: int, value: str) -> None:
+        self.replace(position, position, value)
+
+    def removed(self) -> List[Tuple[int, int]]:
+        """Spans replaced with nothing, in document order."""
+        return sorted((start, end) for start, end, _, value in self._edits if not value and end > start)
+
+    def trim(self, start: int, end: int) -> None:
+        """Drop the text outside ``start:end`` (edits there are dropped too)."""
+        self.start = max(self.start, start)
+        self.end = min(self.end, end)
+
+    def render(self) -> str:
+        parts = []
+        position = self.start
+        # Insertions come before a replacement starting at the same offset
+        for start, end, _, value in sorted(self._edits, key=lambda edit: (edit[0], edit[1] > edit[0], edit[2])):
+            if start < position or end > self.end:
+                continue
+            parts.append(self.html[position:start])
+            parts.append(value)
+            position = end
+        parts.append(self.html[position:self.end])
+        return "".join(parts)
+
+class Stage:
+    """
+    A post-processing step.
+
+    ``literals`` are the strings the stage needs to find. The pipeline scans the
+    document once for the literals of all stages and passes each occurrence to
+    ``visit`` as ``(text, start, end)``; ``finish`` then records the stage's edits.
+    Where literals overlap, the longest one at an offset wins.
+    """
+
+    name = "stage"
+    literals: Tuple[str, ...] = ()
+
+    def __init__(self, context: Dict[str, Any]):
+        self.context = context
+
+    def enabled(self) -> bool:
+        return True
+
+    def visit(self, text: str, start: int, end: int) -> None:
+        pass
+
+    def finish(self, document: Document) -> None:
+        pass
+
+class FenceStripStage(Stage):
+    """Remove markdown code fences and the whitespace around the document."""
+
+    name = "fence_strip"
+    literals = ("```html", "```")
+    # Backticks and fences next to each other; removing a "```html" can join
+    # the backticks around it into a fence, so a run is stripped as a whole
+    RUN = re.compile(r"(?:```html|`)*")
+
+    def __init__(self, context: Dict[str, Any]):
+        super().__init__(context)
+        self.fences: List[Tuple[int, int]] = []
+
+    def visit(self, text: str, start: int, end: int) -> None:
+        self.fences.append((start, end))
+
+    def finish(self, document: Document) -> None:
+        html = document.html
+        run_end = 0
+        for start, _ in self.fences:
+            if start < run_end:
+                continue
+            while start > 0 and html[start - 1] == "`":
+                start -= 1
+            run_end = self.RUN.match(html, start).end()
+            document.replace(start, run_end, html[start:run_end].replace("```html", "").replace("```", ""))
+
+        # Strip whitespace from both ends, skipping over removed fences
+        removed = document.removed()
+
+        start = 0
+        for span_start, span_end in removed + [(len(html), len(html))]:
+            while start < span_start and html[start].isspace():
+                start += 1
+            if start < span_start:
+                break
+            start = max(start, span_end)
+
+        end = len(html)
+        for span_start, span_end in reversed([(0, 0)] + removed):
+            while end > span_end and html[end - 1].isspace():
+                end -= 1
+            if end > span_end:
+                break
+            end = min(end, span_start)
+
+        document.trim(start, max(start, end))
+
+class PhotoInjectionStage(Stage):
+    """
+    Put the profile photo into the page.
+
+    Swaps the photo reference the prompt gave the model for the real image, and
+    fills in the placeholder image the fallback prompt asks for. Without either, the
+    photo is added to the first matching container (in order of preference), or
+    before ``</body>``.
+    """
+
+    name = "photo_injection"
+    PLACEHOLDER = 'id="profile-photo-placeholder"'
+    CONTAINERS = (
+        '<div class="profile"',
+        '<div class="about"',
+        '<div class="header"',
+        '<header',
+        '<section',
+        '<div class="container"'
+    )
+    literals = (PHOTO_REFERENCE, PLACEHOLDER, "</body>") + CONTAINERS
+
+    def __init__(self, context: Dict[str, Any]):
+        super().__init__(context)
+        self.references: List[Tuple[int, int]] = []
+        self.placeholders: List[Tuple[int, int]] = []
+        self.containers: Dict[int, int] = {}
+        self.body_close: Optional[int] = None
+
+    def enabled(self) -> bool:
+        return bool(self.context.get("photo_src"))
+
+    def visit(self, text: str, start: int, end: int) -> None:
+        if text == PHOTO_REFERENCE:
+            self.references.append((start, end))
+        elif text == self.PLACEHOLDER:
+            self.placeholders.append((start, end))
+        elif text == "</body>":
+            if self.body_close is None:
+                self.body_close = start
+        else:
+            self.containers.setdefault(self.CONTAINERS.index(text), start)
+
+    def finish(self, document: Document) -> None:
+        photo_src = self.context["photo_src"]
+        for start, end in self.references:
+            document.replace(start, end, photo_src)
+        photo_srcset = self.context.get("photo_srcset")
+        srcset = f' srcset="{photo_srcset}"' if photo_srcset else ""
+        for start, end in self.placeholders:
+            document.replace(start, end, f'id="profile-photo" src="{photo_src}"{srcset}')
+        if self.references or self.placeholders:
+            return
+
+        img_tag = f'<img src="{photo_src}"{srcset} alt="Profile Photo" class="profile-photo" style="{PHOTO_STYLE}">'
+        if self.containers:
+            # After the end of the container's opening tag
+            tag_end = document.html.find(">", self.containers[min(self.containers)])
+            if tag_end >= 0:
+                document.insert(tag_end + 1, img_tag)
+                return
+        if self.body_close is not None:
+            document.insert(self.body_close, img_tag)
+
+class PhotoCssStage(Stage):
+    """Add the profile photo CSS to the first stylesheet unless the page already styles it."""
+
+    name = "photo_css"
+    literals = (".profile-photo", "</style>")
+
+    def __init__(self, context: Dict[str, Any]):
+        super().__init__(context)
+        self.styled = False
+        self.style_close: Optional[int] = None
+
+    def enabled(self) -> bool:
+        return bool(self.context.get("photo_src"))
+
+    def visit(self, text: str, start: int, end: int) -> None:
+        if text == "</style>":
+            if self.style_close is None:
+                self.style_close = start
+        else:
+            self.styled = True
+
+    def finish(self, document: Document) -> None:
+        if not self.styled and self.style_close is not None:
+            document.insert(self.style_close, PHOTO_CSS)
+
+@dataclass
+class PipelineResult:
+    html: str
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+class HtmlPipeline:
+    """
+    Post-processes generated HTML with registered stages in a single pass.
+
+    The literals of the enabled stages are combined into one expression, so the
+    document is scanned once no matter how many stages run. The stages then apply
+    their edits and the result is rendered once. Time spent in each stage is
+    returned with the result and accumulated for the metrics endpoint.
+    """
+
+    def __init__(self, stages: Optional[List[Type[Stage]]] = None):
+        self.stages: List[Type[Stage]] = list(stages or [])
+        self._scanners: Dict[Tuple[Type[Stage], ...], Tuple[Optional["re.Pattern"], Dict[str, List[int]]]] = {}
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def register(self, stage: Type[Stage]) -> None:
+        self.stages.append(stage)
+        self._scanners.clear()
+
+    def run(self, html: str, **context: Any) -> PipelineResult:
+        stages = [stage for stage in (stage_cls(context) for stage_cls in self.stages) if stage.enabled()]
+        timings = {stage.name: 0.0 for stage in stages}
+        document = Document(html)
+
+        started = time.perf_counter()
+        pattern, owners = self._scanner(tuple(type(stage) for stage in stages))
+        matches = list(pattern.finditer(html)) if pattern else []
+        timings["scan"] = time.perf_counter() - started
+
+        for match in matches:
+            text = match.group()
+            for index in owners[text]:
+                stage = stages[index]
+                started = time.perf_counter()
+                stage.visit(text, match.start(), match.end())
+                timings[stage.name] += time.perf_counter() - started
+
+        for stage in stages:
+            started = time.perf_counter()
+            stage.finish(document)
+            timings[stage.name] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        rendered = document.render()
+        timings["render"] = time.perf_counter() - started
+
+        timings_ms = {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+        self._record(timings_ms)
+        logger.debug(f"HTML pipeline timings (ms): {timings_ms}")
+        return PipelineResult(rendered, timings_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                name: {
+                    "runs": int(total["runs"]),
+                    "total_ms": round(total["total_ms"], 3),
+                    "avg_ms": round(total["total_ms"] / total["runs"], 3)
+                }
+                for name, total in self._totals.items()
+            }
+
+    def _scanner(self, stage_types: Tuple[Type[Stage], ...]) -> Tuple[Optional["re.Pattern"], Dict[str, List[int]]]:
+        """The combined expression for a set of stages, and the stages that asked for each literal."""
+        if stage_types not in self._scanners:
+            owners: Dict[str, List[int]] = {}
+            for index, stage in enumerate(stage_types):
+                for literal in stage.literals:
+                    owners.setdefault(literal, []).append(index)
+            # Longest first, so a literal is not shadowed by one of its prefixes
+            literals = sorted(owners, key=len, reverse=True)
+            pattern = re.compile("|".join(re.escape(literal) for literal in literals)) if literals else None
+            self._scanners[stage_types] = (pattern, owners)
+        return self._scanners[stage_types]
+
+    def _record(self, timings_ms: Dict[str, float]) -> None:
+        with self._lock:
+            for name, elapsed in timings_ms.items():
+                total = self._totals.setdefault(name, {"runs": 0, "total_ms": 0.0})
+                total["runs"] += 1
+                total["total_ms"] += elapsed
+
+html_pipeline = HtmlPipeline([FenceStripStage, PhotoInjectionStage, PhotoCssStage])
+
+def postprocess_html(html: str, photo_src: Optional[str] = None, photo_srcset: Optional[str] = None) -> str:
+    """Clean generated HTML and add the uploaded photo, if any."""
+    return html_pipeline.run(html, photo_src=photo_src, photo_srcset=photo_srcset).html
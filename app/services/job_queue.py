@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Union
+
+from app.core.config import settings
+from app.services.website_generator import generate_website
+from app.services.photo_processing import ProcessedPhoto
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+@dataclass
+class GenerationJob:
+    request_id: int
+    website_type: str
+    content: str
+    style: str
+    language: str
+    api_token: str
+    color_palette: Optional[Union[str, Dict[str, str]]] = None
+    photo: Optional[ProcessedPhoto] = None
+    bypass_cache: bool = False
+
+class GenerationJobQueue:
+    """
+    In-process queue of website generations run by a fixed pool of workers.
+
+    Job progress is reported through the AIUserRequest row of each job, so callers
+    poll the database rather than the queue. Jobs are held in memory only; rows of
+    jobs lost on a restart stay in the pending state.
+    """
+
+    def __init__(self, workers: int, max_size: int):
+        self.workers = workers
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._active = 0
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"generation-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} generation workers")
+
+    async def stop(self) -> None:
+        """Cancel the workers. Jobs still queued are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, job: GenerationJob) -> None:
+        """
+        Enqueue a job without waiting.
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Generation queue is full. Please try again later.")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "active": self._active,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_size": self.max_size
+        }
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            self._active += 1
+            try:
+                await generate_website(
+                    website_type=job.website_type,
+                    content=job.content,
+                    style=job.style,
+                    language=job.language,
+                    api_token=job.api_token,
+                    color_palette=job.color_palette,
+                    photo=job.photo,
+                    bypass_cache=job.bypass_cache,
+                    user_request_id=job.request_id
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The failure is already recorded on the job's AIUserRequest row
+                logger.error(f"Generation job {job.request_id} failed: {str(e)}")
+            finally:
+                self._active -= 1
+                self._queue.task_done()
+
+generation_queue = GenerationJobQueue(
+    workers=settings.GENERATION_WORKERS,
+    max_size=settings.GENERATION_QUEUE_SIZE
+)
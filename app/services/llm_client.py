@@ -0,0 +1,128 @@
+import json
+import logging
+import httpx
+from typing import Optional, Dict, Any, AsyncIterator
+
+from app.core.config import settings
+from app.services.retry_scheduler import RetryScheduler
+
+logger = logging.getLogger(__name__)
+
+def _http2_available() -> bool:
+    """Check whether the optional h2 package needed for HTTP/2 is installed."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class OpenRouterClient:
+    """
+    Async client for the OpenRouter chat completions API.
+
+    A single instance is shared by the whole process so every generation reuses
+    the same keep-alive connection pool instead of opening a new connection
+    (and TLS handshake) per request.
+    """
+
+    def __init__(self, api_url: Optional[str] = None, scheduler: Optional[RetryScheduler] = None):
+        self.api_url = api_url or settings.OPENROUTER_API_URL
+        self.scheduler = scheduler or RetryScheduler(
+            max_retries=settings.LLM_MAX_RETRIES,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+            deadline=settings.LLM_REQUEST_DEADLINE
+        )
+
+        http2 = settings.LLM_HTTP2 and _http2_available()
+        if settings.LLM_HTTP2 and not http2:
+            logger.info("h2 package not installed, OpenRouter client will use HTTP/1.1")
+
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(
+                connect=settings.LLM_CONNECT_TIMEOUT,
+                read=settings.LLM_READ_TIMEOUT,
+                write=settings.LLM_WRITE_TIMEOUT,
+                pool=settings.LLM_POOL_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+            )
+        )
+
+    def _headers(self, api_token: str) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json"
+        }
+
+    async def stream_chat_completion(self, api_token: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Send a streaming chat completion request and yield content deltas as they arrive.
+
+        The payload should set ``"stream": True``. OpenRouter answers with server-sent
+        events; keep-alive comments and empty deltas are skipped. Rate-limited and
+        transient gateway errors returned before the stream starts are retried by
+        the scheduler.
+
+        Raises:
+            RateLimitError: If the token stays rate limited past the request deadline
+            httpx.HTTPError: On connection errors, timeouts or non-2xx responses
+        """
+        response = await self.scheduler.run(api_token, lambda: self._open_stream(api_token, payload))
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed stream chunk: {data[:200]}")
+                    continue
+
+                if "error" in chunk:
+                    raise Exception(chunk["error"].get("message", "Stream returned an error"))
+
+                choices = chunk.get("choices") or []
+                if choices:
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
+        finally:
+            await response.aclose()
+
+    async def _open_stream(self, api_token: str, payload: Dict[str, Any]) -> httpx.Response:
+        request = self._client.build_request("POST", self.api_url, headers=self._headers(api_token), json=payload)
+        response = await self._client.send(request, stream=True)
+        if response.is_error:
+            # Read the body so the error text is available to the caller
+            await response.aread()
+            await response.aclose()
+        response.raise_for_status()
+        return response
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+_client: Optional[OpenRouterClient] = None
+
+def get_llm_client() -> OpenRouterClient:
+    """Return the process-wide OpenRouter client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = OpenRouterClient()
+    return _client
+
+async def close_llm_client() -> None:
+    """Close the shared client and release its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
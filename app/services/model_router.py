@@ -0,0 +1,299 @@
+import time
+import asyncio
+import logging
+import httpx
+from collections import deque
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+
+from app.core.config import settings
+from app.services.llm_client import OpenRouterClient, get_llm_client
+from app.services.spans import record_first_token
+
+logger = logging.getLogger(__name__)
+
+# Errors that will not go away by asking another model with the same token
+NO_FAILOVER_STATUS_CODES = {400, 401, 402, 403}
+
+class LatencyStats:
+    """Rolling window of time-to-first-token and total latency samples for one model."""
+
+    def __init__(self, window: int = 200):
+        self.ttft_ms: deque = deque(maxlen=window)
+        self.total_ms: deque = deque(maxlen=window)
+        self.launched = 0
+        self.wins = 0
+        self.failures = 0
+
+    @staticmethod
+    def quantile(samples: deque, q: float) -> Optional[float]:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self.ttft_ms),
+            "launched": self.launched,
+            "wins": self.wins,
+            "failures": self.failures,
+            "ttft_p50_ms": self.quantile(self.ttft_ms, 0.5),
+            "ttft_p95_ms": self.quantile(self.ttft_ms, 0.95),
+            "total_p50_ms": self.quantile(self.total_ms, 0.5),
+            "total_p95_ms": self.quantile(self.total_ms, 0.95)
+        }
+
+class _Attempt:
+    """One streaming request to one model, pumped into a queue by a background task."""
+
+    def __init__(self, router: "ModelRouter", model: str, api_token: str, payload: Dict[str, Any]):
+        self.router = router
+        self.model = model
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.parts: List[str] = []
+        self.task = asyncio.create_task(self._pump(api_token, {**payload, "model": model, "stream": True}))
+        router.stats_for(model).launched += 1
+
+    async def _pump(self, api_token: str, payload: Dict[str, Any]) -> None:
+        try:
+            async for delta in self.router.client.stream_chat_completion(api_token, payload):
+                if self.first_token_at is None:
+                    self.first_token_at = time.monotonic()
+                    self.router.stats_for(self.model).ttft_ms.append((self.first_token_at - self.started) * 1000)
+                    record_first_token()
+                self.parts.append(delta)
+                await self.queue.put(("delta", delta))
+            if not self.parts:
+                raise Exception("API response did not contain any content")
+            self.router.stats_for(self.model).total_ms.append((time.monotonic() - self.started) * 1000)
+            await self.queue.put(("end", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.router.stats_for(self.model).failures += 1
+            await self.queue.put(("error", e))
+
+    def cancel(self) -> None:
+        if not self.task.done() and not self.task.cancelling():
+            if self.first_token_at is None:
+                # A censored sample: the model had not answered after this long
+                self.router.stats_for(self.model).ttft_ms.append((time.monotonic() - self.started) * 1000)
+            self.task.cancel()
+
+class ModelRouter:
+    """
+    Sends completions to an ordered list of models with hedging.
+
+    The primary model is tried first. If it has not produced a first token within
+    the hedge delay, the request is also launched on the next model, and so on.
+    The hedge delay for each model follows a high quantile of its observed
+    time-to-first-token, so hedges only fire for requests in the latency tail.
+    A model that fails outright is replaced by the next one immediately.
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        client: Optional[OpenRouterClient] = None,
+        default_delay_ms: int = 8000,
+        quantile: float = 0.95,
+        min_delay_ms: int = 1000,
+        max_delay_ms: int = 30000,
+        min_samples: int = 20
+    ):
+        self.models = models
+        self._client = client
+        self.default_delay_ms = default_delay_ms
+        self.quantile = quantile
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.min_samples = min_samples
+        self.hedges = 0
+        self._stats: Dict[str, LatencyStats] = {}
+
+    @property
+    def client(self) -> OpenRouterClient:
+        return self._client or get_llm_client()
+
+    def stats_for(self, model: str) -> LatencyStats:
+        if model not in self._stats:
+            self._stats[model] = LatencyStats()
+        return self._stats[model]
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait for a first token from ``model`` before hedging."""
+        samples = self.stats_for(model).ttft_ms
+        if len(samples) < self.min_samples:
+            delay_ms = self.default_delay_ms
+        else:
+            delay_ms = LatencyStats.quantile(samples, self.quantile)
+        return min(self.max_delay_ms, max(self.min_delay_ms, delay_ms)) / 1000
+
+    def model_order(self, primary: Optional[str]) -> List[str]:
+        if not primary:
+            return list(self.models)
+        return [primary] + [model for model in self.models if model != primary]
+
+    async def complete(self, api_token: str, payload: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Get a full completion, returning whichever launched model finishes first.
+
+        Returns:
+            tuple: The completion content and the model that produced it
+        """
+        models = self.model_order(payload.get("model"))
+        attempts: List[_Attempt] = []
+        getters: Dict[asyncio.Task, _Attempt] = {}
+        last_error: Optional[Exception] = None
+
+        def launch() -> None:
+            attempt = _Attempt(self, models[len(attempts)], api_token, payload)
+            attempts.append(attempt)
+            getters[asyncio.create_task(self._until_finished(attempt))] = attempt
+
+        try:
+            launch()
+            while getters:
+                timeout = None
+                if len(attempts) < len(models) and all(a.first_token_at is None for a in attempts):
+                    timeout = self.hedge_delay(attempts[-1].model)
+
+                done, _ = await asyncio.wait(getters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._hedge(attempts[-1], models[len(attempts)])
+                    launch()
+                    continue
+
+                for getter in done:
+                    attempt = getters.pop(getter)
+                    kind, value = getter.result()
+                    if kind == "end":
+                        self._win(attempt)
+                        return "".join(attempt.parts), attempt.model
+                    last_error = value
+                    if not self._can_fail_over(value):
+                        raise value
+                    logger.warning(f"Model {attempt.model} failed: {value}")
+
+                if not getters and len(attempts) < len(models):
+                    launch()
+
+            raise last_error or Exception("No models configured")
+        finally:
+            for getter in getters:
+                getter.cancel()
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def stream(self, api_token: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Stream a completion from whichever launched model produces a first token first.
+
+        Once a model has started answering, the other attempts are cancelled and the
+        rest of the stream comes from that model.
+        """
+        models = self.model_order(payload.get("model"))
+        attempts: List[_Attempt] = []
+        getters: Dict[asyncio.Task, _Attempt] = {}
+        last_error: Optional[Exception] = None
+        winner: Optional[_Attempt] = None
+        first_delta = None
+
+        def launch() -> None:
+            attempt = _Attempt(self, models[len(attempts)], api_token, payload)
+            attempts.append(attempt)
+            getters[asyncio.create_task(attempt.queue.get())] = attempt
+
+        try:
+            launch()
+            while getters and winner is None:
+                timeout = self.hedge_delay(attempts[-1].model) if len(attempts) < len(models) else None
+                done, _ = await asyncio.wait(getters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._hedge(attempts[-1], models[len(attempts)])
+                    launch()
+                    continue
+
+                for getter in done:
+                    attempt = getters.pop(getter)
+                    kind, value = getter.result()
+                    if kind == "delta" and winner is None:
+                        winner, first_delta = attempt, value
+                    elif kind == "error":
+                        last_error = value
+                        if not self._can_fail_over(value):
+                            raise value
+                        logger.warning(f"Model {attempt.model} failed: {value}")
+
+                if winner is None and not getters and len(attempts) < len(models):
+                    launch()
+
+            if winner is None:
+                raise last_error or Exception("No models configured")
+
+            for getter in getters:
+                getter.cancel()
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+
+            yield first_delta
+            while True:
+                kind, value = await winner.queue.get()
+                if kind == "delta":
+                    yield value
+                elif kind == "end":
+                    self._win(winner)
+                    return
+                else:
+                    raise value
+        finally:
+            for getter in getters:
+                getter.cancel()
+            for attempt in attempts:
+                attempt.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": self.models,
+            "hedges": self.hedges,
+            "per_model": {
+                model: {**stats.summary(), "hedge_delay_ms": int(self.hedge_delay(model) * 1000)}
+                for model, stats in self._stats.items()
+            }
+        }
+
+    @staticmethod
+    async def _until_finished(attempt: _Attempt) -> Tuple[str, Any]:
+        """Drain an attempt's queue until it ends or fails."""
+        while True:
+            kind, value = await attempt.queue.get()
+            if kind != "delta":
+                return kind, value
+
+    @staticmethod
+    def _can_fail_over(error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code not in NO_FAILOVER_STATUS_CODES
+        return True
+
+    def _hedge(self, slow: _Attempt, model: str) -> None:
+        self.hedges += 1
+        logger.info(
+            f"No first token from {slow.model} after {time.monotonic() - slow.started:.1f}s, hedging with {model}"
+        )
+
+    def _win(self, attempt: _Attempt) -> None:
+        self.stats_for(attempt.model).wins += 1
+
+model_router = ModelRouter(
+    models=settings.LLM_MODELS,
+    default_delay_ms=settings.LLM_HEDGE_DELAY_MS,
+    quantile=settings.LLM_HEDGE_QUANTILE,
+    min_delay_ms=settings.LLM_HEDGE_MIN_DELAY_MS,
+    max_delay_ms=settings.LLM_HEDGE_MAX_DELAY_MS,
+    min_samples=settings.LLM_HEDGE_MIN_SAMPLES
+)
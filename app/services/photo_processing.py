@@ -0,0 +1,177 @@
+import io
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Tuple, Union, BinaryIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from app.core.config import settings
+from app.core.uploads import upload_stats
+from app.services.asset_store import asset_store
+
+logger = logging.getLogger(__name__)
+
+# Formats accepted for uploaded photos, as detected by Pillow (not the declared type)
+ACCEPTED_FORMATS = {"JPEG", "PNG", "WEBP", "GIF", "BMP", "TIFF", "MPO"}
+
+class PhotoProcessingError(Exception):
+    """Raised when an uploaded photo is not a usable image."""
+
+class PhotoTooLargeError(PhotoProcessingError):
+    """Raised when an uploaded photo exceeds the size limits."""
+
+@dataclass
+class ProcessedPhoto:
+    """An uploaded photo stored as display-size variants in the asset store."""
+    url: str
+    url_2x: str
+    content_type: str
+    width: int
+    height: int
+    source_format: str
+    source_bytes: int
+    stored_bytes: int
+
+    @property
+    def srcset(self) -> Optional[str]:
+        if self.url_2x == self.url:
+            return None
+        return f"{self.url} 1x, {self.url_2x} 2x"
+
+# Photos already processed, by SHA-256 of the uploaded file, so re-uploads are skipped
+_processed: "OrderedDict[str, ProcessedPhoto]" = OrderedDict()
+_processed_lock = threading.Lock()
+
+def process_photo(
+    source: Union[bytes, BinaryIO],
+    size: Optional[int] = None,
+    sha256: Optional[str] = None
+) -> ProcessedPhoto:
+    """
+    Turn an uploaded photo into web-ready variants and store them.
+
+    The real format is detected from the file contents. The photo is scaled down
+    to the display width the templates use (PHOTO_DISPLAY_WIDTH) and twice that
+    for high-density screens, and re-encoded as WebP (JPEG where Pillow lacks
+    WebP support; PNG for transparent images then).
+
+    Args:
+        source: The uploaded file, as bytes or a file object positioned at its start
+        size (int, optional): Size of ``source`` in bytes when it is a file object
+        sha256 (str, optional): Hash of the upload; a photo seen before is not processed again
+
+    Raises:
+        PhotoTooLargeError: If the file or its pixel count is over the limit
+        PhotoProcessingError: If the data is not an accepted image
+    """
+    if isinstance(source, bytes):
+        size = len(source)
+        source = io.BytesIO(source)
+    if size is not None and size > settings.PHOTO_MAX_UPLOAD_BYTES:
+        raise PhotoTooLargeError(
+            f"Photo is too large ({size} bytes, the limit is {settings.PHOTO_MAX_UPLOAD_BYTES})"
+        )
+
+    if sha256:
+        photo = _seen_photo(sha256)
+        if photo is not None:
+            upload_stats.record("duplicates")
+            logger.info(f"Photo {sha256[:12]} was processed before, reusing its assets")
+            return photo
+
+    try:
+        image = Image.open(source)
+    except Image.DecompressionBombError as e:
+        # Pillow refuses images declaring more than twice its MAX_IMAGE_PIXELS outright
+        raise PhotoTooLargeError(f"Photo is too large ({str(e)})")
+    except (UnidentifiedImageError, OSError):
+        raise PhotoProcessingError("Photo is not a supported image")
+
+    if image.format not in ACCEPTED_FORMATS:
+        raise PhotoProcessingError(f"Unsupported photo format: {image.format}")
+    if image.width * image.height > settings.PHOTO_MAX_PIXELS:
+        raise PhotoTooLargeError(f"Photo is too large ({image.width}x{image.height} pixels)")
+
+    source_format = image.format
+    display_width = settings.PHOTO_DISPLAY_WIDTH
+    try:
+        # Let JPEG decode at a reduced scale instead of decoding every pixel. Both
+        # sides are kept at least 2x the display width, as EXIF may rotate the image.
+        image.draft("RGB", (display_width * 2, display_width * 2))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise PhotoProcessingError(f"Photo could not be decoded: {str(e)}")
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    scaled_1x = _scaled(image, display_width)
+    variant_1x, extension, content_type = _encode(scaled_1x, has_alpha)
+    variant_2x = variant_1x
+    if image.width > display_width:
+        variant_2x, _, _ = _encode(_scaled(image, display_width * 2), has_alpha)
+
+    id_1x = asset_store.put(variant_1x, extension)
+    id_2x = asset_store.put(variant_2x, extension)
+
+    photo = ProcessedPhoto(
+        url=asset_store.url(id_1x),
+        url_2x=asset_store.url(id_2x),
+        content_type=content_type,
+        width=scaled_1x.width,
+        height=scaled_1x.height,
+        source_format=source_format,
+        source_bytes=size or 0,
+        stored_bytes=len(variant_1x) + (len(variant_2x) if id_2x != id_1x else 0)
+    )
+    logger.info(
+        f"Processed {source_format} photo: {photo.source_bytes} bytes -> "
+        f"{photo.stored_bytes} bytes as {content_type}"
+    )
+
+    if sha256:
+        with _processed_lock:
+            _processed[sha256] = photo
+            while len(_processed) > settings.PHOTO_DEDUPE_ENTRIES:
+                _processed.popitem(last=False)
+    return photo
+
+def _seen_photo(sha256: str) -> Optional[ProcessedPhoto]:
+    with _processed_lock:
+        photo = _processed.get(sha256)
+        if photo is None:
+            return None
+        _processed.move_to_end(sha256)
+
+    # The assets may have been removed from the store since
+    for url in (photo.url, photo.url_2x):
+        if asset_store.path(url.rsplit("/", 1)[1]) is None:
+            return None
+    return photo
+
+def _scaled(image: Image.Image, width: int) -> Image.Image:
+    """Scale down to ``width`` keeping the aspect ratio; smaller images are kept as they are."""
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+def _encode(image: Image.Image, has_alpha: bool) -> Tuple[bytes, str, str]:
+    output = io.BytesIO()
+    if features.check("webp"):
+        image.save(output, "WEBP", quality=settings.PHOTO_QUALITY, method=4)
+        return output.getvalue(), "webp", "image/webp"
+    if has_alpha:
+        image.save(output, "PNG", optimize=True)
+        return output.getvalue(), "png", "image/png"
+    image.save(output, "JPEG", quality=settings.PHOTO_QUALITY, optimize=True, progressive=True)
+    return output.getvalue(), "jpg", "image/jpeg"
+
+def photo_context(photo: Optional[ProcessedPhoto]) -> Dict[str, Any]:
+    """Post-processing context for placing ``photo`` in generated HTML."""
+    if photo is None:
+        return {}
+    return {"photo_src": photo.url, "photo_srcset": photo.srcset}
@@ -0,0 +1,130 @@
+import re
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Runs of letters, groups of up to three digits, and single other characters
+_TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d{1,3}|\S")
+
+# Tokens added per chat message for the role and delimiters
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate the number of model tokens in ``text``.
+
+    Words count one token per five letters (rounded up), numbers one per three
+    digits and punctuation one per character, which is close to what BPE
+    tokenizers produce for English and Indonesian prose.
+    """
+    tokens = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        length = match.end() - match.start()
+        tokens += (length + 4) // 5 if match.group()[0].isalpha() else 1
+    return tokens
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+def prompt_budget() -> int:
+    """Most prompt tokens a request may use, leaving room for the output in the model context."""
+    return min(settings.LLM_MAX_PROMPT_TOKENS, settings.LLM_CONTEXT_TOKENS - settings.LLM_MAX_OUTPUT_TOKENS)
+
+def collapse_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines, keeping paragraph breaks."""
+    lines = [re.sub(r"[ \t\f\v]+", " ", line).strip() for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def dedupe_sections(text: str) -> str:
+    """Drop paragraphs that repeat an earlier one (ignoring case and spacing), and repeated lines in a row."""
+    seen = set()
+    sections = []
+    for section in re.split(r"\n\s*\n", text):
+        key = " ".join(section.lower().split())
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        lines = []
+        for line in section.split("\n"):
+            if not lines or line.strip().lower() != lines[-1].strip().lower():
+                lines.append(line)
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+# Whole lines that carry nothing the model needs
+_BOILERPLATE_PATTERN = re.compile(
+    r"(?:"
+    r"page\s+\d+(?:\s*(?:of|/)\s*\d+)?"
+    r"|[-=_*~#.\s]{3,}"
+    r"|references?\s+(?:are\s+)?available\s+(?:up)?on\s+request\.?"
+    r"|(?:curriculum\s+vitae|resume|résumé|cv)\s*:?"
+    r"|sent\s+from\s+my\s+.*"
+    r"|(?:this|the)\s+(?:e-?mail|message|document)\s+(?:and\s+any\s+attachments\s+)?(?:is|are|may\s+be)\s+confidential.*"
+    r")",
+    re.IGNORECASE
+)
+
+def trim_boilerplate(text: str) -> str:
+    """Remove page numbers, separator lines, "references on request" and similar filler lines."""
+    lines = [line for line in text.split("\n") if not _BOILERPLATE_PATTERN.fullmatch(line.strip())]
+    return collapse_whitespace("\n".join(lines))
+
+# Compaction steps, from least to most invasive
+COMPACTION_STEPS: Tuple[Tuple[str, Callable[[str], str]], ...] = (
+    ("whitespace", collapse_whitespace),
+    ("dedupe", dedupe_sections),
+    ("boilerplate", trim_boilerplate)
+)
+
+@dataclass
+class BudgetResult:
+    """Messages fitted to the token budget, with the counts before and after compaction."""
+    messages: List[Dict[str, str]]
+    content: str
+    budget: int
+    tokens_before: int
+    tokens_after: int
+    steps: List[str] = field(default_factory=list)
+
+    @property
+    def fits(self) -> bool:
+        return self.tokens_after <= self.budget
+
+def fit_to_budget(
+    build: Callable[[str], List[Dict[str, str]]],
+    content: str,
+    budget: int
+) -> BudgetResult:
+    """
+    Build the messages for ``content``, compacting it as far as needed to fit ``budget``.
+
+    ``build`` resolves the messages for a version of the user content. Prompts
+    within the budget are left as they are; otherwise the compaction steps are
+    applied one after another until the messages fit or the steps run out. The
+    caller decides what to do with a prompt that still does not fit.
+    """
+    messages = build(content)
+    tokens_before = count_message_tokens(messages)
+    result = BudgetResult(messages, content, budget, tokens_before, tokens_before)
+
+    for name, step in COMPACTION_STEPS:
+        if result.fits:
+            break
+        compacted = step(result.content)
+        if compacted == result.content:
+            continue
+        result.content = compacted
+        result.messages = build(compacted)
+        result.tokens_after = count_message_tokens(result.messages)
+        result.steps.append(name)
+
+    if result.steps:
+        logger.info(
+            f"Compacted user content ({', '.join(result.steps)}): ~{result.tokens_before} -> "
+            f"~{result.tokens_after} tokens, budget {budget}"
+        )
+    return result
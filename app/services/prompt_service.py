@@ -1,10 +1,18 @@
 from typing import Dict, List, Any, Optional
 import re
 import json
+import logging
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.crud import ai_templates
 from app.schemas.ai_templates import UserRequestCreate
+from app.services.audit_sink import audit_sink
+from app.services.spans import span
+from app.utils.keyword_index import KeywordIndex
+from app.utils.prompt_template import compile_prompt
+
+logger = logging.getLogger(__name__)
 
 class PromptService:
     def __init__(self, db: Session):
@@ -12,7 +20,7 @@ class PromptService:
     
     def get_template_prompts(self, template_type: str) -> Dict[str, Any]:
         """Get prompts and placeholders for a specific template type."""
-        template_data = ai_templates.get_complete_template(self.db, template_type)
+        template_data = ai_templates.get_cached_template(self.db, template_type)
         if not template_data:
             return {
                 "success": False,
@@ -25,12 +33,22 @@ class PromptService:
             "template": template_data["template"],
             "system_prompts": template_data["system_prompts"],
             "user_prompts": template_data["user_prompts"],
-            "available_placeholders": template_data["available_placeholders"]
+            "available_placeholders": template_data["available_placeholders"],
+            "compiled_prompts": template_data["compiled_prompts"],
+            "slots": template_data["slots"],
+            "unknown_placeholders": template_data["unknown_placeholders"],
+            "keyword_index": template_data["keyword_index"]
         }
     
-    def extract_placeholders(self, user_input: str, template_type: str) -> Dict[str, Any]:
+    def extract_placeholders(
+        self,
+        user_input: str,
+        template_type: str,
+        template_data: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """Extract placeholder values from user input based on template type."""
-        template_data = ai_templates.get_complete_template(self.db, template_type)
+        if template_data is None:
+            template_data = ai_templates.get_cached_template(self.db, template_type)
         if not template_data:
             return {}
         
@@ -40,85 +58,91 @@ class PromptService:
         # Always include the user input as a placeholder
         extracted_data["{{user_input}}"] = user_input
         
-        # Extract other placeholders based on some logic
-        # This is a simplified version - in a real app, you might use NLP or other techniques
+        # Use default values where provided
         for placeholder in placeholders:
             key = placeholder["key"]
-            if key != "{{user_input}}":  # Skip user_input as we already set it
-                # Use default value if provided
-                if placeholder["default_value"]:
-                    extracted_data[key] = placeholder["default_value"]
-                
-                # Simple keyword extraction (this is very basic)
-                # In a real app, you'd use more sophisticated techniques
-                keyword = key.strip("{{}}").lower()
-                if keyword in user_input.lower():
-                    # Extract a value based on keyword position
-                    # This is just a placeholder for real extraction logic
-                    words = user_input.lower().split()
-                    if keyword in words:
-                        idx = words.index(keyword)
-                        if idx + 1 < len(words):
-                            extracted_data[key] = words[idx + 1]
+            if key != "{{user_input}}" and placeholder["default_value"]:  # user_input is already set
+                extracted_data[key] = placeholder["default_value"]
+        
+        # Simple keyword extraction: the word following a placeholder's keyword becomes
+        # its value. All keywords are matched in a single pass over the input.
+        # In a real app, you'd use more sophisticated techniques
+        keyword_index = template_data.get("keyword_index")
+        if keyword_index is None:
+            keyword_index = KeywordIndex(p for p in placeholders if p["key"] != "{{user_input}}")
+        extracted_data.update(keyword_index.extract(user_input))
         
         return extracted_data
     
     def replace_placeholders(self, prompt: str, placeholder_values: Dict[str, Any]) -> str:
         """Replace placeholders in a prompt with actual values."""
-        result = prompt
-        for key, value in placeholder_values.items():
-            result = result.replace(key, str(value))
-        return result
+        return compile_prompt(prompt).render(placeholder_values)
     
-    def process_user_request(self, user_request: UserRequestCreate) -> Dict[str, Any]:
-        """Process a user request by extracting placeholders and resolving prompts."""
-        # Get the template
-        template = ai_templates.get_template(self.db, user_request.template_id)
-        if not template:
-            return {
-                "success": False,
-                "message": f"Template with ID {user_request.template_id} not found"
-            }
+    def resolve_prompts(
+        self,
+        template_data: Dict[str, Any],
+        placeholder_values: Dict[str, Any]
+    ) -> Dict[str, List[str]]:
+        """Render the template's compiled system and user prompts with placeholder values."""
+        compiled = template_data["compiled_prompts"]
+        missing = [slot for slot in template_data["slots"] if slot not in placeholder_values]
+        if missing:
+            logger.debug(f"No values for placeholders {missing}; they are left in the prompts")
+        return {
+            "system": [prompt.render(placeholder_values) for prompt in compiled["system"]],
+            "user": [prompt.render(placeholder_values) for prompt in compiled["user"]]
+        }
+    
+    def process_user_request(
+        self,
+        user_request: UserRequestCreate,
+        template_data: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Process a user request by extracting placeholders and resolving prompts.
         
-        # Get template data
-        template_data = ai_templates.get_complete_template(self.db, template.type)
-        if not template_data:
-            return {
-                "success": False,
-                "message": f"Failed to get complete template data for {template.type}"
-            }
+        ``template_data`` can be passed when the caller already loaded the complete
+        template for the request, e.g. for a batch of requests of the same type.
+        """
+        if template_data is None:
+            # Get the complete template for the template's type
+            template_data = ai_templates.get_cached_template_by_id(self.db, user_request.template_id)
+            if not template_data:
+                return {
+                    "success": False,
+                    "message": f"Template with ID {user_request.template_id} not found"
+                }
+        template = template_data["template"]
         
         # Extract placeholders
-        extracted_data = self.extract_placeholders(user_request.user_input, template.type)
+        with span("placeholder_extraction"):
+            extracted_data = self.extract_placeholders(user_request.user_input, template.type, template_data)
         
         # Resolve prompts
-        resolved_prompts = {
-            "system": [],
-            "user": []
-        }
-        
-        # Replace placeholders in system prompts
-        for prompt in template_data["system_prompts"]:
-            resolved_prompt = self.replace_placeholders(prompt, extracted_data)
-            resolved_prompts["system"].append(resolved_prompt)
+        resolved_prompts = self.resolve_prompts(template_data, extracted_data)
         
-        # Replace placeholders in user prompts
-        for prompt in template_data["user_prompts"]:
-            resolved_prompt = self.replace_placeholders(prompt, extracted_data)
-            resolved_prompts["user"].append(resolved_prompt)
+        # The template's prompt texts are stored once; the request only references them
+        prompt_templates = None
+        if settings.PROMPT_REFS_ENABLED and ai_templates.prompt_refs_supported(self.db):
+            prompt_templates = {
+                "system": template_data["system_prompts"],
+                "user": template_data["user_prompts"]
+            }
         
-        # Create user request record
-        db_user_request = ai_templates.create_user_request(
-            self.db, 
-            user_request, 
-            extracted_data, 
-            resolved_prompts
-        )
+        # Record the user request (written to the database in the background)
+        with span("persistence"):
+            request_id = audit_sink.record_request(
+                self.db, 
+                user_request, 
+                extracted_data, 
+                resolved_prompts,
+                prompt_templates
+            )
         
         return {
             "success": True,
             "message": "User request processed successfully",
-            "request_id": db_user_request.id,
+            "request_id": request_id,
             "prompts": resolved_prompts,
             "placeholders": extracted_data
         }
\ No newline at end of file
@@ -0,0 +1,66 @@
+import json
+from typing import Dict, List, Iterator
+
+from sqlalchemy.orm import Session
+
+from app.crud import ai_templates
+from app.models.ai_templates import AIUserRequest, PromptRole
+from app.utils.prompt_refs import ROLES, compact
+
+def compact_user_requests(db: Session, batch_size: int = 500, dry_run: bool = False) -> Iterator[Dict[str, int]]:
+    """
+    Replace the inline resolved_prompts of existing user requests by prompt references.
+
+    Works through the rows in ID order, committing every ``batch_size`` rows, and
+    yields the running totals after each batch. Rows whose prompts cannot be
+    represented are left as they are. Needs a nullable resolved_prompts column
+    (see ai_templates.prompt_refs_supported).
+    """
+    totals = {"rows": 0, "compacted": 0, "skipped": 0, "inline_bytes": 0, "new_blob_bytes": 0}
+    candidates_by_template: Dict[int, Dict[str, List[str]]] = {}
+    last_id = 0
+
+    while True:
+        rows = db.query(AIUserRequest).filter(
+            AIUserRequest.id > last_id,
+            AIUserRequest.prompt_refs.is_(None),
+            AIUserRequest.resolved_prompts.isnot(None)
+        ).order_by(AIUserRequest.id).limit(batch_size).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+
+        blobs: Dict[str, str] = {}
+        for row in rows:
+            totals["rows"] += 1
+            if row.template_id not in candidates_by_template:
+                candidates_by_template[row.template_id] = _template_prompts(db, row.template_id)
+            compacted = compact(row.resolved_prompts, row.extracted_data, candidates_by_template[row.template_id])
+            if compacted is None:
+                totals["skipped"] += 1
+                continue
+            refs, row_blobs = compacted
+            totals["compacted"] += 1
+            totals["inline_bytes"] += len(json.dumps(row.resolved_prompts))
+            blobs.update(row_blobs)
+            row.prompt_refs = refs
+            row.resolved_prompts = None
+
+        new_blobs = ai_templates.missing_prompt_blobs(db, blobs)
+        totals["new_blob_bytes"] += sum(len(text.encode("utf-8")) for text in new_blobs.values())
+        if dry_run:
+            db.rollback()
+        else:
+            ai_templates.store_prompt_blobs(db, new_blobs)
+            db.commit()
+        db.expunge_all()
+        yield dict(totals)
+
+def _template_prompts(db: Session, template_id: int) -> Dict[str, List[str]]:
+    """Every prompt text of a template, by role."""
+    prompts = {role: [] for role in ROLES}
+    for config in ai_templates.get_prompt_configs(db, template_id):
+        role = config.role.value if isinstance(config.role, PromptRole) else config.role
+        if role in prompts:
+            prompts[role].append(config.prompt_content)
+    return prompts
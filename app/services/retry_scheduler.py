@@ -0,0 +1,202 @@
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import httpx
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+# Status codes that indicate a transient condition worth retrying
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+class RateLimitError(Exception):
+    """Raised when a request cannot be made within its deadline because of rate limiting."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Return the delay in seconds requested by a Retry-After header, if any."""
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Convert a rate-limit reset header into an absolute wall-clock time.
+
+    Providers send either an epoch timestamp (OpenRouter uses milliseconds) or a
+    number of seconds until the window resets.
+    """
+    if not value:
+        return None
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    if reset > 1e12:
+        return reset / 1000
+    if reset > 1e9:
+        return reset
+    return time.time() + reset
+
+class QuotaTracker:
+    """Tracks the remaining request quota reported for each API token."""
+
+    def __init__(self, max_tokens: int = 10000):
+        self.max_tokens = max_tokens
+        self._quotas: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _key(api_token: str) -> str:
+        return hashlib.sha256(api_token.encode("utf-8")).hexdigest()[:16]
+
+    def update(self, api_token: str, headers: httpx.Headers) -> None:
+        """Record the quota reported in the rate-limit headers of a response."""
+        remaining = headers.get("x-ratelimit-remaining")
+        if remaining is None:
+            return
+        try:
+            remaining_count = int(float(remaining))
+        except ValueError:
+            return
+
+        if len(self._quotas) >= self.max_tokens:
+            self._prune()
+
+        limit = headers.get("x-ratelimit-limit")
+        self._quotas[self._key(api_token)] = {
+            "remaining": remaining_count,
+            "limit": int(float(limit)) if limit and limit.replace(".", "", 1).isdigit() else None,
+            "reset_at": parse_reset(headers.get("x-ratelimit-reset")),
+            "updated_at": time.time()
+        }
+
+    def exhausted(self, api_token: str, until: Optional[float] = None) -> None:
+        """Mark a token as out of quota, e.g. after a 429 response."""
+        quota = self._quotas.setdefault(self._key(api_token), {"limit": None})
+        quota["remaining"] = 0
+        quota["reset_at"] = until
+        quota["updated_at"] = time.time()
+
+    def wait_time(self, api_token: str) -> float:
+        """Seconds to wait before the token has quota again (0 if it can be used now)."""
+        quota = self._quotas.get(self._key(api_token))
+        if not quota or quota.get("remaining", 1) > 0 or not quota.get("reset_at"):
+            return 0.0
+        return max(0.0, quota["reset_at"] - time.time())
+
+    def stats(self) -> Dict[str, Any]:
+        return {key: dict(quota) for key, quota in self._quotas.items()}
+
+    def _prune(self) -> None:
+        """Drop quotas whose window has already reset, or the oldest half if none have."""
+        now = time.time()
+        expired = [key for key, quota in self._quotas.items() if (quota.get("reset_at") or 0) < now]
+        if not expired:
+            ordered = sorted(self._quotas, key=lambda key: self._quotas[key]["updated_at"])
+            expired = ordered[:len(ordered) // 2]
+        for key in expired:
+            del self._quotas[key]
+
+class RetryScheduler:
+    """
+    Runs API calls with rate-limit-aware retries inside a per-request deadline.
+
+    Calls are paced using the quota tracked for their token; 429 and 5xx gateway
+    responses are retried after the delay given by Retry-After, or after a jittered
+    exponential backoff when the server does not say how long to wait.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        deadline: float = 240.0
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.quota = QuotaTracker()
+        self.retries = 0
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given attempt number."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, api_token: str, call: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        Run ``call`` until it succeeds, a non-retryable error occurs, or the deadline passes.
+
+        ``call`` must return the successful response and raise httpx.HTTPStatusError
+        for error responses.
+
+        Raises:
+            RateLimitError: If the token stays rate limited past the deadline
+            httpx.HTTPError: For non-retryable failures or when retries are exhausted
+        """
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+
+        while True:
+            # Proactively wait for the quota window to reset instead of provoking a 429
+            wait = self.quota.wait_time(api_token)
+            if wait > 0:
+                if time.monotonic() + wait > deadline_at:
+                    raise RateLimitError(
+                        "Rate limit exceeded. Please try again in a few minutes.", retry_after=wait
+                    )
+                logger.info(f"Quota exhausted, waiting {wait:.1f}s for the rate limit window to reset")
+                await asyncio.sleep(wait)
+
+            try:
+                response = await call()
+            except httpx.HTTPStatusError as e:
+                status_code = e.response.status_code
+                self.quota.update(api_token, e.response.headers)
+                if status_code not in RETRYABLE_STATUS_CODES:
+                    raise
+
+                retry_after = parse_retry_after(e.response.headers)
+                if status_code == 429 and retry_after is not None:
+                    self.quota.exhausted(api_token, time.time() + retry_after)
+                delay = retry_after if retry_after is not None else self.backoff(attempt)
+                error = e
+            except (httpx.ConnectError, httpx.PoolTimeout) as e:
+                delay = self.backoff(attempt)
+                error = e
+            else:
+                self.quota.update(api_token, response.headers)
+                return response
+
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + delay > deadline_at:
+                if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+                    raise RateLimitError(
+                        "Rate limit exceeded. Please try again in a few minutes.", retry_after=delay
+                    ) from error
+                raise error
+
+            self.retries += 1
+            logger.warning(f"OpenRouter call failed ({error}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "quotas": self.quota.stats()
+        }
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the work; callers arriving while it is still
+    in flight await the same future and receive the same result or exception.
+    Once the work finishes the key is released, so later calls run again. If the
+    first caller is cancelled, the callers waiting for it run the work again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+        self.handed_over = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run ``fn()`` for ``key`` unless an identical call is already in flight.
+
+        Callers that joined a call whose first caller was cancelled run ``fn()``
+        again themselves (the first of them leading the new call), rather than
+        inheriting that cancellation.
+        """
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                return await self._lead(key, fn)
+
+            self.coalesced += 1
+            logger.info(f"{self.name}: joining in-flight call {key[:12]}")
+            try:
+                # Shield so a cancelled follower does not cancel the shared work
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    self.handed_over += 1
+                    logger.info(f"{self.name}: in-flight call {key[:12]} was cancelled, running it again")
+                    continue
+                raise
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark the exception retrieved when nobody else was waiting for it
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "handed_over": self.handed_over
+        }
@@ -0,0 +1,117 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Iterable, Iterator, List
+
+# Stages of a generation, in pipeline order. Spans can nest: prompt_build
+# includes template_resolve when the template was not resolved before, and
+# llm_first_token is measured from the start of llm_total.
+STAGES = (
+    "template_resolve",
+    "placeholder_extraction",
+    "prompt_build",
+    "llm_first_token",
+    "llm_total",
+    "postprocess",
+    "persistence"
+)
+
+class SpanRecorder:
+    """
+    Wall-clock time of the stages of one generation, on the monotonic clock.
+
+    A stage that runs more than once (e.g. persistence) accumulates. ``elapsed_ms``
+    is the time since the recorder was created, i.e. since the request started.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._spans: Dict[str, float] = {}
+        self._open: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        self._open[name] = started
+        try:
+            yield
+        finally:
+            self._open.pop(name, None)
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name: str, ms: float) -> None:
+        self._spans[name] = self._spans.get(name, 0.0) + ms
+
+    def mark_since(self, parent: str, name: str) -> None:
+        """Record ``name`` as the time since the open span ``parent`` started, once."""
+        started = self._open.get(parent)
+        if started is not None and name not in self._spans:
+            self._spans[name] = (time.perf_counter() - started) * 1000
+
+    def elapsed_ms(self) -> int:
+        return int((time.perf_counter() - self.started) * 1000)
+
+    def breakdown(self) -> Dict[str, float]:
+        return {name: round(ms, 1) for name, ms in self._spans.items()}
+
+_recorder: ContextVar[Optional[SpanRecorder]] = ContextVar("span_recorder", default=None)
+
+@contextmanager
+def recording(recorder: SpanRecorder) -> Iterator[SpanRecorder]:
+    """Make ``recorder`` receive the spans of the code run inside the block, including tasks it starts."""
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the block as stage ``name`` of the current recorder, if any."""
+    recorder = _recorder.get()
+    if recorder is None:
+        yield
+        return
+    with recorder.span(name):
+        yield
+
+def record_first_token() -> None:
+    """Record the LLM time-to-first-token of the current recorder, if any."""
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.mark_since("llm_total", "llm_first_token")
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile ``q`` (0-100) of sorted values."""
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def latency_percentiles(
+    rows: Iterable[Any],
+    quantiles: Iterable[float] = (50, 95, 99)
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Percentiles per template type and stage of ``(template_type, processing_time_ms, stage_timings)`` rows.
+
+    The total processing time is reported as the ``total`` stage.
+    """
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    for template_type, processing_time_ms, stage_timings in rows:
+        stages = samples.setdefault(template_type, {})
+        if processing_time_ms is not None:
+            stages.setdefault("total", []).append(processing_time_ms)
+        for name, ms in (stage_timings or {}).items():
+            stages.setdefault(name, []).append(ms)
+
+    result = {}
+    for template_type, stages in samples.items():
+        result[template_type] = {}
+        for name in sorted(stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+            ordered = sorted(stages[name])
+            summary = {"count": len(ordered)}
+            for q in quantiles:
+                summary[f"p{q:g}_ms"] = percentile(ordered, q)
+            result[template_type][name] = summary
+    return result
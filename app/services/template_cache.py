@@ -0,0 +1,164 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import count_queries
+from app.models.ai_templates import AITemplateVersion
+
+logger = logging.getLogger(__name__)
+
+# Placeholder for template types without an active template, so they are not looked up every time
+_MISSING = object()
+
+class TemplateCache:
+    """
+    Process-wide cache of complete template bundles, keyed by template type and version.
+    Serialized responses of the template endpoints are kept per version as well.
+
+    The version is a counter in the database that the CRUD layer bumps in the same
+    transaction as every template, prompt config and placeholder change. Local
+    changes invalidate the cache right away; changes made by other workers are
+    picked up the next time the counter is checked, at most every
+    ``check_seconds``. Between checks a cached bundle is returned without any query.
+    """
+
+    def __init__(self, max_entries: int = 64, check_seconds: float = 5.0, enabled: bool = True):
+        self.max_entries = max_entries
+        self.check_seconds = check_seconds
+        self.enabled = enabled
+
+        self._bundles: "OrderedDict[Tuple[str, int], Any]" = OrderedDict()
+        self._responses: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self._types_by_id: Dict[int, str] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "version_checks": 0,
+            "invalidations": 0,
+            "load_queries": 0,
+            "response_hits": 0,
+            "response_misses": 0
+        }
+
+    def get(
+        self,
+        db: Session,
+        template_type: str,
+        loader: Callable[[Session, str], Optional[Dict[str, Any]]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return the bundle for ``template_type``, calling ``loader`` on a miss.
+
+        The template in a cached bundle is detached from any session, so only its
+        column attributes can be used.
+        """
+        if not self.enabled:
+            return loader(db, template_type)
+
+        version = self._current_version(db)
+        key = (template_type, version)
+        with self._lock:
+            bundle = self._bundles.get(key)
+            if bundle is not None:
+                self._bundles.move_to_end(key)
+                self._stats["hits"] += 1
+                return None if bundle is _MISSING else bundle
+            self._stats["misses"] += 1
+
+        with count_queries(db) as queries:
+            bundle = loader(db, template_type)
+        if bundle is not None:
+            # Shared between sessions and threads from now on
+            db.expunge(bundle["template"])
+
+        with self._lock:
+            self._stats["load_queries"] += queries.count
+            # Skip storing if the version moved on while loading
+            if version == self._version:
+                self._bundles[key] = _MISSING if bundle is None else bundle
+                if bundle is not None:
+                    self._types_by_id[bundle["template"].id] = template_type
+                while len(self._bundles) > self.max_entries:
+                    self._bundles.popitem(last=False)
+        logger.debug(f"Loaded template bundle for {template_type!r} (version {version}) with {queries.count} queries")
+        return bundle
+
+    def version(self, db: Session) -> int:
+        """The current template version, read from the database at most every ``check_seconds``."""
+        return self._current_version(db)
+
+    def get_response(self, key: str, version: int, render: Callable[[], bytes]) -> bytes:
+        """Return the serialized response body stored for ``key`` at ``version``, rendering it on a miss."""
+        with self._lock:
+            body = self._responses.get((key, version))
+            if body is not None:
+                self._responses.move_to_end((key, version))
+                self._stats["response_hits"] += 1
+                return body
+            self._stats["response_misses"] += 1
+
+        body = render()
+        with self._lock:
+            if self.enabled and version == self._version:
+                self._responses[(key, version)] = body
+                while len(self._responses) > self.max_entries:
+                    self._responses.popitem(last=False)
+        return body
+
+    def template_type_for(self, template_id: int) -> Optional[str]:
+        """The type of a template whose bundle has been loaded, if known."""
+        with self._lock:
+            return self._types_by_id.get(template_id)
+
+    def invalidate(self) -> None:
+        """Drop every bundle and re-check the version on the next lookup."""
+        with self._lock:
+            self._clear()
+            self._version = None
+            self._checked_at = 0.0
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._bundles),
+                "responses": len(self._responses),
+                "version": self._version
+            }
+
+    def _clear(self) -> None:
+        self._bundles.clear()
+        self._responses.clear()
+        self._types_by_id.clear()
+
+    def _current_version(self, db: Session) -> int:
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_seconds:
+                return self._version
+
+        version = db.query(AITemplateVersion.version).filter(AITemplateVersion.id == 1).scalar() or 0
+        with self._lock:
+            self._stats["version_checks"] += 1
+            if version != self._version:
+                if self._version is not None:
+                    logger.info(f"Template version changed from {self._version} to {version}, dropping cached bundles")
+                self._clear()
+                self._version = version
+            self._checked_at = now
+        return version
+
+template_cache = TemplateCache(
+    max_entries=settings.TEMPLATE_CACHE_MAX_ENTRIES,
+    check_seconds=settings.TEMPLATE_CACHE_CHECK_SECONDS,
+    enabled=settings.TEMPLATE_CACHE_ENABLED
+)
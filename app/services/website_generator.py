@@ -1,29 +1,51 @@
 import os
+import re
 import json
+import hashlib
 import logging
-import requests
+import httpx
 from datetime import datetime
-from typing import Optional, Dict, Any, Union
+from typing import Optional, Dict, Any, Union, List, Tuple, AsyncIterator
 from sqlalchemy.orm import Session
 
-from app.db.database import SessionLocal
-from app.services.prompt_service import PromptService
+from app.core.config import settings
+from app.models.ai_templates import RequestStatus
+from app.services.generation_cache import generation_cache
+from app.services.single_flight import SingleFlight
+from app.services.html_pipeline import PHOTO_REFERENCE, postprocess_html
+from app.services.photo_processing import ProcessedPhoto, photo_context
+from app.services.generation_context import GenerationContext
+from app.services.prompt_budget import BudgetResult, count_message_tokens, fit_to_budget, prompt_budget
+from app.services.model_router import model_router
+from app.services.audit_sink import audit_sink
+from app.services.spans import SpanRecorder, recording, span
+from app.services.retry_scheduler import RateLimitError
 from app.schemas.ai_templates import UserRequestCreate
 
 logger = logging.getLogger(__name__)
 
-def generate_website(
-    website_type: str, 
-    content: str, 
-    style: str, 
-    language: str, 
-    api_token: str, 
-    color_palette: Optional[Union[str, Dict[str, str]]] = None, 
-    photo_data: Optional[str] = None
+# Coalesce concurrent identical generations (including their request rows) and API calls
+generation_flight = SingleFlight("generation")
+completion_flight = SingleFlight("completion")
+
+class PromptTooLargeError(Exception):
+    """Raised when the resolved prompt is larger than the model request allows."""
+
+async def generate_website(
+    website_type: str,
+    content: str,
+    style: str,
+    language: str,
+    api_token: str,
+    color_palette: Optional[Union[str, Dict[str, str]]] = None,
+    photo: Optional[ProcessedPhoto] = None,
+    bypass_cache: bool = False,
+    user_request_id: Optional[int] = None,
+    context: Optional[GenerationContext] = None
 ) -> str:
     """
     Generate website HTML using OpenRouter API.
-    
+
     Args:
         website_type (str): Type of website (CV, landing page, portfolio)
         content (str): User's content to transform
@@ -31,236 +53,436 @@ def generate_website(
         language (str): Detected language ('id' or 'en')
         api_token (str): OpenRouter API token
         color_palette (dict or str, optional): Color palette to use for the website
-        photo_data (str, optional): Base64 encoded photo data
-        
+        photo (ProcessedPhoto, optional): The uploaded photo, already stored as an asset
+        bypass_cache (bool): Skip the generation cache and request a fresh variant
+        user_request_id (int, optional): Existing AIUserRequest row to report progress on,
+            e.g. for queued jobs. A new row is recorded when not given.
+        context (GenerationContext, optional): The request's context, whose session (sync
+            or async) and template are used. Without it a context with its own session is opened.
+
     Returns:
         str: Generated HTML content
     """
-    # OpenRouter API endpoint
-    api_url = "https://openrouter.ai/api/v1/chat/completions"
-    
-    # Create DB session
-    db = SessionLocal()
+    if context is None:
+        context = GenerationContext.open(website_type)
+    db = context.session
+    timings = context.timings
     try:
-        # Get prompts from database
-        prompt_service = PromptService(db)
-        template_data = prompt_service.get_template_prompts(website_type)
-        
-        if not template_data["success"]:
-            # Fallback to hardcoded prompts if template not found
-            logger.warning(f"Template not found for type: {website_type}. Using fallback prompts.")
-            return generate_website_fallback(
-                website_type, content, style, language, api_token, color_palette, photo_data
-            )
-        
-        # Extract placeholders
-        placeholder_values = {
-            "{{user_input}}": content,
-            "{{style}}": style,
-            "{{language}}": language
-        }
-        
-        # Parse color palette if provided as JSON string
-        colors = None
-        if color_palette:
-            if isinstance(color_palette, str):
+        with recording(timings):
+            with span("prompt_build"):
+                messages, template_id = await context.run_sync(
+                    _prepare_messages, context, content, style, language, color_palette, photo
+                )
+
+            async def run() -> str:
+                request_id = user_request_id
+                if request_id is None:
+                    request_id = await context.run_sync(_record_request, context, template_id, content)
+                await context.run_sync(_record_status, db, request_id, RequestStatus.PROCESSING, budget=context.budget)
+
                 try:
-                    colors = json.loads(color_palette)
-                    placeholder_values["{{color}}"] = colors.get('primary', '#007bff')
-                except json.JSONDecodeError:
-                    logger.warning("Failed to parse color palette JSON")
-                    placeholder_values["{{color}}"] = "#007bff"
-            else:
-                placeholder_values["{{color}}"] = colors.get('primary', '#007bff')
-        
-        # Add photo placeholder if provided
-        if photo_data:
-            placeholder_values["{{photo}}"] = f"data:image/jpeg;base64,{photo_data}"
-        
-        # Replace placeholders in system prompts
-        system_prompts = []
-        for prompt in template_data["system_prompts"]:
-            resolved_prompt = prompt_service.replace_placeholders(prompt, placeholder_values)
-            system_prompts.append(resolved_prompt)
-        
-        # Replace placeholders in user prompts
-        user_prompts = []
-        for prompt in template_data["user_prompts"]:
-            resolved_prompt = prompt_service.replace_placeholders(prompt, placeholder_values)
-            user_prompts.append(resolved_prompt)
-        
-        # Create messages array for API request
-        messages = []
-        
-        # Add system prompts
-        for prompt in system_prompts:
-            messages.append({"role": "system", "content": prompt})
-        
-        # Add user prompts
-        for prompt in user_prompts:
-            messages.append({"role": "user", "content": prompt})
-        
-        # If no prompts were found, use a fallback
-        if not messages:
-            logger.warning("No prompts found in database. Using fallback.")
-            return generate_website_fallback(
-                website_type, content, style, language, api_token, color_palette, photo_data
-            )
-        
-        # Make request to OpenRouter API
-        headers = {
-            "Authorization": f"Bearer {api_token}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "nousresearch/deephermes-3-mistral-24b-preview:free",  # Using a free model from OpenRouters
-            "messages": messages,
-            "max_tokens": 4000,
-            "temperature": 0.7
-        }
-        
-        # Create user request record in database
-        user_request = UserRequestCreate(
-            template_id=template_data["template"].id,
-            user_input=content
-        )
-        
-        # Process the request and store in database
-        request_result = prompt_service.process_user_request(user_request)
-        
-        # Make API request
-        response = requests.post(api_url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        # Log the AI response
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        ai_response_path = f"logs/ai_responses/response_{timestamp}.json"
-        os.makedirs(os.path.dirname(ai_response_path), exist_ok=True)
-        with open(ai_response_path, 'w') as f:
-            json.dump(result, f, indent=2)
-        
-        # Check if we have choices in the response
-        if 'choices' not in result or not result['choices'] or 'message' not in result['choices'][0]:
-            error_msg = "API response did not contain expected data structure"
-            logger.error(f"OpenRouter API error: {error_msg}")
-            logger.error(f"Response: {result}")
-            raise Exception(error_msg)
-            
-        html_content = result["choices"][0]["message"]["content"]
-        
-        # Clean up the response if needed (remove any markdown code block markers)
-        html_content = html_content.replace("```html", "").replace("```", "").strip()
-        
-        # Process photo data if provided
-        if photo_data:
-            # Check if the AI included the placeholder
-            if 'id="profile-photo-placeholder"' in html_content:
-                # Replace the placeholder with the actual image
-                html_content = html_content.replace(
-                    'id="profile-photo-placeholder"', 
-                    f'id="profile-photo" src="data:image/jpeg;base64,{photo_data}"'
+                    html_content = await _complete_website(api_token, messages, photo, bypass_cache)
+                except Exception as e:
+                    await context.run_sync(
+                        _record_status, db, request_id, RequestStatus.FAILED, error_message=str(e), timings=timings
+                    )
+                    raise
+
+                await context.run_sync(
+                    _record_status, db, request_id, RequestStatus.COMPLETED, ai_response=html_content, timings=timings
+                )
+                return html_content
+
+            # Queued jobs already own a request row, so only coalesce direct requests
+            if user_request_id is not None:
+                return await run()
+            return await generation_flight.do(_flight_key(messages, api_token, photo, bypass_cache), run)
+    finally:
+        await context.close()
+
+async def generate_website_fallback(
+    website_type: str,
+    content: str,
+    style: str,
+    language: str,
+    api_token: str,
+    color_palette: Optional[Union[str, Dict[str, str]]] = None,
+    photo: Optional[ProcessedPhoto] = None,
+    bypass_cache: bool = False
+) -> str:
+    """Fallback method using hardcoded prompts if database prompts are not available."""
+    messages = fit_to_budget(
+        lambda text: _fallback_messages(website_type, text, style, language, color_palette, photo),
+        content,
+        prompt_budget()
+    ).messages
+
+    return await _complete_website(api_token, messages, photo, bypass_cache)
+
+async def stream_website(
+    website_type: str,
+    content: str,
+    style: str,
+    language: str,
+    api_token: str,
+    color_palette: Optional[Union[str, Dict[str, str]]] = None,
+    photo: Optional[ProcessedPhoto] = None,
+    bypass_cache: bool = False,
+    user_request_id: Optional[int] = None,
+    context: Optional[GenerationContext] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Generate website HTML, yielding the model output as it is produced.
+
+    Yields ``{"event": "delta", "content": ...}`` for every chunk of cleaned HTML
+    and finishes with ``{"event": "done", "html": ...}``. The final HTML has photo
+    post-processing applied, so it can differ from the concatenated deltas.
+
+    Args:
+        Same as generate_website
+    """
+    if context is None:
+        context = GenerationContext.open(website_type)
+    db = context.session
+    timings = context.timings
+    try:
+        # The recorder is only made current around blocks that do not yield
+        with recording(timings):
+            with span("prompt_build"):
+                messages, template_id = await context.run_sync(
+                    _prepare_messages, context, content, style, language, color_palette, photo
                 )
+            request_id = user_request_id
+            if request_id is None:
+                request_id = await context.run_sync(_record_request, context, template_id, content)
+            await context.run_sync(_record_status, db, request_id, RequestStatus.PROCESSING, budget=context.budget)
+
+        data = _completion_payload(messages)
+        data["stream"] = True
+
+        try:
+            _check_prompt_size(messages)
+            stripper = FenceStripper()
+            html_parts = []
+
+            cache_key = generation_cache.make_key(data)
+            cached = _cache_lookup(cache_key, bypass_cache)
+            if cached is not None:
+                deltas = _single_chunk(cached)
             else:
-                # If no placeholder, add it ourselves in a reasonable location
-                # Try to find a suitable container for the photo
-                photo_containers = [
-                    '<div class="profile"', 
-                    '<div class="about"', 
-                    '<div class="header"', 
-                    '<header', 
-                    '<section', 
-                    '<div class="container"'
-                ]
-                
-                insertion_point = None
-                for container in photo_containers:
-                    if container in html_content:
-                        # Find the end of the opening tag
-                        start_idx = html_content.find(container)
-                        end_idx = html_content.find('>', start_idx) + 1
-                        if end_idx > 0:
-                            insertion_point = end_idx
-                            break
-                
-                # Create the image tag with appropriate styling
-                img_tag = f'<img src="data:image/jpeg;base64,{photo_data}" alt="Profile Photo" class="profile-photo" style="max-width: 300px; border-radius: 8px; margin: 20px auto; display: block;">'
-                
-                if insertion_point:
-                    # Insert after the container opening tag
-                    html_content = html_content[:insertion_point] + img_tag + html_content[insertion_point:]
-                elif '</body>' in html_content:
-                    # Fallback: insert before closing body tag
-                    html_content = html_content.replace('</body>', f'{img_tag}</body>')
-            
-            # Add CSS for the profile photo if not already present
-            if '.profile-photo' not in html_content and '</style>' in html_content:
-                photo_css = """
-    .profile-photo {
-        max-width: 300px;
-        border-radius: 8px;
-        margin: 20px auto;
-        display: block;
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-        transition: transform 0.3s ease;
-    }
-    .profile-photo:hover {
-        transform: scale(1.02);
+                deltas = model_router.stream(api_token, data)
+
+            raw_parts = []
+            with timings.span("llm_total"):
+                async for delta in deltas:
+                    if not raw_parts:
+                        timings.mark_since("llm_total", "llm_first_token")
+                    raw_parts.append(delta)
+                    text = stripper.feed(delta)
+                    if text:
+                        html_parts.append(text)
+                        yield {"event": "delta", "content": text}
+
+            text = stripper.finish()
+            if text:
+                html_parts.append(text)
+                yield {"event": "delta", "content": text}
+
+            html_content = "".join(html_parts)
+            if not html_content:
+                raise Exception("API response did not contain any content")
+
+            if cached is None:
+                # Log the AI response
+                raw_content = "".join(raw_parts)
+                _log_ai_response({"requested_model": data["model"], "stream": True, "content": raw_content})
+                if settings.GENERATION_CACHE_ENABLED:
+                    generation_cache.set(cache_key, raw_content)
+
+            # Post-process the complete document (adds the photo, if provided)
+            with timings.span("postprocess"):
+                html_content = postprocess_html(html_content, **photo_context(photo))
+
+            # Log the generated HTML
+            _log_html(html_content)
+
+            await context.run_sync(
+                _record_status, db, request_id, RequestStatus.COMPLETED, ai_response=html_content, timings=timings
+            )
+            yield {"event": "done", "html": html_content}
+        except (httpx.HTTPError, RateLimitError, PromptTooLargeError) as req_err:
+            error = _api_error(req_err) if isinstance(req_err, httpx.HTTPError) else req_err
+            await context.run_sync(
+                _record_status, db, request_id, RequestStatus.FAILED, error_message=str(error), timings=timings
+            )
+            raise error
+        except Exception as e:
+            logger.error(f"OpenRouter API error: {str(e)}")
+            await context.run_sync(
+                _record_status, db, request_id, RequestStatus.FAILED, error_message=str(e), timings=timings
+            )
+            raise Exception(f"Failed to generate website: {str(e)}")
+    finally:
+        await context.close()
+
+class FenceStripper:
+    """
+    Incrementally remove markdown code fences from streamed model output.
+
+    Produces the same result as ``text.replace("```html", "").replace("```", "").strip()``
+    applied to the full output, but works chunk by chunk. Text that could still turn
+    into a fence, and trailing whitespace, is held back until more input arrives.
+    """
+
+    # Backticks and fences that can still merge into fences once more input
+    # arrives (``str.replace`` removes "```html" first, which can join the
+    # backticks around it), ending with the start of a fence (e.g. "```ht")
+    PENDING = re.compile(r"(?:```html|`)*(?:```(?:htm|ht|h))?\Z")
+
+    def __init__(self):
+        self._tail = ""
+        self._whitespace = ""
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk of raw model output and return the text that is safe to emit."""
+        raw = self._tail + chunk
+        hold = self.PENDING.search(raw).start()
+        self._tail = raw[hold:]
+        return self._emit(raw[:hold])
+
+    def finish(self) -> str:
+        """Flush the remaining buffered text at the end of the stream."""
+        text = self._emit(self._tail)
+        self._tail = ""
+        self._whitespace = ""
+        return text
+
+    def _emit(self, text: str) -> str:
+        text = text.replace("```html", "").replace("```", "")
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+
+        text = self._whitespace + text
+        stripped = text.rstrip()
+        self._whitespace = text[len(stripped):]
+        return stripped
+
+def _prepare_messages(
+    context: GenerationContext,
+    content: str,
+    style: str,
+    language: str,
+    color_palette: Optional[Union[str, Dict[str, str]]],
+    photo: Optional[ProcessedPhoto]
+) -> Tuple[List[Dict[str, str]], Optional[int]]:
+    """
+    Resolve the chat messages for a generation and fit them to the token budget.
+
+    The user content is compacted as far as needed for the prompt to fit (see
+    fit_to_budget); how that went is kept on ``context.budget``.
+
+    Returns:
+        tuple: The messages and the ID of the template they came from (None for
+        the fallback prompts)
+    """
+    template_id = None
+
+    def build(text: str) -> List[Dict[str, str]]:
+        nonlocal template_id
+        messages, template_id = _resolve_messages(context, text, style, language, color_palette, photo)
+        return messages
+
+    context.budget = fit_to_budget(build, content, prompt_budget())
+    return context.budget.messages, template_id
+
+def _resolve_messages(
+    context: GenerationContext,
+    content: str,
+    style: str,
+    language: str,
+    color_palette: Optional[Union[str, Dict[str, str]]],
+    photo: Optional[ProcessedPhoto]
+) -> Tuple[List[Dict[str, str]], Optional[int]]:
+    """
+    Resolve the chat messages for a generation.
+
+    Uses the database prompts for the website type, falling back to hardcoded
+    prompts if no usable template exists.
+
+    Returns:
+        tuple: The messages and the ID of the template they came from (None for
+        the fallback prompts)
+    """
+    # Get prompts from database
+    website_type = context.website_type
+    prompt_service = context.prompt_service
+    template_data = context.resolve_template()
+
+    if not template_data["success"]:
+        # Fallback to hardcoded prompts if template not found
+        logger.warning(f"Template not found for type: {website_type}. Using fallback prompts.")
+        return _fallback_messages(website_type, content, style, language, color_palette, photo), None
+
+    # Extract placeholders
+    placeholder_values = {
+        "{{user_input}}": content,
+        "{{style}}": style,
+        "{{language}}": language
     }
-"""
-                html_content = html_content.replace('</style>', f'{photo_css}</style>')
-        
-        # Log the generated HTML
-        html_dump_path = f"logs/html_dumps/html_{timestamp}.html"
-        os.makedirs(os.path.dirname(html_dump_path), exist_ok=True)
-        with open(html_dump_path, 'w') as f:
-            f.write(html_content)
-        
-        return html_content
-    except requests.RequestException as req_err:
-        # Handle request-related errors
-        error_text = ""
-        if hasattr(req_err, 'response') and req_err.response:
+
+    # Parse color palette if provided as JSON string
+    if color_palette:
+        if isinstance(color_palette, str):
             try:
-                error_text = req_err.response.text
-            except:
-                error_text = "No response text available"
-        
-        logger.error(f"OpenRouter API request error: {str(req_err)}")
-        logger.error(f"Response: {error_text}")
-        
-        if "rate limit" in error_text.lower():
-            raise Exception("Rate limit exceeded. Please try again in a few minutes.")
+                colors = json.loads(color_palette)
+                placeholder_values["{{color}}"] = colors.get('primary', '#007bff')
+            except json.JSONDecodeError:
+                logger.warning("Failed to parse color palette JSON")
+                placeholder_values["{{color}}"] = "#007bff"
         else:
-            raise Exception(f"API request failed: {str(req_err)}")
+            placeholder_values["{{color}}"] = color_palette.get('primary', '#007bff')
+
+    # Add photo placeholder if provided. The model only gets a short reference that
+    # is swapped for the image after generation, never the image data itself.
+    if photo:
+        placeholder_values["{{photo}}"] = PHOTO_REFERENCE
+
+    # Create messages array for API request
+    messages = []
+
+    # Add system prompts, then user prompts
+    resolved_prompts = prompt_service.resolve_prompts(template_data, placeholder_values)
+    for role in ("system", "user"):
+        for resolved_prompt in resolved_prompts[role]:
+            messages.append({"role": role, "content": resolved_prompt})
+
+    # If no prompts were found, use a fallback
+    if not messages:
+        logger.warning("No prompts found in database. Using fallback.")
+        return _fallback_messages(website_type, content, style, language, color_palette, photo), None
+
+    return messages, template_data["template"].id
+
+def _record_request(
+    context: GenerationContext,
+    template_id: Optional[int],
+    content: str
+) -> Optional[int]:
+    """Record the user request in the database and return its ID."""
+    if template_id is None:
+        return None
+
+    # Create user request record in database
+    user_request = UserRequestCreate(
+        template_id=template_id,
+        user_input=content
+    )
+
+    # Process the request and store in database
+    request_result = context.prompt_service.process_user_request(user_request, context.resolve_template())
+    return request_result.get("request_id")
+
+def _flight_key(
+    messages: List[Dict[str, str]],
+    api_token: str,
+    photo: Optional[ProcessedPhoto],
+    bypass_cache: bool
+) -> str:
+    """Key identifying generations for the same token that would produce the same result."""
+    key = f"{generation_cache.make_key(_completion_payload(messages))}:{_token_hash(api_token)}"
+    if photo:
+        key += ":" + photo.url
+    if bypass_cache:
+        key += ":fresh"
+    return key
+
+async def _complete_website(
+    api_token: str,
+    messages: List[Dict[str, str]],
+    photo: Optional[ProcessedPhoto],
+    bypass_cache: bool = False
+) -> str:
+    """Request a completion for the resolved messages and post-process the HTML."""
+    # Make request to OpenRouter API
+    data = _completion_payload(messages)
+
+    try:
+        _check_prompt_size(messages)
+        with span("llm_total"):
+            html_content = await _fetch_completion(api_token, data, bypass_cache)
+
+        # Remove any markdown code block markers and insert the photo, if provided
+        with span("postprocess"):
+            html_content = postprocess_html(html_content, **photo_context(photo))
+
+        # Log the generated HTML
+        _log_html(html_content)
+
+        return html_content
+    except httpx.HTTPError as req_err:
+        raise _api_error(req_err)
+    except (RateLimitError, PromptTooLargeError):
+        raise
     except Exception as e:
         # Handle all other errors
         logger.error(f"OpenRouter API error: {str(e)}")
         raise Exception(f"Failed to generate website: {str(e)}")
-    finally:
-        db.close()
-
-def generate_website_fallback(
-    website_type: str, 
-    content: str, 
-    style: str, 
-    language: str, 
-    api_token: str, 
-    color_palette: Optional[Union[str, Dict[str, str]]] = None, 
-    photo_data: Optional[str] = None
-) -> str:
-    """Fallback method using hardcoded prompts if database prompts are not available."""
-    # OpenRouter API endpoint
-    api_url = "https://openrouter.ai/api/v1/chat/completions"
-    
+
+async def _fetch_completion(api_token: str, data: Dict[str, Any], bypass_cache: bool = False) -> str:
+    """Return the raw model output for a payload, from the generation cache when possible."""
+    cache_key = generation_cache.make_key(data)
+    cached = _cache_lookup(cache_key, bypass_cache)
+    if cached is not None:
+        return cached
+
+    # Identical prompts in flight at the same time with the same token share one API call
+    flight_key = f"{cache_key}:{_token_hash(api_token)}" + (":fresh" if bypass_cache else "")
+    return await completion_flight.do(flight_key, lambda: _request_completion(api_token, data, cache_key))
+
+async def _request_completion(api_token: str, data: Dict[str, Any], cache_key: str) -> str:
+    # Make API request, hedging across the configured models
+    content, model = await model_router.complete(api_token, data)
+
+    # Log the AI response
+    _log_ai_response({"model": model, "content": content})
+
+    if settings.GENERATION_CACHE_ENABLED and content:
+        generation_cache.set(cache_key, content)
+    return content
+
+def _token_hash(api_token: str) -> str:
+    return hashlib.sha256(api_token.encode("utf-8")).hexdigest()[:16]
+
+def _cache_lookup(cache_key: str, bypass_cache: bool) -> Optional[str]:
+    if not settings.GENERATION_CACHE_ENABLED or bypass_cache:
+        return None
+    cached = generation_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Generation cache hit for {cache_key[:12]}")
+    return cached
+
+async def _single_chunk(content: str) -> AsyncIterator[str]:
+    yield content
+
+def _fallback_messages(
+    website_type: str,
+    content: str,
+    style: str,
+    language: str,
+    color_palette: Optional[Union[str, Dict[str, str]]],
+    photo: Optional[ProcessedPhoto]
+) -> List[Dict[str, str]]:
+    """Build the hardcoded prompt used when database prompts are not available."""
     # Create prompt based on inputs
     if language == 'id':
         language_note = "The content is in Indonesian. Generate an Indonesian website."
     else:
         language_note = "The content is in English. Generate an English website."
-    
+
     # Parse color palette if provided as JSON string
     colors = None
     if color_palette:
@@ -271,44 +493,44 @@ def generate_website_fallback(
                 logger.warning("Failed to parse color palette JSON")
         else:
             colors = color_palette
-    
+
     # Use provided color palette or default
     color_scheme = """
-    3. Incorporate the following color scheme: 
+    3. Incorporate the following color scheme:
        - Primary: #FF6B6B (soft coral)
        - Secondary: #4ECDC4 (calming teal)
-       - Background: #F7F9FC (airy white) 
+       - Background: #F7F9FC (airy white)
        - Text: #2D3436 (soft black)
        - Accent: #95A5A6 (gentle grey)
     """
-    
+
     if colors:
         color_scheme = f"""
-    3. Incorporate the following color scheme: 
+    3. Incorporate the following color scheme:
        - Primary: {colors.get('primary', '#FF6B6B')}
        - Secondary: {colors.get('secondary', '#4ECDC4')}
        - Background: {colors.get('background', '#F7F9FC')}
        - Text: {colors.get('text', '#2D3436')}
        - Accent: {colors.get('accent', '#95A5A6')}
     """
-    
+
     # Add photo instructions if provided
     photo_instructions = ""
-    if photo_data:
+    if photo:
         photo_instructions = """
     11. Include a profile photo placeholder with the ID "profile-photo-placeholder" in an appropriate location.
         Use this exact HTML: <img id="profile-photo-placeholder" alt="Profile Photo" class="profile-photo" style="max-width: 300px; border-radius: 8px; margin: 20px auto; display: block;">
         """
-    
+
     prompt = f"""
     Create a complete, standalone HTML page for a {website_type} website with the following content:
-    
+
     {content}
-    
+
     Style preferences: {style}
-    
+
     {language_note}
-    
+
     Important requirements:
     1. Create a fully working standalone single-page HTML file that includes all CSS styles internally
     2. Use modern HTML5 and CSS3 features with responsive design{color_scheme}
@@ -319,132 +541,107 @@ def generate_website_fallback(
     8. Add donation buttons for Trakteer and BuyMeACoffee at the bottom
     9. Use dark theme styling that matches the selected style
     10. The page should be complete and ready to deploy without any external dependencies{photo_instructions}
-    
+
     Return only the HTML code without any explanation or markdown.
     """
-    
-    # Make request to OpenRouter API
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": "nousresearch/deephermes-3-mistral-24b-preview:free",  # Using a free model from OpenRouters
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": 4000,
+
+    return [
+        {"role": "user", "content": prompt}
+    ]
+
+def _check_prompt_size(messages: List[Dict[str, str]]) -> None:
+    """
+    Refuse prompts that are too large to send, even after compaction.
+
+    Raises:
+        PromptTooLargeError: If the approximate token count exceeds the prompt budget
+    """
+    prompt_tokens = count_message_tokens(messages)
+    budget = prompt_budget()
+    logger.info(f"Prompt size: ~{prompt_tokens} tokens (budget {budget})")
+    if prompt_tokens > budget:
+        raise PromptTooLargeError(
+            f"The request is too large (~{prompt_tokens} tokens, the limit is "
+            f"{budget}). Please shorten your content."
+        )
+
+def _completion_payload(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {
+        "model": settings.LLM_MODELS[0],
+        "messages": messages,
+        "max_tokens": settings.LLM_MAX_OUTPUT_TOKENS,
         "temperature": 0.7
     }
-    
+
+def _record_status(
+    db: Session,
+    request_id: Optional[int],
+    status: RequestStatus,
+    ai_response: Optional[str] = None,
+    error_message: Optional[str] = None,
+    timings: Optional[SpanRecorder] = None,
+    budget: Optional[BudgetResult] = None
+) -> None:
+    """
+    Record a change of the AIUserRequest lifecycle columns without failing the generation.
+
+    Pass ``timings`` with the final status to store the total processing time and
+    the stage breakdown (which cannot include this last write).
+    """
+    if request_id is None:
+        return
+
+    processing_time_ms = None
+    stage_timings = None
+    if timings is not None:
+        processing_time_ms = timings.elapsed_ms()
+        stage_timings = timings.breakdown()
+
     try:
-        response = requests.post(api_url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        # Log the AI response
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        ai_response_path = f"logs/ai_responses/response_{timestamp}.json"
-        os.makedirs(os.path.dirname(ai_response_path), exist_ok=True)
-        with open(ai_response_path, 'w') as f:
-            json.dump(result, f, indent=2)
-        
-        # Check if we have choices in the response
-        if 'choices' not in result or not result['choices'] or 'message' not in result['choices'][0]:
-            error_msg = "API response did not contain expected data structure"
-            logger.error(f"OpenRouter API error: {error_msg}")
-            logger.error(f"Response: {result}")
-            raise Exception(error_msg)
-            
-        html_content = result["choices"][0]["message"]["content"]
-        
-        # Clean up the response if needed (remove any markdown code block markers)
-        html_content = html_content.replace("```html", "").replace("```", "").strip()
-        
-        # Process photo data if provided
-        if photo_data:
-            # Check if the AI included the placeholder
-            if 'id="profile-photo-placeholder"' in html_content:
-                # Replace the placeholder with the actual image
-                html_content = html_content.replace(
-                    'id="profile-photo-placeholder"', 
-                    f'id="profile-photo" src="data:image/jpeg;base64,{photo_data}"'
-                )
-            else:
-                # If no placeholder, add it ourselves in a reasonable location
-                # Try to find a suitable container for the photo
-                photo_containers = [
-                    '<div class="profile"', 
-                    '<div class="about"', 
-                    '<div class="header"', 
-                    '<header', 
-                    '<section', 
-                    '<div class="container"'
-                ]
-                
-                insertion_point = None
-                for container in photo_containers:
-                    if container in html_content:
-                        # Find the end of the opening tag
-                        start_idx = html_content.find(container)
-                        end_idx = html_content.find('>', start_idx) + 1
-                        if end_idx > 0:
-                            insertion_point = end_idx
-                            break
-                
-                # Create the image tag with appropriate styling
-                img_tag = f'<img src="data:image/jpeg;base64,{photo_data}" alt="Profile Photo" class="profile-photo" style="max-width: 300px; border-radius: 8px; margin: 20px auto; display: block;">'
-                
-                if insertion_point:
-                    # Insert after the container opening tag
-                    html_content = html_content[:insertion_point] + img_tag + html_content[insertion_point:]
-                elif '</body>' in html_content:
-                    # Fallback: insert before closing body tag
-                    html_content = html_content.replace('</body>', f'{img_tag}</body>')
-            
-            # Add CSS for the profile photo if not already present
-            if '.profile-photo' not in html_content and '</style>' in html_content:
-                photo_css = """
-    .profile-photo {
-        max-width: 300px;
-        border-radius: 8px;
-        margin: 20px auto;
-        display: block;
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-        transition: transform 0.3s ease;
-    }
-    .profile-photo:hover {
-        transform: scale(1.02);
-    }
-"""
-                html_content = html_content.replace('</style>', f'{photo_css}</style>')
-        
-        # Log the generated HTML
-        html_dump_path = f"logs/html_dumps/html_{timestamp}.html"
-        os.makedirs(os.path.dirname(html_dump_path), exist_ok=True)
-        with open(html_dump_path, 'w') as f:
-            f.write(html_content)
-        
-        return html_content
-    except requests.RequestException as req_err:
-        # Handle request-related errors
-        error_text = ""
-        if hasattr(req_err, 'response') and req_err.response:
-            try:
-                error_text = req_err.response.text
-            except:
-                error_text = "No response text available"
-        
-        logger.error(f"OpenRouter API request error: {str(req_err)}")
-        logger.error(f"Response: {error_text}")
-        
-        if "rate limit" in error_text.lower():
-            raise Exception("Rate limit exceeded. Please try again in a few minutes.")
-        else:
-            raise Exception(f"API request failed: {str(req_err)}")
+        with span("persistence"):
+            audit_sink.record_status(
+                db,
+                request_id,
+                status,
+                ai_response=ai_response,
+                error_message=error_message,
+                processing_time_ms=processing_time_ms,
+                stage_timings=stage_timings,
+                prompt_tokens_original=budget.tokens_before if budget else None,
+                prompt_tokens=budget.tokens_after if budget else None,
+                prompt_compaction=budget.steps if budget else None
+            )
     except Exception as e:
-        # Handle all other errors
-        logger.error(f"OpenRouter API error: {str(e)}")
-        raise Exception(f"Failed to generate website: {str(e)}")
\ No newline at end of file
+        db.rollback()
+        logger.error(f"Failed to update status of request {request_id}: {str(e)}")
+
+def _log_ai_response(result: Dict[str, Any]) -> None:
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    ai_response_path = os.path.join(settings.LOGS_DIR, "ai_responses", f"response_{timestamp}.json")
+    os.makedirs(os.path.dirname(ai_response_path), exist_ok=True)
+    with open(ai_response_path, 'w') as f:
+        json.dump(result, f, indent=2)
+
+def _log_html(html_content: str) -> None:
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    html_dump_path = os.path.join(settings.LOGS_DIR, "html_dumps", f"html_{timestamp}.html")
+    os.makedirs(os.path.dirname(html_dump_path), exist_ok=True)
+    with open(html_dump_path, 'w') as f:
+        f.write(html_content)
+
+def _api_error(req_err: httpx.HTTPError) -> Exception:
+    """Translate an OpenRouter request error into a user-facing exception."""
+    error_text = ""
+    if isinstance(req_err, httpx.HTTPStatusError):
+        try:
+            error_text = req_err.response.text
+        except Exception:
+            error_text = "No response text available"
+
+    logger.error(f"OpenRouter API request error: {str(req_err)}")
+    logger.error(f"Response: {error_text}")
+
+    status_code = req_err.response.status_code if isinstance(req_err, httpx.HTTPStatusError) else None
+    if status_code == 429 or "rate limit" in error_text.lower():
+        return Exception("Rate limit exceeded. Please try again in a few minutes.")
+    return Exception(f"API request failed: {str(req_err) or type(req_err).__name__}")
@@ -0,0 +1,98 @@
+import os
+import time
+import uuid
+import socket
+import logging
+from typing import Callable, Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.database import SessionLocal
+from app.models.ai_templates import AIWorkerLease
+from app.utils.snowflake import MAX_WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+class WorkerLeaseError(Exception):
+    """Raised when no Snowflake worker ID can be leased."""
+
+class WorkerLease:
+    """
+    A Snowflake worker ID leased from the ai_worker_leases table.
+
+    ``acquire`` claims the lowest worker ID that is free or whose lease has run
+    out, so every process writing user requests gets its own without
+    configuration. The holder has to ``renew`` the lease well within ``ttl``
+    seconds; a process that stops without ``release`` (e.g. a crash) frees its ID
+    once the lease runs out. Expiry is in Unix time, so hosts sharing the
+    database need roughly synchronized clocks, as Snowflake IDs do anyway.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, ttl: float = 60.0):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.worker_id: Optional[int] = None
+
+    def acquire(self) -> int:
+        """
+        Lease a worker ID and return it.
+
+        Raises:
+            WorkerLeaseError: If all worker IDs are held by live leases or the database is unavailable
+        """
+        table = AIWorkerLease.__table__
+        try:
+            with self.session_factory() as session:
+                # Created here as well, for databases set up before leases existed
+                table.create(session.get_bind(), checkfirst=True)
+                now = time.time()
+                held = dict(session.execute(select(table.c.worker_id, table.c.expires_at)).all())
+                for worker_id in range(MAX_WORKER_ID + 1):
+                    if worker_id not in held:
+                        statement = insert(table).values(worker_id=worker_id, holder=self.holder, expires_at=now + self.ttl)
+                    elif held[worker_id] < now:
+                        # Only one process can take over an expired lease
+                        statement = update(table).where(
+                            table.c.worker_id == worker_id, table.c.expires_at < now
+                        ).values(holder=self.holder, expires_at=now + self.ttl)
+                    else:
+                        continue
+                    try:
+                        claimed = session.execute(statement).rowcount == 1
+                        session.commit()
+                    except IntegrityError:
+                        # Inserted by another process in the meantime
+                        session.rollback()
+                        continue
+                    if claimed:
+                        self.worker_id = worker_id
+                        logger.info(f"Leased Snowflake worker ID {worker_id} as {self.holder}")
+                        return worker_id
+        except Exception as e:
+            raise WorkerLeaseError(f"Could not lease a Snowflake worker ID: {str(e)}") from e
+        raise WorkerLeaseError(f"All {MAX_WORKER_ID + 1} Snowflake worker IDs are leased")
+
+    def renew(self) -> bool:
+        """Extend the lease; returns False if it ran out and another process took the worker ID."""
+        table = AIWorkerLease.__table__
+        with self.session_factory() as session:
+            renewed = session.execute(
+                update(table).where(
+                    table.c.worker_id == self.worker_id, table.c.holder == self.holder
+                ).values(expires_at=time.time() + self.ttl)
+            ).rowcount == 1
+            session.commit()
+        return renewed
+
+    def release(self) -> None:
+        """Give the worker ID back, so another process can lease it right away."""
+        if self.worker_id is None:
+            return
+        table = AIWorkerLease.__table__
+        with self.session_factory() as session:
+            session.execute(delete(table).where(table.c.worker_id == self.worker_id, table.c.holder == self.holder))
+            session.commit()
+        self.worker_id = None
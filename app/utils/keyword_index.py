@@ -0,0 +1,85 @@
+import re
+from typing import Dict, Any, List, Tuple, Iterable
+
+# Parts of a multi-word placeholder key, e.g. "resume_format" -> "resume format"
+_KEY_PART_SEPARATOR = re.compile(r"[_\s]+")
+
+class KeywordIndex:
+    """
+    Finds placeholder keywords in user input in one pass.
+
+    Each placeholder is known by its key without braces ("{{color}}" -> "color").
+    Keys made of several words ("{{resume_format}}") also match those words in a
+    row ("resume format"). The keywords are kept in a trie of lowercased words, so
+    the input is split once and every position is matched against all keywords at
+    the same time, rather than scanning the input again per placeholder.
+
+    The value of a placeholder is the word following its first occurrence. When
+    occurrences of different keywords overlap, the placeholder with the higher
+    ``priority`` (detection_priority) keeps the words and the other moves on to its
+    next occurrence.
+    """
+
+    def __init__(self, placeholders: Iterable[Dict[str, Any]]):
+        self._trie: Dict[str, Any] = {}
+        self._priorities: Dict[str, int] = {}
+        self._order: Dict[str, int] = {}
+        self.max_words = 0
+
+        for placeholder in placeholders:
+            key = placeholder["key"]
+            keyword = key.strip("{}").lower()
+            if not keyword or key in self._priorities:
+                continue
+            self._priorities[key] = placeholder.get("priority") or 0
+            self._order[key] = len(self._order)
+            phrases = {(keyword,), tuple(part for part in _KEY_PART_SEPARATOR.split(keyword) if part)}
+            for phrase in phrases:
+                if phrase:
+                    self._add(phrase, key)
+
+    def _add(self, phrase: Tuple[str, ...], key: str) -> None:
+        node = self._trie
+        for word in phrase:
+            node = node.setdefault(word, {})
+        node.setdefault(None, []).append(key)
+        self.max_words = max(self.max_words, len(phrase))
+
+    def occurrences(self, words: List[str]) -> Dict[str, List[Tuple[int, int]]]:
+        """Word spans ``(start, end)`` of every keyword occurrence, by placeholder key, in input order."""
+        found: Dict[str, List[Tuple[int, int]]] = {}
+        trie = self._trie
+        for start, word in enumerate(words):
+            node = trie.get(word)
+            end = start
+            while node is not None:
+                end += 1
+                for key in node.get(None, ()):
+                    found.setdefault(key, []).append((start, end))
+                if end >= len(words):
+                    break
+                node = node.get(words[end])
+        return found
+
+    def extract(self, text: str) -> Dict[str, str]:
+        """
+        Values for the placeholders mentioned in ``text``: the word after the keyword.
+
+        Placeholders whose keyword is not followed by another word are left out.
+        """
+        words = text.lower().split()
+        found = self.occurrences(words)
+
+        # Highest priority first; ties go to the placeholder listed first
+        taken = [False] * len(words)
+        values = {}
+        for key in sorted(found, key=lambda key: (-self._priorities[key], self._order[key])):
+            for start, end in found[key]:
+                if any(taken[start:end]):
+                    continue
+                for position in range(start, end):
+                    taken[position] = True
+                if end < len(words):
+                    values[key] = words[end]
+                break
+        return values
@@ -0,0 +1,62 @@
+import hashlib
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.utils.prompt_template import compile_prompt, parse_prompt
+
+ROLES = ("system", "user")
+
+@lru_cache(maxsize=1024)
+def prompt_hash(text: str) -> str:
+    """Content address of a prompt text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def prompt_refs(prompts: Dict[str, List[str]]) -> Tuple[Dict[str, List[str]], Dict[str, str]]:
+    """
+    References to the prompt texts of each role, and the texts by hash.
+
+    A user request stores these references to its template's (unresolved)
+    prompts; its extracted_data holds the substitutions that resolve them.
+    """
+    refs = {role: [prompt_hash(text) for text in prompts.get(role, [])] for role in ROLES}
+    blobs = {prompt_hash(text): text for role in ROLES for text in prompts.get(role, [])}
+    return refs, blobs
+
+def rehydrate(refs: Dict[str, List[str]], substitutions: Optional[Dict[str, Any]], blobs: Dict[str, str]) -> Dict[str, List[str]]:
+    """The resolved prompts of a user request from its prompt references."""
+    return {
+        role: [compile_prompt(blobs[ref]).render(substitutions or {}) for ref in role_refs]
+        for role, role_refs in refs.items()
+    }
+
+def compact(
+    resolved_prompts: Dict[str, List[str]],
+    substitutions: Optional[Dict[str, Any]],
+    candidates: Dict[str, List[str]]
+) -> Optional[Tuple[Dict[str, List[str]], Dict[str, str]]]:
+    """
+    Prompt references that rehydrate to exactly ``resolved_prompts``, for rows stored before references.
+
+    Each resolved prompt is matched to one of the ``candidates`` (the template's
+    prompt texts by role) that renders to it with ``substitutions``; otherwise it
+    is stored as its own text when that renders to itself. Returns None when a
+    prompt cannot be represented either way.
+    """
+    prompts = {}
+    for role, texts in resolved_prompts.items():
+        if role not in ROLES:
+            return None
+        prompts[role] = []
+        for text in texts:
+            match = next(
+                (
+                    candidate for candidate in candidates.get(role, []) + [text]
+                    # Not compile_prompt: the texts of old rows would only churn its cache
+                    if parse_prompt(candidate).render(substitutions or {}) == text
+                ),
+                None
+            )
+            if match is None:
+                return None
+            prompts[role].append(match)
+    return prompt_refs(prompts)
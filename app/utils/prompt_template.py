@@ -0,0 +1,57 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple, Iterable
+
+# A placeholder as stored in ai_auto_placeholders.placeholder_key, e.g. "{{user_input}}"
+PLACEHOLDER_PATTERN = re.compile(r"\{\{[^{}]+\}\}")
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """
+    A prompt parsed into literal text and placeholder slots.
+
+    ``literals`` has one more entry than ``slots``: the text before the first
+    slot, between slots, and after the last one.
+    """
+    literals: Tuple[str, ...]
+    slots: Tuple[str, ...]
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """
+        Fill the slots with ``values`` in a single join.
+
+        Slots without a value are left as they are. Values are inserted verbatim,
+        so placeholders inside a value are never substituted.
+        """
+        parts = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            value = values.get(slot)
+            parts.append(slot if value is None else str(value))
+            parts.append(literal)
+        return "".join(parts)
+
+    def missing(self, values: Dict[str, Any]) -> List[str]:
+        """Slots that ``values`` has no value for, in order of first use."""
+        return [slot for slot in dict.fromkeys(self.slots) if slot not in values]
+
+def parse_prompt(prompt: str) -> CompiledPrompt:
+    """Parse a prompt into literal and slot segments."""
+    literals = []
+    slots = []
+    position = 0
+    for match in PLACEHOLDER_PATTERN.finditer(prompt):
+        literals.append(prompt[position:match.start()])
+        slots.append(match.group())
+        position = match.end()
+    literals.append(prompt[position:])
+    return CompiledPrompt(tuple(literals), tuple(slots))
+
+@lru_cache(maxsize=1024)
+def compile_prompt(prompt: str) -> CompiledPrompt:
+    """parse_prompt, cached by prompt text."""
+    return parse_prompt(prompt)
+
+def prompt_slots(prompts: Iterable[CompiledPrompt]) -> List[str]:
+    """Every slot used by ``prompts``, in order of first use."""
+    return list(dict.fromkeys(slot for prompt in prompts for slot in prompt.slots))
@@ -0,0 +1,45 @@
+import time
+import threading
+
+# 2024-01-01T00:00:00Z in milliseconds
+EPOCH_MS = 1704067200000
+
+TIMESTAMP_BITS = 41
+WORKER_BITS = 6
+SEQUENCE_BITS = 6
+
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+_MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+class SnowflakeGenerator:
+    """
+    Time-ordered 53-bit IDs that can be assigned without asking the database.
+
+    An ID is the milliseconds since EPOCH_MS (41 bits, good for ~69 years), the
+    worker ID (6 bits) and a sequence within the millisecond (6 bits). IDs stay
+    below 2**53, so they survive JSON numbers in browsers. Processes writing to
+    the same table need different worker IDs, so there is no default.
+    """
+
+    def __init__(self, worker_id: int):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be between 0 and {MAX_WORKER_ID}")
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self) -> int:
+        with self._lock:
+            # Never go back in time, even if the clock does
+            now = max(int(time.time() * 1000) - EPOCH_MS, self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & _MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond; wait for the next one
+                    while now <= self._last_ms:
+                        now = int(time.time() * 1000) - EPOCH_MS
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
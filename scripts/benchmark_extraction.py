@@ -0,0 +1,81 @@
+"""
+Compare placeholder extraction per placeholder against the single-pass keyword index.
+
+Runs both over synthetic CVs of increasing size, with the placeholders seeded by
+app/db/init_db.py plus optional extra ones to show how each scales:
+
+    python scripts/benchmark_extraction.py --words 1000 10000 50000 --extra-placeholders 100
+"""
+import os
+import sys
+import random
+import timeit
+import argparse
+
+# Add the parent directory to the path so we can import from app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.db.init_db import PLACEHOLDERS
+from app.utils.keyword_index import KeywordIndex
+
+VOCABULARY = (
+    "experienced engineer python postgresql kubernetes led team of five built data platform "
+    "improved latency by forty percent mentored juniors designed apis university degree in "
+    "computer science languages english indonesian skills projects contact email phone"
+).split()
+
+def extract_per_placeholder(user_input: str, placeholders: list) -> dict:
+    """The previous implementation: lowercase, split and search the input again for each placeholder."""
+    extracted_data = {}
+    for placeholder in placeholders:
+        key = placeholder["key"]
+        keyword = key.strip("{{}}").lower()
+        if keyword in user_input.lower():
+            words = user_input.lower().split()
+            if keyword in words:
+                idx = words.index(keyword)
+                if idx + 1 < len(words):
+                    extracted_data[key] = words[idx + 1]
+    return extracted_data
+
+def synthetic_cv(words: int, keywords: list, rng: random.Random) -> str:
+    """Random CV-like text with a keyword and a value every ~200 words."""
+    text = []
+    while len(text) < words:
+        text.extend(rng.choice(VOCABULARY) for _ in range(rng.randint(150, 250)))
+        text.extend([rng.choice(keywords), rng.choice(VOCABULARY)])
+    return " ".join(text)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark placeholder extraction.")
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 10000, 50000], help="CV sizes in words")
+    parser.add_argument("--extra-placeholders", type=int, default=0, help="Synthetic placeholders to add")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs to take the best of")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    placeholders = [
+        {"key": p["placeholder_key"], "priority": p["detection_priority"]}
+        for p in PLACEHOLDERS if p["placeholder_key"] != "{{user_input}}"
+    ]
+    placeholders += [{"key": f"{{{{extra{i}}}}}", "priority": 0} for i in range(args.extra_placeholders)]
+    keywords = [p["key"].strip("{}") for p in placeholders]
+
+    started = timeit.default_timer()
+    index = KeywordIndex(placeholders)
+    print(f"{len(placeholders)} placeholders, index built in {(timeit.default_timer() - started) * 1000:.2f} ms")
+
+    for words in args.words:
+        text = synthetic_cv(words, keywords, rng)
+        assert index.extract(text) == extract_per_placeholder(text, placeholders)
+
+        old = min(timeit.repeat(lambda: extract_per_placeholder(text, placeholders), number=1, repeat=args.repeat))
+        new = min(timeit.repeat(lambda: index.extract(text), number=1, repeat=args.repeat))
+        print(
+            f"{words:>7} words: per placeholder {old * 1000:8.2f} ms, "
+            f"keyword index {new * 1000:8.2f} ms ({old / new:.1f}x)"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare placeholder substitution with sequential str.replace against compiled prompts.
+
+Uses the prompts and placeholders seeded by app/db/init_db.py, with every
+placeholder given its default value (as extract_placeholders does):
+
+    python scripts/benchmark_placeholders.py --iterations 20000
+"""
+import os
+import sys
+import timeit
+import argparse
+
+# Add the parent directory to the path so we can import from app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.db.init_db import PROMPT_CONFIGS, PLACEHOLDERS
+from app.utils.prompt_template import compile_prompt
+
+USER_INPUT = (
+    "I am Jane Doe, a senior backend engineer with 8 years of experience in Python, "
+    "PostgreSQL and distributed systems. I prefer a minimal style in dark blue."
+)
+
+def replace_sequential(prompt: str, values: dict) -> str:
+    """The previous implementation: one str.replace over the whole prompt per placeholder."""
+    result = prompt
+    for key, value in values.items():
+        result = result.replace(key, str(value))
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark placeholder substitution.")
+    parser.add_argument("--iterations", type=int, default=20000, help="Renders of the full prompt set per run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs to take the best of")
+    args = parser.parse_args()
+
+    prompts = [config["prompt_content"] for config in PROMPT_CONFIGS]
+    values = {p["placeholder_key"]: p["default_value"] or "" for p in PLACEHOLDERS}
+    values["{{user_input}}"] = USER_INPUT
+    compiled = [compile_prompt(prompt) for prompt in prompts]
+
+    for prompt, compiled_prompt in zip(prompts, compiled):
+        assert compiled_prompt.render(values) == replace_sequential(prompt, values)
+
+    def run_sequential():
+        for prompt in prompts:
+            replace_sequential(prompt, values)
+
+    def run_compiled():
+        for compiled_prompt in compiled:
+            compiled_prompt.render(values)
+
+    def run_compile():
+        compile_prompt.cache_clear()
+        for prompt in prompts:
+            compile_prompt(prompt)
+
+    print(f"{len(prompts)} prompts, {sum(len(p) for p in prompts)} characters, {len(values)} placeholder values")
+    results = {}
+    for name, func in (("str.replace", run_sequential), ("compiled", run_compiled), ("compile", run_compile)):
+        best = min(timeit.repeat(func, number=args.iterations, repeat=args.repeat))
+        results[name] = best
+        print(f"{name:>12}: {best / args.iterations * 1e6:8.2f} us per prompt set")
+
+    print(f"Compiled rendering is {results['str.replace'] / results['compiled']:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Move the inline resolved prompts of stored user requests to prompt blobs.
+
+New requests already store references to their template's prompt texts; this
+rewrites the rows stored before that, in batches, so it can run while the app
+is serving. Rows whose prompts no longer match a template prompt keep them
+stored as their own blob. Use --dry-run to see the savings first:
+
+    python scripts/compact_prompts.py --batch-size 500 --dry-run
+
+On PostgreSQL the space of the rewritten rows is reused by new rows after the
+next autovacuum; run VACUUM FULL ai_user_requests to return it to the OS.
+"""
+import os
+import sys
+import argparse
+
+# Add the parent directory to the path so we can import from app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.crud.ai_templates import prompt_refs_supported
+from app.db.database import SessionLocal
+from app.services.prompt_store import compact_user_requests
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="report the savings without changing anything")
+    args = parser.parse_args()
+
+    totals = None
+    with SessionLocal() as db:
+        if not prompt_refs_supported(db):
+            print("ai_user_requests.resolved_prompts is NOT NULL in this database, so prompts have to stay inline")
+            return 1
+        for totals in compact_user_requests(db, batch_size=args.batch_size, dry_run=args.dry_run):
+            print(f"{totals['rows']} rows: {totals['compacted']} compacted, {totals['skipped']} skipped")
+
+    if totals is None:
+        print("No user requests with inline prompts")
+        return 0
+    saved = totals["inline_bytes"] - totals["new_blob_bytes"]
+    print(
+        f"{'Would move' if args.dry_run else 'Moved'} {totals['inline_bytes']} bytes of inline prompts "
+        f"to {totals['new_blob_bytes']} bytes of new prompt blobs ({saved} bytes saved)"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Generate websites for a JSONL or CSV file of inputs.
+
+Results are appended to an NDJSON output file as each item finishes. Running the
+same command again after an interruption skips the items already completed in
+the output file:
+
+    python scripts/generate_batch.py cohort.csv --website-type cv --style modern
+"""
+import os
+import sys
+import asyncio
+import argparse
+
+# Add the parent directory to the path so we can import from app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.services.batch_generator import BatchInputError, BatchJournal, batch_format, parse_batch, run_batch
+from app.services.llm_client import close_llm_client
+
+async def run(args: argparse.Namespace) -> int:
+    with open(args.input, "r", encoding="utf-8-sig") as f:
+        items = parse_batch(f.read(), args.format or batch_format(args.input))
+
+    output = args.output or os.path.splitext(args.input)[0] + ".results.ndjson"
+    journal = BatchJournal(output)
+    skipped = len(journal.completed())
+    if skipped:
+        print(f"Resuming: {skipped} items already completed in {output}")
+
+    finished = failed = 0
+    try:
+        async for result in run_batch(
+            items,
+            api_token=args.api_token,
+            website_type=args.website_type,
+            style=args.style,
+            concurrency=args.concurrency,
+            bypass_cache=args.fresh,
+            journal=journal,
+            replay=False
+        ):
+            finished += 1
+            if result["status"] != "completed":
+                failed += 1
+            detail = result.get("error") or f"{result.get('processing_time_ms')} ms"
+            print(f"[{skipped + finished}/{len(items)}] {result['id']}: {result['status']} ({detail})")
+    finally:
+        await close_llm_client()
+
+    print(f"Done: {finished - failed} completed, {failed} failed, results in {output}")
+    return 1 if failed else 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate websites for a batch of inputs.")
+    parser.add_argument("input", help="JSONL or CSV file with one item per line/row")
+    parser.add_argument("--output", help="NDJSON results file (default: <input>.results.ndjson)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from the file extension)")
+    parser.add_argument("--api-token", default=os.environ.get("OPENROUTER_API_TOKEN"), help="OpenRouter API token (default: $OPENROUTER_API_TOKEN)")
+    parser.add_argument("--website-type", help="Website type for items that do not set one")
+    parser.add_argument("--style", help="Style for items that do not set one")
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_CONCURRENCY, help="Generations to run at the same time")
+    parser.add_argument("--fresh", action="store_true", help="Bypass the generation cache")
+    args = parser.parse_args()
+
+    if not args.api_token:
+        parser.error("an API token is required (--api-token or $OPENROUTER_API_TOKEN)")
+
+    try:
+        sys.exit(asyncio.run(run(args)))
+    except BatchInputError as e:
+        parser.exit(2, f"Invalid batch file: {e}\n")
+
+if __name__ == "__main__":
+    main()
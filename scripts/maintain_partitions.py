@@ -0,0 +1,52 @@
+"""
+Create upcoming ai_user_requests partitions and archive expired ones (PostgreSQL only).
+
+Run it daily, e.g. from cron. Partitions older than the retention period
+(USER_REQUEST_RETENTION_MONTHS, or --retention-months) are exported to
+gzipped NDJSON files in the archive directory and then dropped:
+
+    python scripts/maintain_partitions.py --retention-months 12 --dry-run
+"""
+import os
+import sys
+import argparse
+
+# Add the parent directory to the path so we can import from app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.db.database import engine
+from app.db.partitions import DEFAULT_PARTITION, apply_retention, ensure_partitions, is_partitioned
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ahead", type=int, default=settings.USER_REQUEST_PARTITIONS_AHEAD,
+                        help="months to create partitions for after the current one")
+    parser.add_argument("--retention-months", type=int, default=settings.USER_REQUEST_RETENTION_MONTHS,
+                        help="whole months to keep before the current one (default: keep everything)")
+    parser.add_argument("--archive-dir", default=settings.USER_REQUEST_ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="list the partitions to archive without changing them")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            print("ai_user_requests is not partitioned (partitioning needs PostgreSQL); nothing to do")
+            return 0
+        if not args.dry_run:
+            for name in ensure_partitions(conn, args.ahead):
+                print(f"Created {name}")
+
+    if args.retention_months is None:
+        print("No retention period set; keeping all partitions")
+        return 0
+    for archived in apply_retention(engine, args.retention_months, args.archive_dir, dry_run=args.dry_run):
+        if args.dry_run and archived["partition"] == DEFAULT_PARTITION:
+            print(f"Would archive the expired rows of {archived['partition']}")
+        elif args.dry_run:
+            print(f"Would archive {archived['partition']}")
+        else:
+            print(f"Archived {archived['rows']} rows of {archived['partition']} to {archived['path']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Local stand-in for the OpenRouter chat completions API.
+
+Answers every request with a small HTML page and can be told to rate limit, which
+makes it possible to exercise the retry scheduler without a real API token:
+
+    python scripts/stub_openrouter.py --port 8089 --rate-limit-every 3 --retry-after 1
+    OPENROUTER_API_URL=http://127.0.0.1:8089/api/v1/chat/completions python main.py
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+HTML = """```html
+<!DOCTYPE html>
+<html>
+<head><title>Stub</title><style>body { font-family: sans-serif; }</style></head>
+<body><header class="header"><h1>Generated by the OpenRouter stub</h1></header></body>
+</html>
+```"""
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None
+    counter = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        with self.lock:
+            StubHandler.counter += 1
+            count = StubHandler.counter
+
+        options = self.options
+        if count <= options.fail_first or (options.rate_limit_every and count % options.rate_limit_every == 0):
+            self._send_json(429, {"error": {"code": 429, "message": "Rate limit exceeded: stub"}}, {
+                "Retry-After": str(options.retry_after),
+                "X-RateLimit-Limit": str(options.limit),
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Reset": str(int((time.time() + options.retry_after) * 1000))
+            })
+            return
+
+        time.sleep(options.delay)
+        headers = {
+            "X-RateLimit-Limit": str(options.limit),
+            "X-RateLimit-Remaining": str(max(0, options.limit - count)),
+            "X-RateLimit-Reset": str(int((time.time() + 60) * 1000))
+        }
+
+        if payload.get("stream"):
+            self._send_stream(headers)
+        else:
+            self._send_json(200, {
+                "id": f"stub-{count}",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": HTML}}]
+            }, headers)
+
+    def _send_json(self, status, body, headers):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, headers):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        for i in range(0, len(HTML), 16):
+            chunk = {"choices": [{"index": 0, "delta": {"content": HTML[i:i + 16]}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.options.stream_interval)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        print(f"[stub] {self.address_string()} {format % args}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a local OpenRouter stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N requests with 429")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--limit", type=int, default=1000, help="Request quota reported in rate-limit headers")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--stream-interval", type=float, default=0.01, help="Seconds between streamed chunks")
+    StubHandler.options = parser.parse_args()
+
+    server = ThreadingHTTPServer((StubHandler.options.host, StubHandler.options.port), StubHandler)
+    print(f"OpenRouter stub listening on http://{StubHandler.options.host}:{StubHandler.options.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
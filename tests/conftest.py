@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Response dumps, spill files, journals, archives and the database go to a temporary
+# directory, never the repository's logs/. Set before the app reads its settings.
+_LOGS_DIR = tempfile.mkdtemp(prefix="webwizard-test-logs-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_LOGS_DIR, 'test.db')}")
+os.environ.setdefault("LOGS_DIR", _LOGS_DIR)
+os.environ.setdefault("AUDIT_SPILL_PATH", os.path.join(_LOGS_DIR, "audit_spill.ndjson"))
+os.environ.setdefault("BATCH_JOURNAL_DIR", os.path.join(_LOGS_DIR, "batches"))
+os.environ.setdefault("USER_REQUEST_ARCHIVE_DIR", os.path.join(_LOGS_DIR, "archive"))
+
+import pytest
+
+from app.core.config import settings
+
+@pytest.fixture(autouse=True)
+def logs_dir(tmp_path, monkeypatch):
+    """Each test writes its response dumps to a directory of its own."""
+    path = tmp_path / "logs"
+    monkeypatch.setattr(settings, "LOGS_DIR", str(path))
+    return path
+
+@pytest.fixture
+def database():
+    """The app's database with empty tables."""
+    from app.db.database import Base, engine
+    import app.models.ai_templates  # noqa: F401 - registers the tables
+
+    Base.metadata.create_all(engine)
+    yield engine
+    Base.metadata.drop_all(engine)
+
+@pytest.fixture
+def cv_template(database):
+    """An active ``cv`` template with a system and a user prompt."""
+    from sqlalchemy.orm import Session
+    from app.models.ai_templates import AIPromptConfig, AIRequestTemplate, PromptRole
+
+    with Session(database) as session:
+        session.add_all([
+            AIRequestTemplate(id=1, type="cv", name="CV", is_active=True),
+            AIPromptConfig(id=1, template_id=1, role=PromptRole.SYSTEM, sequence_order=1,
+                           prompt_content="You build resumes."),
+            AIPromptConfig(id=2, template_id=1, role=PromptRole.USER, sequence_order=1,
+                           prompt_content="Build a resume for: {{user_input}}")
+        ])
+        session.commit()
+    return 1
+
+class OpenRouterStub:
+    """A local stand-in for the OpenRouter chat completions API."""
+
+    HTML = "```html\n<html><body><h1>Hello</h1></body></html>\n```"
+
+    def __init__(self):
+        self.requests = []
+        # Answer every request with this status (and headers) instead of a completion
+        self.status = 200
+        self.headers = {}
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def start(self) -> None:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                stub.requests.append(payload)
+                if stub.status != 200:
+                    self._send(stub.status, {"error": {"message": "stub error"}}, stub.headers)
+                else:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    for start in range(0, len(stub.HTML), 16):
+                        chunk = {"choices": [{"delta": {"content": stub.HTML[start:start + 16]}}]}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.close_connection = True
+
+            def _send(self, status, body, headers):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+@pytest.fixture
+def openrouter(monkeypatch):
+    """Point the app's LLM client at a local OpenRouter stub."""
+    from app.services import llm_client
+
+    stub = OpenRouterStub()
+    stub.start()
+    monkeypatch.setattr(settings, "OPENROUTER_API_URL", stub.url)
+    monkeypatch.setattr(settings, "GENERATION_CACHE_ENABLED", False)
+    # A fresh client picks up the URL and starts with no rate-limit state
+    monkeypatch.setattr(llm_client, "_client", None)
+    yield stub
+    stub.stop()
+
+@pytest.fixture
+def client(database, openrouter):
+    """A test client of the app, running its startup and shutdown hooks."""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_LOGS_DIR, ignore_errors=True)
@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from app.services.html_pipeline import PHOTO_CSS, PHOTO_REFERENCE, PhotoInjectionStage, postprocess_html
+from app.services.website_generator import FenceStripper
+
+def reference(text):
+    return text.replace("```html", "").replace("```", "").strip()
+
+def stream(chunks):
+    stripper = FenceStripper()
+    return "".join(stripper.feed(chunk) for chunk in chunks) + stripper.finish()
+
+OUTPUTS = [
+    "```html\n<html><body>Hi</body></html>\n```",
+    "  \n```html\n<p>a</p>\n```\n  ",
+    "<p>no fences</p>",
+    "```html```html\n<p>twice</p>```",
+    "<pre>``x``</pre> `` and ``",
+    "<p>ends with backticks</p>``",
+    "<p>ends with a partial fence</p>```ht",
+    "```\n\n```",
+    "   ",
+    ""
+]
+
+@pytest.mark.parametrize("text", OUTPUTS)
+def test_fence_stripper_matches_whole_output(text):
+    assert stream([text]) == reference(text)
+
+@pytest.mark.parametrize("text", OUTPUTS)
+def test_fence_stripper_single_characters(text):
+    assert stream(list(text)) == reference(text)
+
+def random_outputs(count, seed=7):
+    """Model output made of fences, stray backticks and the text around them."""
+    rng = random.Random(seed)
+    alphabet = ["`", "```", "```html", "html", "h", " ", "\n", "<p>", "x"]
+    for _ in range(count):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        cuts = sorted(rng.sample(range(len(text) + 1), rng.randint(0, len(text) + 1)))
+        yield text, [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+def test_fence_stripper_random_chunks():
+    for text, chunks in random_outputs(2000):
+        assert stream(chunks) == reference(text), (text, chunks)
+
+def test_fence_split_across_chunks_is_held_back():
+    stripper = FenceStripper()
+    assert stripper.feed("<p>a</p>``") == "<p>a</p>"
+    assert stripper.feed("`ht") == ""
+    assert stripper.feed("ml<p>b</p>") == "<p>b</p>"
+    assert stripper.finish() == ""
+
+def test_trailing_whitespace_is_only_emitted_before_more_text():
+    stripper = FenceStripper()
+    assert stripper.feed("<p>a</p>\n") == "<p>a</p>"
+    assert stripper.feed("\n<p>b</p>") == "\n\n<p>b</p>"
+    assert stripper.feed("\n```\n") == ""
+    assert stripper.finish() == ""
+
+@pytest.mark.parametrize("text", OUTPUTS)
+def test_pipeline_strips_like_the_stream(text):
+    assert postprocess_html(text) == reference(text)
+
+def test_pipeline_random_outputs():
+    for text, _ in random_outputs(2000, seed=11):
+        assert postprocess_html(text) == reference(text), text
+
+def test_pipeline_strips_backticks_joined_by_a_removed_fence():
+    assert postprocess_html("x ``" + "```html" + "` y") == "x  y"
+    assert postprocess_html("````html<p>a</p>") == "`<p>a</p>"
+
+def test_pipeline_strips_whitespace_between_fences():
+    assert postprocess_html(" \n```html\n \n```html <p>a</p> ``` \n ``` ") == "<p>a</p>"
+
+def test_pipeline_without_photo_leaves_page_alone():
+    html = f'<div class="profile"><img src="{PHOTO_REFERENCE}"></div><style></style></body>'
+    assert postprocess_html(html) == html
+
+def test_photo_reference_is_swapped():
+    html = f'<img src="{PHOTO_REFERENCE}"><p>{PHOTO_REFERENCE}</p></body>'
+    assert postprocess_html(html, photo_src="/p.jpg") == '<img src="/p.jpg"><p>/p.jpg</p></body>'
+
+def test_placeholder_is_filled_with_srcset():
+    html = f'<img {PhotoInjectionStage.PLACEHOLDER} alt="me"></body>'
+    result = postprocess_html(html, photo_src="/p.jpg", photo_srcset="/p-2x.jpg 2x")
+    assert result == '<img id="profile-photo" src="/p.jpg" srcset="/p-2x.jpg 2x" alt="me"></body>'
+
+def test_photo_goes_into_the_preferred_container():
+    html = '<header id="top"></header><div class="about" id="a"><p>x</p></div></body>'
+    result = postprocess_html(html, photo_src="/p.jpg")
+    assert result.startswith('<header id="top"></header><div class="about" id="a"><img src="/p.jpg"')
+    assert result.count("/p.jpg") == 1
+
+def test_photo_falls_back_to_before_body_close():
+    result = postprocess_html("<main></main></body></html>", photo_src="/p.jpg")
+    assert result.startswith('<main></main><img src="/p.jpg"')
+    assert result.endswith('class="profile-photo" style="max-width: 300px; border-radius: 8px; margin: 20px auto; display: block;"></body></html>')
+
+def test_photo_without_container_or_body_is_not_added():
+    assert postprocess_html("<p>x</p>", photo_src="/p.jpg") == "<p>x</p>"
+
+def test_photo_css_is_added_to_first_stylesheet_once():
+    html = "<style>a{}</style><style></style></body>"
+    result = postprocess_html(html, photo_src="/p.jpg")
+    assert result.startswith("<style>a{}" + PHOTO_CSS + "</style><style></style>")
+    styled = '<style>.profile-photo{}</style></body>'
+    assert postprocess_html(styled, photo_src="/p.jpg").startswith(styled[:-len("</body>")])
+
+def test_fences_and_photo_together():
+    html = f'```html\n<div class="profile"><img src="{PHOTO_REFERENCE}"></div>\n```'
+    assert postprocess_html(html, photo_src="/p.jpg") == '<div class="profile"><img src="/p.jpg"></div>'
@@ -0,0 +1,120 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.model_router import ModelRouter
+
+def status_error(status_code):
+    request = httpx.Request("POST", "https://openrouter.test/v1/chat")
+    return httpx.HTTPStatusError(f"{status_code}", request=request, response=httpx.Response(status_code, request=request))
+
+class FakeClient:
+    """
+    Streams scripted answers per model: a delay before the first chunk, then the
+    chunks, or an exception instead.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.launched = []
+        self.cancelled = []
+
+    async def stream_chat_completion(self, api_token, payload):
+        model = payload["model"]
+        self.launched.append(model)
+        delay, answer = self.script[model]
+        try:
+            await asyncio.sleep(delay)
+            if isinstance(answer, Exception):
+                raise answer
+            for chunk in answer:
+                yield chunk
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+
+def router(script, **kwargs):
+    client = FakeClient(script)
+    options = {"default_delay_ms": 50, "min_delay_ms": 10, "max_delay_ms": 1000, **kwargs}
+    return ModelRouter(list(script), client=client, **options), client
+
+def complete(router):
+    return asyncio.run(router.complete("token", {"model": router.models[0], "messages": []}))
+
+def stream(router):
+    async def collect():
+        return [delta async for delta in router.stream("token", {"model": router.models[0], "messages": []})]
+    return asyncio.run(collect())
+
+def test_fast_primary_is_not_hedged():
+    model_router, client = router({"primary": (0, ["<html>", "</html>"]), "backup": (0, ["other"])})
+
+    assert complete(model_router) == ("<html></html>", "primary")
+    assert client.launched == ["primary"]
+    assert model_router.hedges == 0
+
+def test_slow_primary_is_hedged_and_the_first_to_finish_wins():
+    model_router, client = router({"primary": (2.0, ["slow"]), "backup": (0, ["<html>", "</html>"])})
+
+    assert complete(model_router) == ("<html></html>", "backup")
+    assert client.launched == ["primary", "backup"]
+    assert client.cancelled == ["primary"]
+    assert model_router.hedges == 1
+    assert model_router.stats_for("backup").wins == 1
+
+def test_failed_primary_fails_over_without_waiting_for_the_hedge_delay():
+    model_router, client = router(
+        {"primary": (0, status_error(503)), "backup": (0, ["ok"])}, default_delay_ms=1000, min_delay_ms=1000
+    )
+
+    async def timed():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await model_router.complete("token", {"model": "primary", "messages": []})
+        return result, loop.time() - started
+
+    (content, model), elapsed = asyncio.run(timed())
+    assert (content, model) == ("ok", "backup")
+    assert elapsed < 0.5
+    assert model_router.hedges == 0
+    assert model_router.stats_for("primary").failures == 1
+
+def test_errors_another_model_cannot_fix_are_raised_without_failover():
+    model_router, client = router({"primary": (0, status_error(401)), "backup": (0, ["ok"])})
+
+    with pytest.raises(httpx.HTTPStatusError):
+        complete(model_router)
+    assert client.launched == ["primary"]
+
+def test_last_error_is_raised_when_every_model_fails():
+    model_router, client = router({"primary": (0, status_error(503)), "backup": (0, status_error(502))})
+
+    with pytest.raises(httpx.HTTPStatusError) as raised:
+        complete(model_router)
+    assert raised.value.response.status_code == 502
+    assert client.launched == ["primary", "backup"]
+
+def test_stream_follows_the_first_model_to_answer():
+    model_router, client = router({"primary": (2.0, ["slow"]), "backup": (0, ["<html>", "<body>", "</html>"])})
+
+    assert stream(model_router) == ["<html>", "<body>", "</html>"]
+    assert client.cancelled == ["primary"]
+    assert model_router.hedges == 1
+
+def test_stream_fails_over_when_the_primary_fails_before_answering():
+    model_router, client = router({"primary": (0, status_error(503)), "backup": (0, ["a", "b"])})
+
+    assert stream(model_router) == ["a", "b"]
+    assert client.launched == ["primary", "backup"]
+
+def test_hedge_delay_follows_the_observed_first_token_quantile():
+    model_router, _ = router({"primary": (0, ["x"])}, min_samples=5, quantile=0.95)
+    assert model_router.hedge_delay("primary") == 0.05
+
+    model_router.stats_for("primary").ttft_ms.extend([100, 120, 150, 200, 400])
+    assert model_router.hedge_delay("primary") == 0.4
+
+    model_router.stats_for("primary").ttft_ms.extend([5000] * 20)
+    assert model_router.hedge_delay("primary") == 1.0
@@ -0,0 +1,141 @@
+import gzip
+import json
+import os
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.db import partitions
+from app.db.partitions import (
+    DEFAULT_PARTITION,
+    _month_start,
+    apply_retention,
+    ensure_partitions,
+    expired_partitions,
+    partition_name,
+    partition_user_requests,
+    retention_cutoff
+)
+
+@pytest.mark.parametrize("day, months, expected", [
+    (date(2026, 11, 15), 0, date(2026, 11, 1)),
+    (date(2026, 11, 15), 2, date(2027, 1, 1)),
+    (date(2026, 1, 31), -1, date(2025, 12, 1)),
+    (date(2026, 3, 1), -14, date(2025, 1, 1)),
+    (date(2026, 12, 1), 1, date(2027, 1, 1))
+])
+def test_month_start(day, months, expected):
+    assert _month_start(day, months) == expected
+
+def test_partition_name():
+    assert partition_name(date(2027, 1, 1)) == "ai_user_requests_p202701"
+
+class RecordingConnection:
+    """Stands in for a PostgreSQL connection with ai_user_requests partitioned, recording the SQL."""
+
+    dialect = SimpleNamespace(name="postgresql")
+
+    def __init__(self, bounds):
+        # Partition bounds as pg_get_expr returns them, by partition name
+        self.bounds = bounds
+        self.statements = []
+
+    def execute(self, statement, params=None, **kwargs):
+        sql = str(statement)
+        self.statements.append((sql, params))
+        if sql.startswith("SELECT relkind"):
+            return SimpleNamespace(scalar=lambda: "p")
+        if "pg_inherits" in sql:
+            return list(self.bounds.items())
+        return SimpleNamespace(rowcount=0)
+
+@pytest.fixture
+def this_month(monkeypatch):
+    monkeypatch.setattr(partitions, "_this_month", lambda: date(2026, 11, 1))
+
+def test_ensure_partitions_creates_the_missing_months(this_month):
+    conn = RecordingConnection({
+        "ai_user_requests_legacy": "FOR VALUES FROM (MINVALUE) TO ('2026-12-01 00:00:00+00')",
+        DEFAULT_PARTITION: "DEFAULT"
+    })
+    assert ensure_partitions(conn, ahead=2) == ["ai_user_requests_p202612", "ai_user_requests_p202701"]
+
+    statements = [sql for sql, _ in conn.statements]
+    assert "CREATE TABLE ai_user_requests_p202612 (LIKE ai_user_requests INCLUDING DEFAULTS INCLUDING CONSTRAINTS)" in statements
+    assert (
+        "ALTER TABLE ai_user_requests ATTACH PARTITION ai_user_requests_p202701 "
+        "FOR VALUES FROM ('2027-01-01 00:00:00+00') TO ('2027-02-01 00:00:00+00')"
+    ) in statements
+    moves = [(sql, params) for sql, params in conn.statements if sql.startswith(f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION}")]
+    assert [params for _, params in moves] == [
+        {"lower": "2026-12-01 00:00:00+00", "upper": "2027-01-01 00:00:00+00"},
+        {"lower": "2027-01-01 00:00:00+00", "upper": "2027-02-01 00:00:00+00"}
+    ]
+    assert moves[0][0].endswith("RETURNING *) INSERT INTO ai_user_requests_p202612 SELECT * FROM moved")
+
+def test_expired_partitions(this_month):
+    conn = RecordingConnection({
+        "ai_user_requests_legacy": "FOR VALUES FROM (MINVALUE) TO ('2025-06-01 00:00:00+00')",
+        "ai_user_requests_p202510": "FOR VALUES FROM ('2025-10-01 00:00:00+00') TO ('2025-11-01 00:00:00+00')",
+        "ai_user_requests_p202511": "FOR VALUES FROM ('2025-11-01 00:00:00+00') TO ('2025-12-01 00:00:00+00')",
+        DEFAULT_PARTITION: "DEFAULT"
+    })
+    assert retention_cutoff(12) == datetime(2025, 11, 1, tzinfo=timezone.utc)
+    assert expired_partitions(conn, 12) == ["ai_user_requests_legacy", "ai_user_requests_p202510"]
+
+@pytest.fixture
+def pg_engine():
+    """An engine on a throwaway schema of the database at TEST_POSTGRES_URL."""
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    from app.db.database import Base
+    import app.models.ai_templates  # noqa: F401 - registers the tables
+
+    schema = f"partitions_test_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    Base.metadata.create_all(engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
+
+@pytest.mark.pg
+def test_retention_archives_expired_rows_of_the_default_partition(pg_engine, tmp_path):
+    with pg_engine.begin() as conn:
+        partition_user_requests(conn)
+        # As after the legacy partition was archived: old rows now land in the default partition
+        conn.execute(text("ALTER TABLE ai_user_requests DETACH PARTITION ai_user_requests_legacy"))
+        conn.execute(text("DROP TABLE ai_user_requests_legacy"))
+        ensure_partitions(conn)
+        conn.execute(text("INSERT INTO ai_request_templates (id, type, name, is_active) VALUES (1, 'cv', 'CV', true)"))
+        now = datetime.now(timezone.utc)
+        for request_id, created_at in [(1, now - timedelta(days=3 * 365)), (2, now - timedelta(days=60)), (3, now)]:
+            conn.execute(text(
+                "INSERT INTO ai_user_requests (id, template_id, user_input, resolved_prompts, status, created_at) "
+                "VALUES (:id, 1, 'input', '{}', 'COMPLETED', :created_at)"
+            ), {"id": request_id, "created_at": created_at})
+
+    assert apply_retention(pg_engine, months=3, directory=str(tmp_path), dry_run=True) == [
+        {"partition": DEFAULT_PARTITION, "path": None, "rows": None}
+    ]
+    [archived] = apply_retention(pg_engine, months=3, directory=str(tmp_path))
+    assert archived["partition"] == DEFAULT_PARTITION
+    assert archived["rows"] == 1
+    with gzip.open(archived["path"], "rt", encoding="utf-8") as f:
+        assert [json.loads(line)["id"] for line in f] == [1]
+
+    with pg_engine.connect() as conn:
+        assert conn.execute(text(f"SELECT id FROM {DEFAULT_PARTITION}")).scalars().all() == [2]
+        assert conn.execute(text("SELECT count(*) FROM ai_user_requests")).scalar() == 2
+    # Nothing left to archive
+    assert apply_retention(pg_engine, months=3, directory=str(tmp_path)) == []
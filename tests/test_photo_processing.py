@@ -0,0 +1,26 @@
+import struct
+import zlib
+
+import pytest
+
+from app.services.photo_processing import PhotoTooLargeError, process_photo
+
+def _png_header(width: int, height: int) -> bytes:
+    """A PNG that only declares its dimensions, with no pixel data."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IEND", b"")
+
+def test_decompression_bomb_is_too_large():
+    with pytest.raises(PhotoTooLargeError):
+        process_photo(_png_header(100_000, 100_000))
+
+def test_decompression_bomb_upload_is_413(client, openrouter):
+    response = client.post(
+        "/api/v1/website/generate",
+        data={"website_type": "cv", "content": "My resume", "style": "modern", "api_token": "test-token"},
+        files={"photo": ("me.png", _png_header(100_000, 100_000), "image/png")}
+    )
+    assert response.status_code == 413
+    assert openrouter.requests == []
@@ -0,0 +1,17 @@
+from sqlalchemy import create_engine
+
+from app.core.config import settings
+from app.db.pool import MeasuredQueuePool, PoolMetrics, attach_metrics
+
+def test_stats_report_the_configured_pool_limits(monkeypatch):
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 3)
+    engine = create_engine("sqlite://", poolclass=MeasuredQueuePool, pool_size=2, max_overflow=settings.DB_MAX_OVERFLOW)
+    metrics = PoolMetrics("test")
+    attach_metrics(engine.pool, metrics)
+
+    with engine.connect():
+        stats = metrics.stats()
+    assert stats["checkouts"] == 1
+    assert stats["checked_out"] == 1
+    assert stats["max_connections"] == 5
+    engine.dispose()
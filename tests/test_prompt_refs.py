@@ -0,0 +1,32 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.crud.ai_templates import prompt_refs_supported
+from app.db.database import Base
+from app.db.migrations import _user_request_prompt_refs
+from app.utils.prompt_refs import prompt_refs, rehydrate
+
+def test_refs_rehydrate_to_the_resolved_prompts():
+    templates = {"system": ["You write {{style}} sites."], "user": ["Make a CV for {{user_input}}"]}
+    refs, blobs = prompt_refs(templates)
+    assert set(blobs.values()) == {"You write {{style}} sites.", "Make a CV for {{user_input}}"}
+    extracted = {"{{style}}": "modern", "{{user_input}}": "Ann"}
+    assert rehydrate(refs, extracted, blobs) == {"system": ["You write modern sites."], "user": ["Make a CV for Ann"]}
+
+def test_refs_are_supported_on_a_new_database():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        assert prompt_refs_supported(db)
+
+def test_refs_are_not_used_while_resolved_prompts_is_not_null():
+    # SQLite cannot drop NOT NULL, so a table from before migration 0004 keeps it
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE ai_user_requests (id INTEGER PRIMARY KEY, template_id INTEGER NOT NULL, "
+            "user_input TEXT NOT NULL, extracted_data JSON, resolved_prompts JSON NOT NULL)"
+        ))
+        _user_request_prompt_refs(conn)
+    with Session(engine) as db:
+        assert not prompt_refs_supported(db)
@@ -0,0 +1,14 @@
+import json
+
+from app.api.endpoints.website import _log_final_html
+from app.services.website_generator import _log_ai_response, _log_html
+
+def test_dumps_go_to_the_logs_dir(logs_dir):
+    _log_ai_response({"content": "<p>a</p>"})
+    _log_html("<p>a</p>")
+    _log_final_html("<p>b</p>")
+
+    [response] = (logs_dir / "ai_responses").iterdir()
+    assert json.loads(response.read_text()) == {"content": "<p>a</p>"}
+    dumps = sorted(path.name.split("_")[0] for path in (logs_dir / "html_dumps").iterdir())
+    assert dumps == ["final", "html"]
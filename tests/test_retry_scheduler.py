@@ -0,0 +1,152 @@
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.services import retry_scheduler
+from app.services.retry_scheduler import RateLimitError, RetryScheduler, parse_reset, parse_retry_after
+
+class FakeClock:
+    """Stands in for the scheduler's time and sleep, so waits are recorded instead of slept."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(retry_scheduler, "time", clock)
+    monkeypatch.setattr(retry_scheduler, "asyncio", SimpleNamespace(sleep=clock.sleep))
+    return clock
+
+def respond(status_code, headers=None):
+    request = httpx.Request("POST", "https://openrouter.test/v1/chat")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    if status_code >= 400:
+        raise httpx.HTTPStatusError(f"{status_code}", request=request, response=response)
+    return response
+
+def calls(*responses):
+    """A call that returns (or raises) the given responses in turn, counting attempts."""
+    pending = list(responses)
+
+    async def call():
+        call.attempts += 1
+        status_code, headers = pending.pop(0)
+        return respond(status_code, headers)
+
+    call.attempts = 0
+    return call
+
+def test_retry_after_seconds_is_honoured(clock):
+    scheduler = RetryScheduler(max_retries=3)
+    call = calls((429, {"retry-after": "7"}), (200, None))
+
+    response = asyncio.run(scheduler.run("token", call))
+
+    assert response.status_code == 200
+    assert call.attempts == 2
+    assert clock.sleeps == [7.0]
+    assert scheduler.retries == 1
+
+def test_retry_after_http_date_is_honoured(clock):
+    scheduler = RetryScheduler(max_retries=3)
+    at = datetime.fromtimestamp(clock.now, timezone.utc) + timedelta(seconds=30)
+    call = calls((503, {"retry-after": format_datetime(at, usegmt=True)}), (200, None))
+
+    asyncio.run(scheduler.run("token", call))
+
+    assert clock.sleeps == [30.0]
+
+def test_backoff_is_used_without_retry_after(clock, monkeypatch):
+    scheduler = RetryScheduler(max_retries=3, base_delay=0.5)
+    monkeypatch.setattr(retry_scheduler.random, "uniform", lambda low, high: high)
+    call = calls((502, None), (502, None), (200, None))
+
+    asyncio.run(scheduler.run("token", call))
+
+    assert clock.sleeps == [0.5, 1.0]
+
+def test_exhausted_quota_is_waited_out_before_calling(clock):
+    scheduler = RetryScheduler()
+    reset_at_ms = int((clock.now + 12) * 1000)
+    asyncio.run(scheduler.run("token", calls(
+        (200, {"x-ratelimit-remaining": "0", "x-ratelimit-limit": "20", "x-ratelimit-reset": str(reset_at_ms)})
+    )))
+    assert clock.sleeps == []
+
+    call = calls((200, {"x-ratelimit-remaining": "19"}))
+    asyncio.run(scheduler.run("token", call))
+
+    assert clock.sleeps == [12.0]
+    assert call.attempts == 1
+    # Other tokens are not paced by this token's quota
+    asyncio.run(scheduler.run("other", calls((200, None))))
+    assert clock.sleeps == [12.0]
+
+def test_quota_reset_past_the_deadline_fails_without_calling(clock):
+    scheduler = RetryScheduler(deadline=10)
+    asyncio.run(scheduler.run("token", calls((200, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "60"}))))
+    call = calls((200, None))
+
+    with pytest.raises(RateLimitError) as raised:
+        asyncio.run(scheduler.run("token", call))
+
+    assert call.attempts == 0
+    assert raised.value.retry_after == pytest.approx(60)
+
+def test_retry_after_past_the_deadline_raises_rate_limit_error(clock):
+    scheduler = RetryScheduler(deadline=10)
+    call = calls((429, {"retry-after": "30"}))
+
+    with pytest.raises(RateLimitError) as raised:
+        asyncio.run(scheduler.run("token", call))
+
+    assert call.attempts == 1
+    assert clock.sleeps == []
+    assert raised.value.retry_after == 30
+
+def test_non_retryable_errors_are_not_retried(clock):
+    scheduler = RetryScheduler()
+    call = calls((401, None))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(scheduler.run("token", call))
+
+    assert call.attempts == 1
+    assert clock.sleeps == []
+
+def test_retries_stop_after_max_retries(clock):
+    scheduler = RetryScheduler(max_retries=2)
+    call = calls((503, {"retry-after": "1"}), (503, {"retry-after": "1"}), (503, {"retry-after": "1"}))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(scheduler.run("token", call))
+
+    assert call.attempts == 3
+    assert clock.sleeps == [1.0, 1.0]
+
+def test_parse_retry_after_rejects_garbage():
+    assert parse_retry_after(httpx.Headers({"retry-after": "soon"})) is None
+    assert parse_retry_after(httpx.Headers({})) is None
+    assert parse_retry_after(httpx.Headers({"retry-after": "-5"})) == 0.0
+
+def test_parse_reset_accepts_milliseconds_seconds_and_deltas(clock):
+    assert parse_reset("1700000100000") == 1_700_000_100.0
+    assert parse_reset("1700000100") == 1_700_000_100.0
+    assert parse_reset("30") == clock.now + 30
+    assert parse_reset("tomorrow") is None
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "html"
+
+    async def main():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert results == ["html"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "coalesced": 4, "handed_over": 0}
+
+def test_followers_receive_the_leaders_exception():
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def main():
+        flight = SingleFlight("test")
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_cancelled_leader_hands_the_call_to_its_followers():
+    started = []
+
+    async def work():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return len(started)
+
+    async def main():
+        flight = SingleFlight("test")
+        leader = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.do("key", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    # One follower ran the work again and the others joined it
+    assert results == [2, 2, 2]
+    assert flight.handed_over == 3
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    async def work():
+        await asyncio.sleep(0.03)
+        return "html"
+
+    async def main():
+        flight = SingleFlight("test")
+        leader = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(main()) == "html"
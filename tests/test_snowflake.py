@@ -0,0 +1,19 @@
+import pytest
+
+from app.utils.snowflake import MAX_WORKER_ID, SEQUENCE_BITS, SnowflakeGenerator
+
+def test_ids_are_increasing_and_carry_the_worker_id():
+    generator = SnowflakeGenerator(5)
+    ids = [generator.next_id() for _ in range(1000)]
+    assert ids == sorted(set(ids))
+    assert {(request_id >> SEQUENCE_BITS) & MAX_WORKER_ID for request_id in ids} == {5}
+    assert max(ids) < 2 ** 53
+
+def test_worker_ids_keep_processes_apart():
+    first, second = SnowflakeGenerator(1), SnowflakeGenerator(2)
+    assert not {first.next_id() for _ in range(500)} & {second.next_id() for _ in range(500)}
+
+@pytest.mark.parametrize("worker_id", [-1, MAX_WORKER_ID + 1])
+def test_worker_id_out_of_range(worker_id):
+    with pytest.raises(ValueError):
+        SnowflakeGenerator(worker_id)
@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.crud.ai_templates import get_complete_template, load_template_bundle
+from app.db.database import Base, count_queries
+from app.models.ai_templates import (
+    AIAutoPlaceholder,
+    AIPromptConfig,
+    AIRequestTemplate,
+    PlaceholderScope,
+    PromptRole
+)
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        AIRequestTemplate(id=1, type="cv", name="CV", is_active=True),
+        AIRequestTemplate(id=2, type="cv", name="Old CV", is_active=False),
+        AIRequestTemplate(id=3, type="blog_post", name="Blog", is_active=True),
+        AIPromptConfig(id=1, template_id=1, role=PromptRole.USER, sequence_order=2, prompt_content="user 2"),
+        AIPromptConfig(id=2, template_id=1, role=PromptRole.SYSTEM, sequence_order=1, prompt_content="system 1"),
+        AIPromptConfig(id=3, template_id=1, role=PromptRole.USER, sequence_order=1, prompt_content="user 1"),
+        AIPromptConfig(id=4, template_id=2, role=PromptRole.USER, sequence_order=1, prompt_content="old"),
+        AIAutoPlaceholder(id=1, placeholder_key="{{skills}}", placeholder_label="Skills",
+                          scope=PlaceholderScope.TYPE_SPECIFIC, applicable_types=["cv", "portfolio"]),
+        AIAutoPlaceholder(id=2, placeholder_key="{{name}}", placeholder_label="Name",
+                          scope=PlaceholderScope.GLOBAL),
+        AIAutoPlaceholder(id=3, placeholder_key="{{title}}", placeholder_label="Title",
+                          scope=PlaceholderScope.TYPE_SPECIFIC, applicable_types=["blog_post"]),
+        AIAutoPlaceholder(id=4, placeholder_key="{{email}}", placeholder_label="Email",
+                          scope=PlaceholderScope.GLOBAL)
+    ])
+    session.commit()
+    # Loads below have to go to the database
+    session.expunge_all()
+    yield session
+    session.close()
+    engine.dispose()
+
+def test_bundle_takes_two_queries(db):
+    with count_queries(db) as queries:
+        template, prompt_configs, placeholders = load_template_bundle(db, "cv")
+    assert queries.count == 2, queries.statements
+
+    assert template.id == 1
+    assert [config.prompt_content for config in prompt_configs] == ["system 1", "user 1", "user 2"]
+    # Global first, then the ones for this type
+    assert [placeholder.id for placeholder in placeholders] == [2, 4, 1]
+
+def test_placeholders_do_not_multiply_the_config_rows(db):
+    with count_queries(db) as queries:
+        load_template_bundle(db, "cv")
+    config_query = queries.statements[0]
+    assert "ai_prompt_configs" in config_query
+    assert "ai_auto_placeholders" not in config_query
+
+def test_template_without_configs(db):
+    with count_queries(db) as queries:
+        template, prompt_configs, placeholders = load_template_bundle(db, "blog_post")
+    assert queries.count == 2
+    assert template.id == 3
+    assert prompt_configs == []
+    assert [placeholder.id for placeholder in placeholders] == [2, 4, 3]
+
+def test_missing_template_takes_one_query(db):
+    with count_queries(db) as queries:
+        assert load_template_bundle(db, "portfolio") == (None, [], [])
+    assert queries.count == 1
+
+def test_complete_template_loads_no_more(db):
+    with count_queries(db) as queries:
+        bundle = get_complete_template(db, "cv")
+    assert queries.count == 2
+    assert bundle["system_prompts"] == ["system 1"]
+    assert bundle["user_prompts"] == ["user 1", "user 2"]
+    assert [p["key"] for p in bundle["available_placeholders"]] == ["{{name}}", "{{email}}", "{{skills}}"]
@@ -0,0 +1,69 @@
+import json
+import time
+
+from app.core.config import settings
+
+FORM = {"content": "A site about my bakery", "style": "modern", "api_token": "test-token"}
+
+def test_stream_without_a_template_is_not_found(client, openrouter):
+    response = client.post("/api/v1/website/generate/stream", data={**FORM, "website_type": "unknown"})
+    assert response.status_code == 404
+    assert openrouter.requests == []
+
+def test_background_without_a_template_is_not_found(client, openrouter):
+    response = client.post("/api/v1/website/generate", data={**FORM, "website_type": "unknown", "background": "true"})
+    assert response.status_code == 404
+    assert openrouter.requests == []
+
+def test_sync_without_a_template_uses_the_fallback_prompt(client, openrouter):
+    response = client.post("/api/v1/website/generate", data={**FORM, "website_type": "unknown"})
+    assert response.status_code == 200
+    assert "<h1>Hello</h1>" in response.json()["html"]
+    assert len(openrouter.requests) == 1
+
+def _rate_limit(openrouter):
+    openrouter.status = 429
+    openrouter.headers = {"Retry-After": "600"}
+
+def test_rate_limited_generation_is_429_with_retry_after(client, openrouter):
+    _rate_limit(openrouter)
+    response = client.post("/api/v1/website/generate", data={**FORM, "website_type": "unknown"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "600"
+
+def test_rate_limited_stream_says_so(client, openrouter, cv_template):
+    _rate_limit(openrouter)
+    response = client.post("/api/v1/website/generate/stream", data={**FORM, "website_type": "cv"})
+    assert response.status_code == 200
+    event, data = response.text.strip().split("\n")
+    assert event == "event: error"
+    error = json.loads(data.removeprefix("data: "))
+    assert error["rate_limited"] is True
+    assert error["retry_after"] == 600
+
+def test_rate_limited_batch_item_says_so(client, openrouter):
+    _rate_limit(openrouter)
+    response = client.post(
+        "/api/v1/website/generate/batch",
+        data={"api_token": FORM["api_token"], "website_type": "unknown", "style": "modern"},
+        files={"file": ("batch.jsonl", json.dumps({"id": "a", "content": FORM["content"]}) + "\n")}
+    )
+    result = json.loads(response.text)
+    assert result["status"] == "rate_limited"
+    assert result["retry_after"] == 600
+
+def test_job_records_the_compaction_of_its_prompt(client, openrouter, cv_template, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_PROMPT_TOKENS", 100)
+    content = "\n\n".join(["My bakery sells cakes."] * 50)
+    response = client.post("/api/v1/website/generate", data={**FORM, "content": content, "website_type": "cv", "background": "true"})
+    request_id = response.json()["request_id"]
+
+    for _ in range(100):
+        job = client.get(f"/api/v1/website/jobs/{request_id}").json()
+        if job["status"] == "completed":
+            break
+        time.sleep(0.05)
+    assert job["status"] == "completed"
+    assert job["prompt_compaction"] == ["dedupe"]
+    assert job["prompt_tokens"] < job["prompt_tokens_original"]
+    assert openrouter.requests[0]["messages"][-1]["content"].count("My bakery sells cakes.") == 1
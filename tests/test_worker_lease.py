@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base
+from app.models.ai_templates import AIWorkerLease
+from app.services.audit_sink import AuditSink
+from app.services.worker_lease import WorkerLease, WorkerLeaseError
+from app.utils.snowflake import MAX_WORKER_ID, SEQUENCE_BITS
+
+@pytest.fixture
+def sessions(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'leases.db'}")
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+def test_processes_lease_different_worker_ids(sessions):
+    first, second = WorkerLease(sessions), WorkerLease(sessions)
+    assert first.acquire() == 0
+    assert second.acquire() == 1
+    first.release()
+    assert WorkerLease(sessions).acquire() == 0
+
+def test_expired_lease_is_taken_over(sessions):
+    stale = WorkerLease(sessions, ttl=-1)
+    assert stale.acquire() == 0
+    assert WorkerLease(sessions).acquire() == 0
+    assert stale.renew() is False
+
+def test_live_lease_is_renewed(sessions):
+    lease = WorkerLease(sessions)
+    lease.acquire()
+    assert lease.renew() is True
+
+def test_no_free_worker_id_fails_loudly(sessions):
+    with sessions() as session:
+        session.execute(insert(AIWorkerLease), [
+            {"worker_id": worker_id, "holder": "other", "expires_at": 2 ** 40} for worker_id in range(MAX_WORKER_ID + 1)
+        ])
+        session.commit()
+    with pytest.raises(WorkerLeaseError):
+        WorkerLease(sessions).acquire()
+
+def test_sink_leases_its_worker_id(sessions, tmp_path):
+    sink = AuditSink(session_factory=sessions, spill_path=str(tmp_path / "spill.ndjson"))
+    assert sink.worker_id is None
+    sink.start()
+    try:
+        assert sink.worker_id == 0
+        assert (sink._ids.next_id() >> SEQUENCE_BITS) & MAX_WORKER_ID == 0
+        assert WorkerLease(sessions).acquire() == 1
+    finally:
+        sink.stop()
+    assert sink.worker_id is None
+    # Released on stop
+    assert WorkerLease(sessions).acquire() == 0
+
+def test_sink_with_a_fixed_worker_id_does_not_lease(sessions, tmp_path):
+    sink = AuditSink(session_factory=sessions, spill_path=str(tmp_path / "spill.ndjson"), worker_id=7)
+    sink.start()
+    try:
+        assert sink.worker_id == 7
+        assert WorkerLease(sessions).acquire() == 0
+    finally:
+        sink.stop()
+
+def test_sink_leases_a_new_worker_id_when_its_lease_is_lost(sessions, tmp_path):
+    sink = AuditSink(session_factory=sessions, spill_path=str(tmp_path / "spill.ndjson"))
+    sink.start()
+    try:
+        with sessions() as session:
+            session.query(AIWorkerLease).update({"holder": "other"})
+            session.commit()
+        sink._renew_lease()
+        assert sink.worker_id == 1
+    finally:
+        sink.stop()